@@ -0,0 +1,150 @@
+""" build.py の signature と builder hash のキャッシュのベンチマーク.
+
+N 個の build.py (それぞれ 120 行) を一時ディレクトリに作り, ライブラリ i が i + 1 .. i + 3 に依存するグラフの
+builder を作って全ての hash を計算する (何もビルドしない build の loadBuilders と同じ処理).
+
+legacy: 以前の updateHash. 毎回 build.py を読み, 空行とコメントを除いて sha256 する.
+cold: hashcache.json が無い状態 (初回の configure).
+disk: hashcache.json はあるが, プロセス内の記録は無い状態 (configure の後の build, build のワーカー).
+memory: 同じプロセスで 2 回目.
+
+    python benchmarks/hashcache.py [--sizes 100 1000 4000]
+"""
+import os
+import sys
+import json
+import time
+import types
+import hashlib
+import argparse
+import tempfile
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from distbuilder import BuilderBase, Dependency, GlobalOptions, Option, Preference, Version  # noqa: E402
+from distbuilder import hashcache  # noqa: E402
+
+
+def _writeScripts(root: str, size: int):
+    paths = list()
+    for i in range(size):
+        path = os.path.join(root, "libs", f"bench.lib{i:05d}", "build.py")
+        os.makedirs(os.path.dirname(path))
+        with open(path, mode="w", encoding="utf-8") as fp:
+            fp.write("from distbuilder import BuilderBase\n\n")
+            for n in range(120):
+                fp.write(f"    # comment {n}\n" if n % 4 == 0 else f"    value{n} = {i * n}  # lib {i}\n")
+        # 書いた直後のファイルは保存されないので, mtime を過去にする.
+        past = time.time() - 60
+        os.utime(path, (past, past))
+        paths.append(path)
+    return paths
+
+
+def _makeClasses(paths):
+    classes = list()
+    for i, path in enumerate(paths):
+        members = dict(versions=[Version(0, 1, 0, 0)], option_Shared=Option(bool, False, "Build shared"))
+        for j in range(i + 1, min(len(paths), i + 4)):
+            members[f"dep_{j}"] = Dependency(f"bench.lib{j:05d}")
+        module = types.ModuleType(f"bench.lib{i:05d}")
+        module.__file__ = path
+        cls = type("Builder", (BuilderBase,), members)
+        cls.__module__ = module
+        classes.append(cls)
+    return classes
+
+
+def _createBuilders(classes):
+    globalOpt = GlobalOptions()
+    depsConf = {cls.__module__.__name__: {"version": "0.1.0.0"} for cls in classes}
+    builders = dict()
+    for cls in reversed(classes):
+        builder = cls(depsConf, globalOpt)
+        for dep in builder.dependencies:
+            dep._builder = builders[dep.libraryName]
+        builders[builder.libraryName] = builder
+    return builders
+
+
+def _legacyHash(builder, hashes):
+    """ 以前の updateHash. """
+    script = ""
+    with open(builder._builderScriptPath, mode="r", encoding="utf-8") as fp:
+        scriptLines = fp.readlines()
+    for ln in scriptLines:
+        lnn = ln.strip()
+        if lnn == "" or lnn.startswith("#"):
+            continue
+        script += ln.rstrip() + "\n"
+    script = hashlib.sha256(script.encode()).hexdigest()
+    jobj = OrderedDict(libraryName=builder.libraryName, scriptSignature=script, version=str(builder.version),
+                       options=[OrderedDict(key=o.key, value=str(o)) for o in builder.options],
+                       deps=[OrderedDict(libraryName=d.libraryName, hash=hashes[d.libraryName])
+                             for d in builder.dependencies])
+    hashData = json.dumps(jobj, indent=2, ensure_ascii=False)
+    return hashlib.md5(hashData.encode()).hexdigest()
+
+
+def _measure(func):
+    reads = [0]
+    compute = hashcache._computeScriptSignature
+
+    def _counting(path):
+        reads[0] += 1
+        return compute(path)
+
+    hashcache._computeScriptSignature = _counting
+    try:
+        startTime = time.perf_counter()
+        result = func()
+        return time.perf_counter() - startTime, reads[0], result
+    finally:
+        hashcache._computeScriptSignature = compute
+
+
+def _hashAll(classes):
+    builders = _createBuilders(classes)
+    for builder in builders.values():
+        builder.updateHash()
+    hashcache.flush()
+    return {name: builder.hash for name, builder in builders.items()}
+
+
+def _legacyAll(classes):
+    builders = _createBuilders(classes)
+    hashes = dict()
+    for name, builder in builders.items():
+        hashes[name] = _legacyHash(builder, hashes)
+    return hashes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 4000])
+    args = parser.parse_args()
+
+    print(f"{'libs':>6} {'state':>7} {'time (s)':>9} {'script reads':>13}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as root:
+            Preference._instance = Preference({"directory": {"build": os.path.join(root, "build"),
+                                                             "install": os.path.join(root, "install"),
+                                                             "sources": []}})
+            classes = _makeClasses(_writeScripts(root, size))
+            elapsed, reads, expected = _measure(lambda: _legacyAll(classes))
+            print(f"{size:>6} {'legacy':>7} {elapsed:>9.3f} {size:>13}")
+
+            hashcache._cache = None
+            hashcache._builderHashes.clear()
+            for state in ("cold", "disk", "memory"):
+                if state == "disk":
+                    hashcache._cache = None
+                    hashcache._builderHashes.clear()
+                elapsed, reads, hashes = _measure(lambda: _hashAll(classes))
+                assert hashes == expected
+                print(f"{size:>6} {state:>7} {elapsed:>9.3f} {reads:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+""" VersionSolver のベンチマーク.
+
+backjump: root は a, c000 .. c<N-1>, z に依存する. c は 2 version ずつあり, どれも制約に関係しない.
+    a の新しい version は z の古い version を, root は z の新しい version を要求するので, a は古い version にするしかない.
+    a, c..., z の順に選ぶので, 単純な後戻りでは c の組み合わせ (2^N 通り) を全て試してから a を選び直す.
+unsat: 満たせない制約. 解決できないことと, その説明を表示する.
+
+    python benchmarks/solver.py [--sizes 4 8 12 16 20 200 2000] [--chronologicalTimeout 10]
+"""
+import os
+import sys
+import time
+import types
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from distbuilder import (BuildError, BuilderBase, Dependency, GlobalOptions, Incompatibility,  # noqa: E402
+                         Version, VersionSolver)
+
+
+def _makeBuilder(name: str, versions, **members):
+    module = types.ModuleType(name)
+    module.__file__ = __file__
+    cls = type("Builder", (BuilderBase,), dict(versions=[Version(0, 1, v, 0) for v in versions], **members))
+    cls.__module__ = module
+    return cls
+
+
+def _backjumpGraph(size: int):
+    classes = dict()
+    rootDeps = {f"dep_c{i:05d}": Dependency(f"bench.c{i:05d}") for i in range(size)}
+    classes["bench.root"] = _makeBuilder("bench.root", [0],
+                                         dep_a=Dependency("bench.a"),
+                                         dep_z=Dependency("bench.z", versionMinor="1"),
+                                         **rootDeps)
+    classes["bench.a"] = _makeBuilder("bench.a", [1, 2],
+                                      dep_zNew=Dependency("bench.z", condition=lambda s: s.version.minor == 2,
+                                                          versionMinor="0"),
+                                      dep_zOld=Dependency("bench.z", condition=lambda s: s.version.minor == 1,
+                                                          versionMinor="0-1"))
+    for i in range(size):
+        classes[f"bench.c{i:05d}"] = _makeBuilder(f"bench.c{i:05d}", [0, 1])
+    classes["bench.z"] = _makeBuilder("bench.z", [0, 1])
+    return classes
+
+
+def _unsatGraph():
+    classes = dict()
+    classes["bench.root"] = _makeBuilder("bench.root", [0],
+                                         dep_x=Dependency("bench.x", versionMinor="0-1"),
+                                         dep_y=Dependency("bench.y"))
+    classes["bench.y"] = _makeBuilder("bench.y", [3, 4],
+                                      dep_x=Dependency("bench.x", versionMinor="2-3"))
+    classes["bench.x"] = _makeBuilder("bench.x", [0, 1, 2, 3])
+    return classes
+
+
+class _ChronologicalSolver(VersionSolver):
+    """ 比較用. 原因を調べずに, 直前の選択から順に選び直す. """
+
+    def _learn(self, incompatibility: Incompatibility) -> int:
+        terms = dict(self._decisions) if incompatibility.terms else dict()
+        return super()._learn(Incompatibility(terms, incompatibility.cause))
+
+
+def _solve(solverCls, classes):
+    globalOpt = GlobalOptions()
+    solver = solverCls(lambda name: classes[name]({}, globalOpt), maxIterations=10 ** 9)
+    solver.addRoot("bench.root")
+    startTime = time.perf_counter()
+    solver.solve()
+    elapsed = time.perf_counter() - startTime
+    assert solver.nodes["bench.a"].builder.version.minor == 1
+    return elapsed, len(solver.learned)
+
+
+def _chronologicalWorker(size: int, queue):
+    queue.put(_solve(_ChronologicalSolver, _backjumpGraph(size)))
+
+
+def _measureChronological(size: int, timeout: float):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_chronologicalWorker, args=(size, queue))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        return None
+    return queue.get()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 8, 12, 16, 20, 200, 2000])
+    parser.add_argument("--chronologicalTimeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"{'c libs':>7} {'solver (s)':>11} {'learned':>8} {'chronological (s)':>18} {'learned':>8}")
+    gaveUp = False
+    for size in args.sizes:
+        elapsed, learned = _solve(VersionSolver, _backjumpGraph(size))
+        chronological, chronologicalLearned = "skipped", ""
+        if not gaveUp:
+            measured = _measureChronological(size, args.chronologicalTimeout)
+            if measured is None:
+                chronological = f"> {args.chronologicalTimeout:.0f}"
+                gaveUp = True
+            else:
+                chronological, chronologicalLearned = f"{measured[0]:.3f}", measured[1]
+        print(f"{size:>7} {elapsed:>11.3f} {learned:>8} {chronological:>18} {chronologicalLearned:>8}")
+
+    print()
+    classes = _unsatGraph()
+    globalOpt = GlobalOptions()
+    solver = VersionSolver(lambda name: classes[name]({}, globalOpt))
+    solver.addRoot("bench.root")
+    try:
+        solver.solve()
+    except BuildError as e:
+        print(e)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+""" VersionSpec のベンチマーク.
+
+match: roah-lib の versions (22 個) をいくつかの範囲で絞り込む.
+    以前の Version.match (毎回文字列を split して int にする), VersionSpec.contains, VersionSpec.filter を比べる.
+solve: 48 個の version を持つライブラリ N 個の依存グラフを VersionSolver で解く.
+    ライブラリ i は i + 1 .. i + 3 に minor の範囲付きで依存する. a の新しい version は満たせない範囲を要求するので,
+    選び直しも起こる. 以前と同じく, 依存と version の組ごとに文字列から判定する solver と比べる.
+
+    python benchmarks/version.py [--repeat 2000] [--sizes 50 200 800]
+"""
+import os
+import sys
+import time
+import types
+import random
+import argparse
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from distbuilder import BuilderBase, Dependency, GlobalOptions, Version, VersionSolver, VersionSpec  # noqa: E402
+
+
+_RANGES = [
+    ("*", "*", "*", "*"),
+    ("*", "1", "5-9", "*"),
+    ("*", "*", "0, 3, 8-10", "1-2"),
+    ("0", "1", "10", "*"),
+    ("*", "*", "11-20", "*"),
+]
+
+
+def _legacyCheck(ver, val):
+    """ 以前の Version.match の判定. """
+    if isinstance(val, int):
+        return ver == val
+    if val == "*":
+        return True
+    vals = [[int(vv) for vv in v.strip().split("-", 1)] for v in val.split(",")]
+    for v in vals:
+        if len(v) == 1 and v[0] == ver:
+            return True
+        elif len(v) == 2 and v[0] <= ver and ver <= v[1]:
+            return True
+    return False
+
+
+def _legacyMatch(version: Version, variant, major, minor, patch) -> bool:
+    return _legacyCheck(version.variant, variant) and _legacyCheck(version.major, major) \
+        and _legacyCheck(version.minor, minor) and _legacyCheck(version.patch, patch)
+
+
+def _roahVersions():
+    path = os.path.join(os.path.dirname(__file__), "..", "libs", "WhiteAtelier.roah-lib", "build.py")
+    spec = importlib.util.spec_from_file_location("WhiteAtelier.roah-lib", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return sorted(module.Builder.versions)
+
+
+def _measureMatch(repeat: int):
+    versions = _roahVersions()
+    specs = [VersionSpec.parse(*r) for r in _RANGES]
+    for r, spec in zip(_RANGES, specs):
+        assert spec.filter(versions) == [v for v in versions if _legacyMatch(v, *r)]
+
+    print(f"match: {len(versions)} versions x {len(_RANGES)} ranges x {repeat}")
+    results = list()
+    startTime = time.perf_counter()
+    for _ in range(repeat):
+        for r in _RANGES:
+            [v for v in versions if _legacyMatch(v, *r)]
+    results.append(("legacy match", time.perf_counter() - startTime))
+    startTime = time.perf_counter()
+    for _ in range(repeat):
+        for spec in specs:
+            [v for v in versions if spec.contains(v)]
+    results.append(("spec.contains", time.perf_counter() - startTime))
+    startTime = time.perf_counter()
+    for _ in range(repeat):
+        for spec in specs:
+            spec.filter(versions)
+    results.append(("spec.filter", time.perf_counter() - startTime))
+
+    calls = repeat * len(_RANGES)
+    print(f"{'method':>14} {'total (s)':>10} {'us/filter':>10}")
+    for name, elapsed in results:
+        print(f"{name:>14} {elapsed:>10.3f} {elapsed / calls * 1e6:>10.2f}")
+
+
+def _makeGraph(size: int, seed: int = 0):
+    rng = random.Random(seed)
+    versions = [Version(0, 1, minor, patch) for minor in range(16) for patch in range(3)]
+    classes = dict()
+    for i in range(size):
+        name = f"bench.lib{i:04d}"
+        members = dict()
+        for j in range(i + 1, min(size, i + 4)):
+            low = rng.randint(0, 10)
+            members[f"dep_{j}"] = Dependency(f"bench.lib{j:04d}", versionMinor=f"{low}-{low + 5}, 15",
+                                             versionPatch="0-1" if rng.random() < 0.3 else "*")
+        if i == 0 and size > 2:
+            # 新しい lib0 は lib2 の存在しない version を要求する.
+            members["dep_new"] = Dependency("bench.lib0002", versionMinor="20",
+                                            condition=lambda s: s.version.patch == 2)
+        module = types.ModuleType(name)
+        module.__file__ = __file__
+        cls = type("Builder", (BuilderBase,), dict(versions=versions, **members))
+        cls.__module__ = module
+        classes[name] = cls
+    return classes
+
+
+class _LegacySolver(VersionSolver):
+    """ 比較用. 依存と version の組ごとに, 範囲の文字列から判定する. """
+
+    def _allowedVersions(self, dep: Dependency, node):
+        ranges = dep.versionRange.split(".")
+        return {v for v in node.availableVersions if _legacyMatch(v, *ranges)}
+
+
+def _solve(solverCls, classes):
+    globalOpt = GlobalOptions()
+    solver = solverCls(lambda name: classes[name]({}, globalOpt), maxIterations=10 ** 9)
+    solver.addRoot("bench.lib0000")
+    startTime = time.perf_counter()
+    solver.solve()
+    elapsed = time.perf_counter() - startTime
+    return elapsed, {name: node.builder.version for name, node in solver.nodes.items() if node.used}
+
+
+def _measureSolve(sizes):
+    print(f"{'libs':>6} {'solver (s)':>11} {'legacy (s)':>11}")
+    for size in sizes:
+        classes = _makeGraph(size)
+        elapsed, versions = _solve(VersionSolver, classes)
+        legacyElapsed, legacyVersions = _solve(_LegacySolver, classes)
+        assert versions == legacyVersions
+        print(f"{size:>6} {elapsed:>11.3f} {legacyElapsed:>11.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 800])
+    args = parser.parse_args()
+    _measureMatch(args.repeat)
+    print()
+    _measureSolve(args.sizes)
+
+
+if __name__ == "__main__":
+    main()
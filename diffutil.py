@@ -1,62 +1,204 @@
 import glob
+import io
 import os
+import codecs
 import difflib
+import hashlib
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 
 
+# バイナリ判定に読む先頭の大きさ
+_BINARY_CHECK_SIZE = 8192
+
+
 def file_mtime(path):
     t = datetime.fromtimestamp(os.stat(path).st_mtime,
                                timezone.utc)
     return t.astimezone().isoformat()
 
 
+def _isBinaryData(head: bytes) -> bool:
+    """ NUL を含むか utf-8 として読めないものをバイナリとみなす. """
+    if b"\0" in head:
+        return True
+    try:
+        # 途中で切れたマルチバイト文字はエラーにしない.
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def _isBinary(path: str) -> bool:
+    """ 先頭だけを読んでバイナリか判定する. """
+    with open(path, mode="rb") as fp:
+        return _isBinaryData(fp.read(_BINARY_CHECK_SIZE))
+
+
+def _hash(path: str) -> str:
+    with open(path, mode="rb") as fp:
+        return hashlib.file_digest(fp, "sha256").hexdigest()
+
+
+def _isUnchanged(fromfile: str, tofile: str) -> bool:
+    """ 大きさと mtime が同じなら内容を読まずに同じとみなす. 大きさだけ同じなら hash で比べる. """
+    if not os.path.exists(fromfile):
+        return False
+    fromstat = os.stat(fromfile)
+    tostat = os.stat(tofile)
+    if fromstat.st_size != tostat.st_size:
+        return False
+    if fromstat.st_mtime_ns == tostat.st_mtime_ns:
+        return True
+    return _hash(fromfile) == _hash(tofile)
+
+
+def _readlines(path: str):
+    with open(path, mode="r", encoding="utf-8") as fp:
+        return fp.readlines()
+
+
+def _diff(file: str, fromfile: str, tofile: str, fromdata: bytes = None):
+    """ 1 ファイル分の差分. バイナリなら None.
+
+    元の内容は fromfile か, アーカイブから読んだ fromdata のどちらか. fromfile が存在しなければ新しいファイル.
+    """
+    isNew = fromdata is None and not os.path.exists(fromfile)
+    if _isBinary(tofile):
+        return None
+    try:
+        if fromdata is not None:
+            if _isBinaryData(fromdata[:_BINARY_CHECK_SIZE]):
+                return None
+            # open(mode="r") と同じく改行を \n にそろえる.
+            fromlines = io.TextIOWrapper(io.BytesIO(fromdata), encoding="utf-8").readlines()
+        elif isNew:
+            fromlines = list()
+        elif _isBinary(fromfile):
+            return None
+        else:
+            fromlines = _readlines(fromfile)
+        tolines = _readlines(tofile)
+    except UnicodeDecodeError:
+        return None
+    # 新しいファイルは /dev/null からの差分にする.
+    return list(difflib.unified_diff(fromlines, tolines, "/dev/null" if isNew else file, file, n=0))
+
+
+def _resolveArchive(args):
+    """ --library, --version から blob store のアーカイブとパッチの出力先 (libs/<lib>/v<version>) を決める. """
+    from distbuilder import BuildError, Preference, searchBuilderAndPath
+    from distbuilder.blob import blobPath
+
+    preferencePath = args.preference
+    if preferencePath is None:
+        preferencePath = os.path.join(os.path.dirname(__file__), "preference.toml")
+    Preference.load(preferencePath)
+
+    builderCls, builderPath = searchBuilderAndPath(args.library)
+    version = builderCls.generateVersion(args.version)
+    source = builderCls.getSource(version)
+    if source is None:
+        raise BuildError(f"No source archive for {args.library} {version}.")
+    archivePath = blobPath(*source)
+    if not os.path.exists(archivePath):
+        raise BuildError(f"Archive is not downloaded. Build {args.library} once. {archivePath}")
+
+    # applyPatches(f"v{versionStr}", srcPath) の versionStr. getVersionName が無いライブラリは str(version).
+    versionName = builderCls.getVersionName(version) if hasattr(builderCls, "getVersionName") else str(version)
+    return archivePath, os.path.join(os.path.dirname(builderPath), f"v{versionName}")
+
+
+def _listFiles(root: str):
+    files = list()
+    for file in glob.glob(f"{root}/**", recursive=True):
+        if os.path.isfile(file):
+            files.append(os.path.relpath(file, root).replace("\\", "/"))
+    return files
+
+
 def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--root", type=str, required=True)
     parser.add_argument("--rootSrc", type=str, default=None,
                         help="Default is <--root>.src directory")
-    parser.add_argument("--output", type=str, default="./patchs")
+    parser.add_argument("--archive", type=str, default=None,
+                        help="Diff against the archive instead of --rootSrc.")
+    parser.add_argument("--library", type=str, default=None,
+                        help="Diff against the archive of the library in the blob store. Requires --version.")
+    parser.add_argument("--version", type=str, default=None)
+    parser.add_argument("--preference", type=str, default=None, help="Path to preference file.")
+    parser.add_argument("--prefix", type=str, default=None,
+                        help="Directory in the archive which --root was extracted from. "
+                             "Default is the top directory of the archive.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Default is ./patchs, or libs/<library>/v<version> with --library.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="Number of processes to diff files.")
     parser.add_argument("file", type=str, nargs="*", default=list())
     args = parser.parse_args()
 
     if args.rootSrc is None:
         args.rootSrc = f"{args.root}.src"
 
+    if args.library is not None:
+        if args.version is None:
+            parser.error("--library requires --version.")
+        args.archive, output = _resolveArchive(args)
+        if args.output is None:
+            args.output = output
+    if args.output is None:
+        args.output = "./patchs"
+
     # tofile = args.file
     # fromfile = "{0}.src{1}".format(*os.path.splitext(tofile))
     # output = args.output if args.output is not None else f"{os.path.basename(tofile)}.patch"
 
+    listed = bool(args.file)
     if not args.file:
         # 全てのファイルを対象に.
-        files = glob.glob(f"{args.root}/**", recursive=True)
-        for file in files:
-            if os.path.isfile(file):
-                args.file.append(os.path.relpath(file, args.root).replace("\\", "/"))
+        args.file = _listFiles(args.root)
 
     os.makedirs(args.output, exist_ok=True)
 
-    for file in args.file:
-        print(f"-- {file}")
-        fromfile = os.path.join(args.rootSrc, file)
-        tofile = os.path.join(args.root, file)
-        try:
-            with open(fromfile, mode="r", encoding="utf-8") as ff:
-                fromlines = ff.readlines()
-            with open(tofile, mode="r", encoding="utf-8") as tf:
-                tolines = tf.readlines()
-
-            diff = difflib.unified_diff(fromlines, tolines, file, file, n=0)
-            diff = [f for f in diff]
-            if diff:
+    if args.archive is not None:
+        # アーカイブのうち, 大きさと CRC32 (tar は mtime) がディスク上のファイルと違うメンバーだけを読む.
+        from distbuilder.archive import changedMembers
+        changes = changedMembers(args.archive, args.root, prefix=args.prefix)
+        fromdata = {file: changes.original.get(file) for file in args.file}
+        changed = [file for file in args.file if fromdata[file] is not None or file not in changes.names]
+        print(f"{len(changed)} / {len(args.file)} files changed. "
+              f"({len(changes.original)} archive members read, prefix = '{changes.prefix}')")
+        missing = sorted(changes.names - set(args.file))
+        if missing and not listed:
+            print(f"{len(missing)} files in the archive are not in --root. skip. (e.g. {missing[0]})")
+        # アーカイブに無いファイルは新しいファイル.
+        fromfiles = [""] * len(changed)
+        fromdata = [fromdata[file] for file in changed]
+    else:
+        # 大きさ, mtime, hash で変更の無いファイルを除いてから diff する.
+        changed = [file for file in args.file
+                   if not _isUnchanged(os.path.join(args.rootSrc, file), os.path.join(args.root, file))]
+        print(f"{len(changed)} / {len(args.file)} files changed.")
+        fromfiles = [os.path.join(args.rootSrc, file) for file in changed]
+        fromdata = [None] * len(changed)
+
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        tofiles = [os.path.join(args.root, file) for file in changed]
+        diffs = executor.map(_diff, changed, fromfiles, tofiles, fromdata, chunksize=16)
+        for file, diff in zip(changed, diffs):
+            print(f"-- {file}")
+            if diff is None:
+                print("Binary file. skip.")
+            elif diff:
                 outputfile = os.path.join(args.output, f"{file}.patch")
                 print("DIFF!", outputfile)
                 os.makedirs(os.path.dirname(outputfile), exist_ok=True)
                 with open(outputfile, mode="w", encoding="utf-8") as fp:
                     fp.writelines(diff)
-        except UnicodeDecodeError:
-            print("Binary file. skip.")
 
 
 if __name__ == '__main__':
@@ -4,8 +4,12 @@ from .global_options import GlobalOptions
 from .option import Option
 from .dependency import Dependency
 from .preference import Preference
+from .resolver import DependencyNode, DependencyResolver
+from .solver import CacheAwareSolver, Incompatibility, VersionSolver
+from .artifacts import ArtifactIndex, BuildTimes, estimateBuildCost
+from .scheduler import BuildScheduler
 from .toolchain import Toolchain
-from .version import Version
+from .version import IntervalSet, Version, VersionSpec
 from .functions import (
     searchBuilderAndPath
 )
@@ -0,0 +1,537 @@
+import os
+import re
+import json
+import time
+import hashlib
+import shutil
+import tarfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from .errors import BuildError
+
+
+_CHUNK_SIZE = 1024 * 1024
+# 1 タスクで展開するメンバー数. 小さいファイルが大量にある場合に future の生成コストを抑える.
+_BATCH_SIZE = 64
+
+
+class MemberFilter:
+    """ アーカイブのメンバー名 (/ 区切り) に対する include / exclude の glob.
+
+    * は / を跨がず, ** は任意の階層にマッチする. 例: "*/lib/**", "**/tests/**"
+    include が None の場合は全て, exclude にマッチしたものは除く.
+    """
+
+    def __init__(self, include: Optional[Iterable[str]] = None, exclude: Optional[Iterable[str]] = None):
+        self._include = list(include) if include is not None else None
+        self._exclude = list(exclude) if exclude is not None else list()
+        self._includeRe = [self._compile(p) for p in self._include] if self._include is not None else None
+        self._excludeRe = [self._compile(p) for p in self._exclude]
+
+    @staticmethod
+    def _compile(pattern: str) -> "re.Pattern":
+        regex = ""
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+            elif pattern.startswith("**", i):
+                regex += ".*"
+                i += 2
+            elif pattern[i] == "*":
+                regex += "[^/]*"
+                i += 1
+            elif pattern[i] == "?":
+                regex += "[^/]"
+                i += 1
+            else:
+                regex += re.escape(pattern[i])
+                i += 1
+        return re.compile(regex)
+
+    def __call__(self, name: str) -> bool:
+        name = name.rstrip("/")
+        if self._includeRe is not None and not any(r.fullmatch(name) for r in self._includeRe):
+            return False
+        return not any(r.fullmatch(name) for r in self._excludeRe)
+
+    @property
+    def digest(self) -> str:
+        """ ソースキャッシュの区別に使う. """
+        data = json.dumps([self._include, self._exclude]).encode("utf-8")
+        return hashlib.sha256(data).hexdigest()[:16]
+
+
+class ExtractResult:
+    """ 展開の結果. ファイル数, 展開後の byte 数, 経過時間, フィルタで除いたファイル数と byte 数. """
+
+    def __init__(self, files: int, size: int, elapsed: float, skippedFiles: int = 0, skippedSize: int = 0):
+        self.files = files
+        self.size = size
+        self.elapsed = elapsed
+        self.skippedFiles = skippedFiles
+        self.skippedSize = skippedSize
+
+    @property
+    def throughput(self) -> float:
+        return self.size / max(self.elapsed, 1e-6)
+
+    def __str__(self) -> str:
+        mb = 1024 * 1024
+        return f"{self.files} files, {self.size / mb:.1f}MB in {self.elapsed:.2f} sec. ({self.throughput / mb:.1f}MB/s)"
+
+    def logSkipped(self, log: Callable[[str], None]):
+        if self.skippedFiles > 0:
+            mb = 1024 * 1024
+            # 展開していれば同じ throughput でかかったであろう時間
+            saved = self.skippedSize / self.throughput if self.size > 0 else 0.0
+            log(f"Skipped {self.skippedFiles} files, {self.skippedSize / mb:.1f}MB by filter. "
+                f"(about {saved:.2f} sec saved)")
+
+
+def _targetPath(destination: str, name: str) -> Optional[str]:
+    # 絶対パス (ドライブレター, \ 始まりを含む) や, 要素に .. を含むものは destination の外に出るので展開しない.
+    # README..md のように名前に .. を含むだけのものは展開する.
+    if name.startswith(("/", "\\")) or re.match(r"[A-Za-z]:", name) is not None \
+            or ".." in name.replace("\\", "/").split("/"):
+        return None
+    return os.path.join(destination, *name.split("/"))
+
+
+def _extractMembers(archive: zipfile.ZipFile, members: List[Tuple[zipfile.ZipInfo, str]]) -> int:
+    size = 0
+    for info, targetPath in members:
+        # ZipFile はファイルの読み出しをロックで保護しているので, 複数スレッドから open できる.
+        # 展開 (zlib) は GIL を解放するため並列に進む.
+        with archive.open(info, mode="r") as source, open(targetPath, mode="wb") as target:
+            shutil.copyfileobj(source, target, _CHUNK_SIZE)
+        size += info.file_size
+    return size
+
+
+def _collectMembers(archive: zipfile.ZipFile, destination: str, memberFilter: Optional[MemberFilter]):
+    """ 展開するディレクトリ, ファイルと, フィルタで除いたファイル数, byte 数を返す. """
+    directories = set()
+    files: List[Tuple[zipfile.ZipInfo, str]] = list()
+    skippedFiles, skippedSize = 0, 0
+    for info in archive.infolist():
+        targetPath = _targetPath(destination, info.filename)
+        if targetPath is None:
+            continue
+        if memberFilter is not None and not memberFilter(info.filename):
+            if not info.is_dir():
+                skippedFiles += 1
+                skippedSize += info.file_size
+            continue
+        if info.is_dir():
+            directories.add(targetPath)
+        else:
+            directories.add(os.path.dirname(targetPath))
+            files.append((info, targetPath))
+    return directories, files, skippedFiles, skippedSize
+
+
+def extractZip(zipPath: str, destination: str, *, jobs: int = 1,
+               memberFilter: Optional[MemberFilter] = None) -> ExtractResult:
+    """ zip を destination に展開する.
+
+    central directory は一度だけ読み, ディレクトリを先に全て作ってから,
+    ファイルを jobs 個のスレッドで並列に展開する. memberFilter で除いたものは展開しない.
+    """
+    startTime = time.perf_counter()
+    with zipfile.ZipFile(zipPath, mode="r") as archive:
+        directories, files, skippedFiles, skippedSize = _collectMembers(archive, destination, memberFilter)
+
+        # 親から順に作れば makedirs の中で何度も stat しなくて済む.
+        for dirpath in sorted(directories):
+            os.makedirs(dirpath, exist_ok=True)
+
+        if jobs <= 1 or len(files) <= 1:
+            size = _extractMembers(archive, files)
+        else:
+            # 大きいものから投入して, 最後に 1 つだけ大きいファイルが残るのを避ける.
+            files.sort(key=lambda f: f[0].compress_size, reverse=True)
+            batches = [files[i:i + _BATCH_SIZE] for i in range(0, len(files), _BATCH_SIZE)]
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                size = sum(executor.map(lambda batch: _extractMembers(archive, batch), batches))
+
+    return ExtractResult(len(files), size, time.perf_counter() - startTime, skippedFiles, skippedSize)
+
+
+def _crc32(path: str) -> int:
+    crc = 0
+    with open(path, mode="rb") as fp:
+        while True:
+            chunk = fp.read(_CHUNK_SIZE)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def _isUnchanged(info: zipfile.ZipInfo, targetPath: str) -> bool:
+    try:
+        if os.path.getsize(targetPath) != info.file_size:
+            return False
+    except OSError:
+        return False
+    return _crc32(targetPath) == info.CRC
+
+
+def syncZip(zipPath: str, destination: str, *, jobs: int = 1, memberFilter: Optional[MemberFilter] = None,
+            log: Callable[[str], None] = print) -> ExtractResult:
+    """ 既存の destination を zip の内容に合わせる.
+
+    大きさと CRC32 が一致するファイルには触れない (mtime が変わらないので, 再ビルドの対象にならない).
+    異なるファイルだけを書き直し, zip に含まれない (memberFilter で除いたものを含む) ファイルは削除する.
+    """
+    startTime = time.perf_counter()
+    with zipfile.ZipFile(zipPath, mode="r") as archive:
+        directories, files, skippedFiles, skippedSize = _collectMembers(archive, destination, memberFilter)
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            unchanged = list(executor.map(lambda f: _isUnchanged(*f), files))
+        changed = [f for f, same in zip(files, unchanged) if not same]
+
+        # zip に無いファイル, ディレクトリを消す.
+        expected = {os.path.normcase(os.path.normpath(p)) for _, p in files}
+        expectedDirs = {os.path.normcase(os.path.normpath(p)) for p in directories}
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(destination, topdown=False):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.normcase(os.path.normpath(path)) not in expected:
+                    os.remove(path)
+                    removed += 1
+            for dirname in dirnames:
+                path = os.path.join(dirpath, dirname)
+                if os.path.normcase(os.path.normpath(path)) not in expectedDirs and not os.listdir(path):
+                    os.rmdir(path)
+
+        for dirpath in sorted(directories):
+            os.makedirs(dirpath, exist_ok=True)
+        for _, targetPath in changed:
+            # hardlink で共有されている場合があるので, 上書きせずに作り直す.
+            if os.path.exists(targetPath):
+                os.remove(targetPath)
+        if jobs <= 1 or len(changed) <= 1:
+            size = _extractMembers(archive, changed)
+        else:
+            batches = [changed[i:i + _BATCH_SIZE] for i in range(0, len(changed), _BATCH_SIZE)]
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                size = sum(executor.map(lambda batch: _extractMembers(archive, batch), batches))
+
+    result = ExtractResult(len(changed), size, time.perf_counter() - startTime, skippedFiles, skippedSize)
+    log(f"Synchronized {len(files) - len(changed)} unchanged, {len(changed)} rewritten, {removed} removed. "
+        f"({result})")
+    return result
+
+
+_TAR_EXTS = ((".tar.gz", "gz"), (".tgz", "gz"), (".tar.xz", "xz"), (".txz", "xz"),
+             (".tar.bz2", "bz2"), (".tar.zst", "zst"), (".tzst", "zst"), (".tar", ""))
+_MAGICS = ((b"\x1f\x8b", "gz"), (b"\xfd7zXZ\x00", "xz"), (b"BZh", "bz2"), (b"\x28\xb5\x2f\xfd", "zst"))
+
+
+def tarCompression(name: str) -> Optional[str]:
+    """ ファイル名 (url) から tar の圧縮形式 ("gz", "xz", "bz2", "zst", 無圧縮は "") を返す. tar でなければ None. """
+    name = name.lower()
+    for ext, compression in _TAR_EXTS:
+        if name.endswith(ext):
+            return compression
+    return None
+
+
+def archiveExt(name: str) -> str:
+    """ .tar.gz のような二重拡張子を含めた拡張子を返す. """
+    lower = name.lower()
+    for ext, _ in _TAR_EXTS:
+        if lower.endswith(ext):
+            return name[-len(ext):]
+    return os.path.splitext(name)[1]
+
+
+def _detectTarCompression(path: str) -> Optional[str]:
+    with open(path, mode="rb") as fp:
+        head = fp.read(8)
+    for magic, compression in _MAGICS:
+        if head.startswith(magic):
+            return compression
+    return "" if tarfile.is_tarfile(path) else None
+
+
+def _openTarStream(fileobj, compression: str) -> tarfile.TarFile:
+    if compression == "zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise BuildError("zstandard is required to extract .tar.zst. (pip install zstandard)")
+        fileobj = zstandard.ZstdDecompressor().stream_reader(fileobj)
+        compression = ""
+    return tarfile.open(fileobj=fileobj, mode=f"r|{compression}")
+
+
+def extractTar(fileobj, destination: str, *, compression: str = "",
+               memberFilter: Optional[MemberFilter] = None) -> ExtractResult:
+    """ tar を先頭から順に読みながら destination に展開する. fileobj は read だけできればよい (HTTP の応答など).
+
+    zst の展開には zstandard パッケージが必要.
+    """
+    startTime = time.perf_counter()
+    files, size, skippedFiles, skippedSize = 0, 0, 0, 0
+    with _openTarStream(fileobj, compression) as archive:
+        for member in archive:
+            if memberFilter is not None and not memberFilter(member.name):
+                if member.isfile():
+                    skippedFiles += 1
+                    skippedSize += member.size
+                continue
+            try:
+                # 絶対パス, .. や外を指すリンクは拒否する.
+                archive.extract(member, destination, filter="data")
+            except tarfile.FilterError as e:
+                raise BuildError(f"Unsafe archive member. {e}")
+            if member.isfile():
+                files += 1
+                size += member.size
+    return ExtractResult(files, size, time.perf_counter() - startTime, skippedFiles, skippedSize)
+
+
+def extractArchive(archivePath: str, destination: str, *, jobs: int = 1,
+                   memberFilter: Optional[MemberFilter] = None,
+                   log: Callable[[str], None] = print) -> ExtractResult:
+    """ アーカイブを destination に展開する.
+
+    zip は並列に, tar (gz, xz, bz2, zst) は先頭から順に展開する. それ以外は shutil.unpack_archive を使う.
+    """
+    if zipfile.is_zipfile(archivePath):
+        result = extractZip(archivePath, destination, jobs=jobs, memberFilter=memberFilter)
+        log(f"Extracted {result} (jobs = {jobs})")
+        return result
+
+    compression = _detectTarCompression(archivePath)
+    if compression is not None:
+        with open(archivePath, mode="rb") as fp:
+            result = extractTar(fp, destination, compression=compression, memberFilter=memberFilter)
+        log(f"Extracted {result} (tar{'.' + compression if compression else ''})")
+        return result
+
+    startTime = time.perf_counter()
+    shutil.unpack_archive(archivePath, destination)
+    files, size, skippedFiles, skippedSize = 0, 0, 0, 0
+    for dirpath, _, filenames in os.walk(destination):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            fileSize = os.path.getsize(path)
+            if memberFilter is not None and not memberFilter(os.path.relpath(path, destination).replace(os.sep, "/")):
+                # shutil では選んで展開できないので, 展開後に消す.
+                os.remove(path)
+                skippedFiles += 1
+                skippedSize += fileSize
+            else:
+                files += 1
+                size += fileSize
+    result = ExtractResult(files, size, time.perf_counter() - startTime, skippedFiles, skippedSize)
+    log(f"Extracted {result} (shutil)")
+    return result
+
+
+def _topDirectory(names: List[str]) -> str:
+    """ 全てのファイルが 1 つのディレクトリの下にあれば "<dir>/", そうでなければ "". """
+    tops = {name.split("/", 1)[0] for name in names}
+    if len(tops) == 1 and all("/" in name for name in names):
+        return f"{tops.pop()}/"
+    return ""
+
+
+class ArchiveChanges:
+    """ changedMembers の結果. パスは prefix を除いた / 区切りの相対パス. """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        # 展開したファイルと内容の異なるメンバーの, アーカイブ内の内容.
+        self.original: Dict[str, bytes] = dict()
+        # アーカイブに含まれる全てのファイル.
+        self.names: Set[str] = set()
+        # 大きさと CRC32 (tar は mtime) だけで同じと判断したファイル数.
+        self.unchanged = 0
+
+
+def changedMembers(archivePath: str, destination: str, *, prefix: Optional[str] = None) -> ArchiveChanges:
+    """ destination (アーカイブの prefix 以下を展開したディレクトリ) と内容の異なるメンバーを読む.
+
+    zip は大きさと CRC32 がディスク上のファイルと一致するメンバーを読まない.
+    tar は大きさと mtime (展開時に設定される秒単位の値) が一致するメンバーを読まない.
+    (tar は先頭から順に読むしかないので, 読み飛ばすだけ)
+    prefix が None なら, 全てのメンバーが 1 つのディレクトリの下にある場合にそのディレクトリを prefix にする.
+    """
+    if zipfile.is_zipfile(archivePath):
+        with zipfile.ZipFile(archivePath) as archive:
+            infos = [info for info in archive.infolist() if not info.is_dir()]
+            if prefix is None:
+                prefix = _topDirectory([info.filename for info in infos])
+            changes = ArchiveChanges(prefix)
+            for info in infos:
+                if not info.filename.startswith(prefix):
+                    continue
+                name = info.filename[len(prefix):]
+                targetPath = _targetPath(destination, name)
+                if targetPath is None:
+                    continue
+                changes.names.add(name)
+                if not os.path.exists(targetPath):
+                    continue
+                if _isUnchanged(info, targetPath):
+                    changes.unchanged += 1
+                else:
+                    changes.original[name] = archive.read(info)
+        return changes
+
+    compression = _detectTarCompression(archivePath)
+    if compression is None:
+        raise BuildError(f"Unsupported archive. {archivePath}")
+    with open(archivePath, mode="rb") as fp, _openTarStream(fp, compression) as archive:
+        changes = None
+        for member in archive:
+            if changes is None:
+                # 先頭のメンバーから prefix を決める. 違うディレクトリのメンバーが出てきたら, 指定してもらう.
+                top = member.name.split("/", 1)[0]
+                changes = ArchiveChanges(prefix if prefix is not None
+                                         else f"{top}/" if member.isdir() or "/" in member.name else "")
+            if not member.isfile():
+                continue
+            if not member.name.startswith(changes.prefix):
+                if prefix is None:
+                    raise BuildError(f"Archive has several top directories. Specify prefix. {archivePath}")
+                continue
+            name = member.name[len(changes.prefix):]
+            targetPath = _targetPath(destination, name)
+            if targetPath is None:
+                continue
+            changes.names.add(name)
+            if not os.path.exists(targetPath):
+                continue
+            # 展開したままのファイルは mtime が tar と同じ秒ちょうどになる. 編集すれば端数が付く.
+            stat = os.stat(targetPath)
+            if stat.st_size == member.size and stat.st_mtime_ns == int(member.mtime) * 1000000000:
+                changes.unchanged += 1
+                continue
+            data = archive.extractfile(member).read()
+            with open(targetPath, mode="rb") as target:
+                if target.read() == data:
+                    changes.unchanged += 1
+                    continue
+            changes.original[name] = data
+    return changes if changes is not None else ArchiveChanges(prefix or "")
+
+
+# Linux の FICLONE ioctl. 対応するファイルシステム (btrfs, xfs など) ではデータを共有したまま複製できる.
+_FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str):
+    import fcntl
+    with open(src, mode="rb") as s, open(dst, mode="wb") as d:
+        fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
+def breakLink(path: str):
+    """ hardlink されたファイルを独立したコピーに置き換える. 書き換える前に呼ぶ (copy-on-write). """
+    if os.path.isfile(path) and os.stat(path).st_nlink > 1:
+        tmpPath = f"{path}.{os.getpid()}.cow"
+        shutil.copy2(path, tmpPath)
+        os.replace(tmpPath, path)
+
+
+class SourceCache:
+    """ アーカイブの sha256 ごとに, 展開済みのソースツリーを 1 つだけ保持する.
+
+    ビルドの src は reflink もしくは hardlink でキャッシュから作るので, 展開は 1 度で済む.
+    hardlink の場合はファイルの実体を共有するため, 書き換える前に breakLink で切り離すこと.
+    キャッシュ側のファイルが書き換えられていた場合は manifest と一致しなくなるので, 展開し直す.
+    """
+
+    def __init__(self, root: str, mode: str = "auto"):
+        self._root = root
+        self._mode = mode
+
+    def _manifest(self, treePath: str) -> dict:
+        manifest = dict()
+        for dirpath, _, filenames in os.walk(treePath):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                st = os.stat(path)
+                manifest[os.path.relpath(path, treePath)] = [st.st_size, st.st_mtime_ns, st.st_mode]
+        return manifest
+
+    def _prepare(self, archivePath: str, signature: str, jobs: int, memberFilter: Optional[MemberFilter],
+                 log: Callable[[str], None]) -> str:
+        from .blob import _FileLock, _loadJson, _writeJson
+        # フィルタが異なれば展開される内容も異なるので, 別のツリーとして持つ.
+        name = signature if memberFilter is None else f"{signature}-{memberFilter.digest}"
+        treePath = os.path.join(self._root, signature[0:2], name)
+        manifestPath = f"{treePath}.json"
+        os.makedirs(os.path.dirname(treePath), exist_ok=True)
+
+        lock = _FileLock(f"{treePath}.lock")
+        lock.acquire()
+        try:
+            manifest = _loadJson(manifestPath)
+            if manifest is not None and os.path.isdir(treePath):
+                if self._manifest(treePath) == manifest:
+                    log(f"Pristine source tree is cached. {treePath}")
+                    return treePath
+                log("Pristine source tree was modified. Extracting again...")
+            if os.path.exists(manifestPath):
+                os.remove(manifestPath)
+            if os.path.exists(treePath):
+                shutil.rmtree(treePath)
+
+            tmpPath = f"{treePath}.{os.getpid()}.tmp"
+            if os.path.exists(tmpPath):
+                shutil.rmtree(tmpPath)
+            extractArchive(archivePath, tmpPath, jobs=jobs, memberFilter=memberFilter, log=log).logSkipped(log)
+            os.replace(tmpPath, treePath)
+            _writeJson(manifestPath, self._manifest(treePath))
+            return treePath
+        finally:
+            lock.release()
+
+    def materialize(self, archivePath: str, signature: str, destination: str, *,
+                    jobs: int = 1, memberFilter: Optional[MemberFilter] = None,
+                    log: Callable[[str], None] = print):
+        """ signature のアーカイブを展開したツリーを destination に作る. """
+        treePath = self._prepare(archivePath, signature.lower(), jobs, memberFilter, log)
+
+        startTime = time.perf_counter()
+        mode = self._mode
+        files = 0
+        for dirpath, _, filenames in os.walk(treePath):
+            target = os.path.join(destination, os.path.relpath(dirpath, treePath))
+            os.makedirs(target, exist_ok=True)
+            for filename in filenames:
+                src = os.path.join(dirpath, filename)
+                dst = os.path.join(target, filename)
+                if mode in ("auto", "reflink"):
+                    try:
+                        _reflink(src, dst)
+                        mode = "reflink"
+                    except (OSError, ImportError):
+                        if mode == "reflink":
+                            raise
+                        # 非対応. 以降は hardlink を試す.
+                        if os.path.exists(dst):
+                            os.remove(dst)
+                        mode = "hardlink"
+                if mode == "hardlink":
+                    try:
+                        os.link(src, dst)
+                    except OSError:
+                        # 別のファイルシステムなど. 以降はコピーする.
+                        mode = "copy"
+                if mode == "copy":
+                    shutil.copy2(src, dst)
+                files += 1
+        log(f"Materialized {files} files by {mode} in {time.perf_counter() - startTime:.2f} sec. ({treePath})")
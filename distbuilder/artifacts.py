@@ -0,0 +1,276 @@
+import os
+import re
+import json
+import shutil
+import threading
+from typing import Dict, List, Optional, Set
+from .builder import BuilderBase
+from .preference import Preference
+
+
+# 移動平均の重み
+_ALPHA = 0.3
+# 先頭のこの byte 数に NUL を含むファイルはバイナリとみなし, install root のパスを書き換えない.
+_BINARY_PROBE_SIZE = 8192
+# パスの途中に来ない文字. 成果物を参照するパスの前をここまで遡って, 元の install root を得る.
+_PATH_DELIMITERS = frozenset(b" \t\r\n\"'();<>=,*")
+_ABSOLUTE_PATH = re.compile(rb"(/|[A-Za-z]:[\\/])")
+
+
+def isInstalledDirectory(path: str) -> bool:
+    # info.json, toolchain.cmake が作られてしまうので 2以下
+    return os.path.isdir(path) and len(os.listdir(path)) > 2
+
+
+class Artifact:
+    """ ビルド済みの成果物 (<root>/<libraryName>/<hash>). info.json の内容を持つ. """
+
+    def __init__(self, directory: str, hash: str, info: dict, cached: bool):
+        self.directory = directory
+        self.hash = hash
+        self.libraryName: str = info["libraryName"]
+        self.version: str = info["version"]
+        # key -> str(option)
+        self.options: Dict[str, str] = {o["key"]: o["value"] for o in info["options"]}
+        # libraryName -> hash
+        self.deps: Dict[str, str] = {d["libraryName"]: d["hash"] for d in info.get("deps", ())}
+        # install root ではなく artifact cache にある.
+        self.cached = cached
+
+
+def _readArtifact(directory: str, hash: str, cached: bool) -> Optional[Artifact]:
+    if not isInstalledDirectory(directory):
+        return None
+    try:
+        with open(os.path.join(directory, "info.json"), mode="r", encoding="utf-8") as fp:
+            return Artifact(directory, hash, json.load(fp), cached)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+class ArtifactIndex:
+    """ install root と artifact cache にあるビルド済みの成果物の一覧.
+
+    artifact cache は install root と同じ構成 (<libraryName>/<hash>) のディレクトリで,
+    他のマシンや CI の install root を共有することを想定している. 同じ hash は install root を優先する.
+    artifact cache の成果物は restoreArtifact で install root のパスに書き換えてから使う.
+    """
+
+    def __init__(self, installRoot: str, cacheRoots: List[str]):
+        self._roots = [(installRoot, False)] + [(root, True) for root in cacheRoots]
+        self._libraries: Dict[str, Dict[str, Artifact]] = dict()
+
+    @classmethod
+    def fromPreference(cls) -> "ArtifactIndex":
+        pref = Preference.get()
+        return cls(pref.installRootDirectory, pref.artifactCacheDirectories)
+
+    @property
+    def hasCache(self) -> bool:
+        return len(self._roots) > 1
+
+    def artifacts(self, libraryName: str) -> Dict[str, Artifact]:
+        """ hash をキーにした libraryName の成果物. ディレクトリはライブラリごとに一度だけ読む. """
+        found = self._libraries.get(libraryName)
+        if found is not None:
+            return found
+        found = dict()
+        for root, cached in self._roots:
+            libraryDir = os.path.join(root, libraryName)
+            try:
+                hashes = sorted(os.listdir(libraryDir))
+            except OSError:
+                continue
+            for hash in hashes:
+                if hash in found:
+                    continue
+                artifact = _readArtifact(os.path.join(libraryDir, hash), hash, cached)
+                if artifact is not None:
+                    found[hash] = artifact
+        self._libraries[libraryName] = found
+        return found
+
+    def find(self, libraryName: str, hash: str) -> Optional[Artifact]:
+        return self.artifacts(libraryName).get(hash)
+
+
+def _markers(artifact: Artifact) -> List[bytes]:
+    # 成果物と依存先の <libraryName>/<hash>. install root 以下を指すパスはこれを含む.
+    names = [(artifact.libraryName, artifact.hash)] + list(artifact.deps.items())
+    return [f"{sep}{name}{sep}{hash}".encode() for name, hash in names for sep in ("/", "\\")]
+
+
+def _occurrences(data: bytes, markers: List[bytes]):
+    """ markers の出現位置と, その前のパスの開始位置. (start, end, marker) を返す. """
+    for marker in markers:
+        end = data.find(marker)
+        while end >= 0:
+            start = end
+            while start > 0 and data[start - 1] not in _PATH_DELIMITERS:
+                start -= 1
+            yield start, end, marker
+            end = data.find(marker, end + 1)
+
+
+def _relocate(directory: str, artifact: Artifact, installRoot: str) -> Optional[str]:
+    """ directory のテキストファイルで, 成果物と依存先を指すパスの install root を installRoot に書き換える.
+
+    cmake の config や pkg-config は install 先の絶対パスを含むことがあるので, そのままコピーすると
+    元の install root (他のマシンや artifact cache) を参照してしまう.
+    元の install root が分からないパスが残る場合はそのファイルのパスを返す. その場合は何も書き換えない.
+    """
+    markers = _markers(artifact)
+    files = dict()
+    # 絶対パスで書かれている元の install root. -L<path> のように前に何か付いているものは, ここから探す.
+    roots: Set[bytes] = set()
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if (filename == "info.json" and dirpath == directory) or os.path.islink(path):
+                continue
+            with open(path, mode="rb") as fp:
+                data = fp.read()
+            if b"\0" in data[:_BINARY_PROBE_SIZE] or not any(m in data for m in markers):
+                continue
+            files[path] = data
+            roots.update(data[start:end] for start, end, _ in _occurrences(data, markers)
+                         if _ABSOLUTE_PATH.match(data, start) is not None)
+    roots = sorted(roots, key=len, reverse=True)
+
+    local = {b"/": installRoot.replace("\\", "/").encode(), b"\\": installRoot.replace("/", "\\").encode()}
+    rewrites = dict()
+    for path, data in files.items():
+        spans = list()
+        for start, end, marker in _occurrences(data, markers):
+            prefix = data[start:end]
+            if prefix.endswith(local[marker[:1]]):
+                continue
+            root = next((r for r in roots if prefix.endswith(r)), None)
+            if root is None:
+                # 相対パスなど, 元の install root が分からないものは直せない.
+                return path
+            spans.append((end - len(root), end, local[marker[:1]]))
+        if spans:
+            pieces = list()
+            last = 0
+            for start, end, replacement in sorted(spans):
+                pieces += [data[last:start], replacement]
+                last = end
+            rewrites[path] = b"".join(pieces) + data[last:]
+    for path, data in rewrites.items():
+        with open(path, mode="wb") as fp:
+            fp.write(data)
+    return None
+
+
+def restoreArtifact(artifact: Artifact, installDir: str) -> bool:
+    """ artifact cache の成果物を installDir にコピーする. 途中で失敗しても installDir は壊さない.
+
+    元の install root を参照するパスは installDir の install root に書き換える.
+    書き換えられないパスがあれば何もせずに False を返すので, ビルドすること.
+    """
+    temporary = f"{installDir}.{os.getpid()}.restoring"
+    if os.path.exists(temporary):
+        shutil.rmtree(temporary)
+    shutil.copytree(artifact.directory, temporary, symlinks=True)
+    try:
+        unresolved = _relocate(temporary, artifact, os.path.dirname(os.path.dirname(os.path.abspath(installDir))))
+    except BaseException:
+        shutil.rmtree(temporary)
+        raise
+    if unresolved is not None:
+        print(f"[distbuilder] Cannot relocate {os.path.relpath(unresolved, temporary)} "
+              f"of {artifact.directory} to {installDir}.")
+        shutil.rmtree(temporary)
+        return False
+    if os.path.exists(installDir):
+        shutil.rmtree(installDir)
+    os.replace(temporary, installDir)
+    return True
+
+
+class BuildTimes:
+    """ ライブラリごとのビルド時間 (秒) の移動平均. build root の buildtimes.json に保存する. """
+
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self._path = os.path.join(Preference.get().buildRootDirectory, "buildtimes.json")
+        self._stats: Optional[dict] = None
+
+    def _load(self) -> dict:
+        try:
+            with open(self._path, mode="r", encoding="utf-8") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return dict()
+
+    def estimate(self, libraryName: str) -> Optional[float]:
+        """ 記録が無ければ None. """
+        if self._stats is None:
+            self._stats = self._load()
+        record = self._stats.get(libraryName)
+        return record["elapsed"] if record is not None else None
+
+    def record(self, libraryName: str, elapsed: float):
+        from .blob import _FileLock, _writeJson
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with BuildTimes._lock:
+            lock = _FileLock(f"{self._path}.lock")
+            lock.acquire()
+            try:
+                stats = self._load()
+                record = stats.setdefault(libraryName, dict())
+                if "elapsed" in record:
+                    record["elapsed"] = (1 - _ALPHA) * record["elapsed"] + _ALPHA * elapsed
+                else:
+                    record["elapsed"] = elapsed
+                record["count"] = record.get("count", 0) + 1
+                _writeJson(self._path, stats)
+                self._stats = stats
+            finally:
+                lock.release()
+
+
+class BuildCost:
+    """ 1 ライブラリを使えるようにするまでの推定時間.
+
+    state は "installed" (install root にある), "cache" (artifact cache からコピーする), "build" (ビルドする).
+    """
+
+    def __init__(self, builder: BuilderBase, state: str, seconds: float, recorded: bool):
+        self.libraryName = builder.libraryName
+        self.version = builder.version
+        self.hash = builder.hash
+        self.state = state
+        self.seconds = seconds
+        # seconds が過去のビルド時間か (False なら既定値).
+        self.recorded = recorded
+
+
+def estimateBuildCost(builders: List[BuilderBase], index: ArtifactIndex, times: BuildTimes,
+                      defaultBuildTime: float) -> List[BuildCost]:
+    """ hash の決まった builders のそれぞれについて, ビルドが必要か調べて推定時間を返す.
+
+    artifact cache の成果物はコピーできるものとして扱う. restoreArtifact で書き換えられなければ build でビルドされる.
+    """
+    costs = list()
+    for builder in builders:
+        builder.updateHash()
+        artifact = index.find(builder.libraryName, builder.hash)
+        if artifact is not None:
+            costs.append(BuildCost(builder, "cache" if artifact.cached else "installed", 0.0, True))
+            continue
+        elapsed = times.estimate(builder.libraryName)
+        costs.append(BuildCost(builder, "build", elapsed if elapsed is not None else defaultBuildTime,
+                               elapsed is not None))
+    return costs
+
+
+def formatDuration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
@@ -1,53 +1,726 @@
 import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Iterable, Optional
 from .preference import Preference
 from .errors import BuildError
+from .mirror import MirrorStats, candidateUrls
+from .archive import ExtractResult, MemberFilter, archiveExt, extractTar, tarCompression
+
+
+_CHUNK_SIZE = 1024 * 1024
+_MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+_SIDECAR_EXTS = (".part", ".part.json", ".verified.json", ".index.json", ".lock")
+# <blob>.lease-<pid>: プロセスごとの lease ファイル.
+_LEASE_INFIX = ".lease-"
+# 取得元にファイルが無いことを示す HTTP status.
+_MISSING_STATUS = (404, 410)
+
+
+class _MirrorMiss(BuildError):
+    """ 取得元にそのファイルが無い, もしくは中身が違う. 取得元自体は使えるので失敗として記録しない. """
+
+
+class _FileLock:
+    """ プロセス間の排他ロック. ロックファイルは削除しない (削除と取得が競合するため). """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._fp = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        self._fp = open(self._path, mode="a+b")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._fp.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._fp.fileno(), msvcrt.LK_NBLCK, 1)
+                        return True
+                    except OSError:
+                        if not blocking:
+                            raise
+                        time.sleep(0.5)
+            else:
+                import fcntl
+                fcntl.flock(self._fp.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                return True
+        except OSError:
+            self._fp.close()
+            self._fp = None
+            return False
+
+    def release(self):
+        if self._fp is None:
+            return
+        if os.name == "nt":
+            import msvcrt
+            self._fp.seek(0)
+            msvcrt.locking(self._fp.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._fp.fileno(), fcntl.LOCK_UN)
+        self._fp.close()
+        self._fp = None
+
+
+# このプロセスが持っている blob の lease. filepath -> [_FileLock, 参照数]
+_leases: Dict[str, list] = dict()
+_leasesLock = threading.Lock()
+
+
+def _acquireLease(filepath: str):
+    """ <filepath>.lease-<pid> をロックして持つ. 持っている間, gc は filepath を消さない.
+
+    lease ファイルはプロセスごとに別なので, 他のプロセスの lease を待つことは無い.
+    gc と競合しないように, <filepath>.lock を持った状態で呼ぶこと.
+    """
+    with _leasesLock:
+        entry = _leases.get(filepath)
+        if entry is not None:
+            entry[1] += 1
+            return
+        lock = _FileLock(f"{filepath}{_LEASE_INFIX}{os.getpid()}")
+        lock.acquire()
+        _leases[filepath] = [lock, 1]
+
+
+def releaseLease(filepath: str):
+    """ Blob.fetch(lease=True) で取った lease を返す. 持っていなければ何もしない. """
+    with _leasesLock:
+        entry = _leases.get(filepath)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _leases[filepath]
+        entry[0].release()
+        try:
+            os.remove(f"{filepath}{_LEASE_INFIX}{os.getpid()}")
+        except OSError:
+            pass
+
+
+def _isLeased(filepath: str) -> bool:
+    """ filepath の lease を持っているプロセスがあるか. <filepath>.lock を持った状態で呼ぶこと.
+
+    ロックできた lease ファイルは, 終了したプロセスが残したものなので消す.
+    """
+    dirpath, filename = os.path.split(filepath)
+    leased = False
+    for name in os.listdir(dirpath):
+        if not name.startswith(f"{filename}{_LEASE_INFIX}"):
+            continue
+        lock = _FileLock(os.path.join(dirpath, name))
+        if not lock.acquire(blocking=False):
+            leased = True
+            continue
+        lock.release()
+        try:
+            os.remove(os.path.join(dirpath, name))
+        except OSError:
+            # Windows では開かれているファイルは消せない. その間に lease が取られた.
+            leased = True
+    return leased
+
+
+def _writeJson(path: str, obj: dict):
+    # 書きかけのファイルを他のプロセスに読ませないよう, 一時ファイルに書いてから置き換える.
+    tmpPath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmpPath, mode="w", encoding="utf-8") as fp:
+        json.dump(obj, fp)
+    os.replace(tmpPath, path)
+
+
+class _TeeReader:
+    """ 読んだデータをファイルと hash にも流す. """
+
+    def __init__(self, source, sink, hasher):
+        self._source = source
+        self._sink = sink
+        self._hasher = hasher
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._source.read(size)
+        self._sink.write(data)
+        self._hasher.update(data)
+        return data
+
+    def drain(self):
+        while self.read(_CHUNK_SIZE):
+            pass
+
+
+def _blobDirectory(blobRoot: str, signature: str) -> str:
+    signature = signature.lower()
+    return os.path.join(blobRoot, signature[0:2], signature[2:4])
+
+
+def blobPath(url: str, signature: str) -> str:
+    """ url のアーカイブが blob store に保存される (されている) パス. """
+    return os.path.join(_blobDirectory(Preference.get().blobRootDirectory, signature), f"{signature}{archiveExt(url)}")
 
 
 class Blob:
     def __init__(self, builder):
         from .builder import BuilderBase
         self._builder: BuilderBase = builder
-        self._blobRoot = os.path.join(Preference.get().buildRootDirectory, "_blob")
+        self._blobRoot = Preference.get().blobRootDirectory
+        # 直近の _download で最初の応答が返るまでにかかった時間 (ミラーの順位付けに使う)
+        self._latency = 0.0
 
     def _createDirectory(self, signature: str) -> str:
-        signature = signature.lower()
-        dirpath = os.path.join(self._blobRoot, signature[0:2], signature[2:4])
+        dirpath = _blobDirectory(self._blobRoot, signature)
         os.makedirs(dirpath, exist_ok=True)
         return dirpath
 
-    def fetch(self, url: str, signature: str, *, ext: str = None) -> str:
-        signature = signature.lower()
+    def _removePart(self, partPath: str):
+        for path in (partPath, f"{partPath}.json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _loadPartInfo(self, partPath: str, url: str) -> dict | None:
+        # .part.json: 途中までダウンロードしたファイルの url, length, etag
+        infoPath = f"{partPath}.json"
+        if not os.path.exists(partPath) or not os.path.exists(infoPath):
+            return None
+        try:
+            with open(infoPath, mode="r", encoding="utf-8") as fp:
+                info = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if info.get("url") != url:
+            return None
+        return info
+
+    def _isVerified(self, filepath: str, signature: str) -> bool:
+        # .verified.json: 最後に検証した時点の size, mtime_ns, inode と digest
+        try:
+            with open(f"{filepath}.verified.json", mode="r", encoding="utf-8") as fp:
+                record = json.load(fp)
+            st = os.stat(filepath)
+        except (OSError, ValueError):
+            return False
+        return (record.get("size") == st.st_size
+                and record.get("mtime_ns") == st.st_mtime_ns
+                and record.get("inode") == st.st_ino
+                and record.get("digest") == signature)
+
+    def _writeVerified(self, filepath: str, signature: str):
+        st = os.stat(filepath)
+        _writeJson(f"{filepath}.verified.json",
+                   dict(size=st.st_size, mtime_ns=st.st_mtime_ns, inode=st.st_ino, digest=signature))
+
+    def _removeVerified(self, filepath: str):
+        if os.path.exists(f"{filepath}.verified.json"):
+            os.remove(f"{filepath}.verified.json")
+
+    def _updateIndex(self, filepath: str, url: str):
+        # .index.json: url, size, 初回取得時刻, 最終アクセス時刻. gc で使う.
+        indexPath = f"{filepath}.index.json"
+        now = time.time()
+        record = _loadJson(indexPath) or dict(firstFetch=now)
+        record.update(url=url, size=os.path.getsize(filepath), lastAccess=now)
+        _writeJson(indexPath, record)
+
+    def _hashFile(self, path: str, hasher):
+        with open(path, mode="rb") as fp:
+            while True:
+                chunk = fp.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+
+    def _probe(self, url: str) -> Optional[dict]:
+        """ HEAD で Range 取得に対応しているか調べる. 分割ダウンロードできる場合は length, etag を返す. """
+        import urllib.error
+        import urllib.request
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, method="HEAD")) as response:
+                length = response.headers.get("Content-Length")
+                if response.headers.get("Accept-Ranges", "").lower() != "bytes" or length is None:
+                    return None
+                return dict(url=response.geturl(), length=int(length), etag=response.headers.get("ETag"))
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+    def _downloadSegments(self, url: str, partPath: str, info: dict) -> bool:
+        """ info["segments"] の各範囲をスレッドで並列に取得し, 確保済みの partPath に書き込む.
+
+        サーバーが部分取得に応じなかった場合は .part を破棄して False を返す.
+        """
+        import http.client
+        import urllib.error
+        import urllib.request
+        from concurrent.futures import ThreadPoolExecutor
+
+        if not os.path.exists(partPath):
+            # 先に全体の大きさを確保しておく.
+            with open(partPath, mode="wb") as fp:
+                fp.truncate(info["length"])
+        _writeJson(f"{partPath}.json", info)
+
+        infoLock = threading.Lock()
+        remaining = [i for i, (_, _, done) in enumerate(info["segments"]) if not done]
+        self._builder.log(f"Segmented downloading. ({len(remaining)} / {len(info['segments'])} segments)")
+
+        def _fetchSegment(index: int):
+            start, end, _ = info["segments"][index]
+            headers = dict(Range=f"bytes={start}-{end}")
+            if info.get("etag"):
+                headers["If-Range"] = info["etag"]
+            # リダイレクト先 (probe で解決済み) から直接取得する.
+            request = urllib.request.Request(info.get("location", url), headers=headers)
+            with urllib.request.urlopen(request) as response:
+                if response.status != 206:
+                    return False
+                with open(partPath, mode="r+b") as fp:
+                    fp.seek(start)
+                    written = 0
+                    while True:
+                        chunk = response.read(_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        fp.write(chunk)
+                        written += len(chunk)
+            if written != end - start + 1:
+                raise BuildError(f"Segment {index} interrupted. ({written} / {end - start + 1} bytes)")
+            with infoLock:
+                info["segments"][index][2] = True
+                _writeJson(f"{partPath}.json", info)
+            return True
+
+        with ThreadPoolExecutor(max_workers=len(info["segments"])) as executor:
+            futures = [executor.submit(_fetchSegment, i) for i in remaining]
+        try:
+            results = [future.result() for future in futures]
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            # 完了した segment は .part.json に記録済み. 次回は残りだけ取得する.
+            raise BuildError(f"Download interrupted. {e}")
+        if not all(results):
+            self._builder.log("Server does not return partial content. Fallback to single stream.")
+            self._removePart(partPath)
+            return False
+        return True
+
+    def _download(self, url: str, partPath: str) -> Optional[str]:
+        """ url を partPath にダウンロードし, ファイル全体の sha256 を返す.
+
+        書き込みと同時に hash を計算するので, ダウンロード後にファイルを読み直す必要はない.
+        Range に対応したサーバーからは分割して並列に取得する. この場合は順不同で書き込まれるため None を返す.
+        """
+        import http.client
+        import urllib.error
+        import urllib.request
+
+        info = self._loadPartInfo(partPath, url)
+        if info is not None and "segments" in info:
+            if self._downloadSegments(url, partPath, info):
+                return None
+            info = None
+
+        offset = 0
+        headers = dict()
+        if info is None:
+            self._removePart(partPath)
+            segmentCount = Preference.get().downloadSegments
+            if segmentCount > 1:
+                startTime = time.perf_counter()
+                probe = self._probe(url)
+                self._latency = time.perf_counter() - startTime
+                if probe is not None and probe["length"] >= segmentCount * _MIN_SEGMENT_SIZE:
+                    size = -(-probe["length"] // segmentCount)
+                    probe["segments"] = [[start, min(start + size, probe["length"]) - 1, False]
+                                         for start in range(0, probe["length"], size)]
+                    probe["url"], probe["location"] = url, probe["url"]
+                    if self._downloadSegments(url, partPath, probe):
+                        return None
+        else:
+            offset = os.path.getsize(partPath)
+            if info.get("length") is not None and offset == info["length"]:
+                self._builder.log("Partial file is already complete.")
+                hasher = hashlib.sha256()
+                self._hashFile(partPath, hasher)
+                return hasher.hexdigest()
+            if offset > 0:
+                headers["Range"] = f"bytes={offset}-"
+                if info.get("etag"):
+                    # 途中でファイルが変わっていたら 200 で全体が返ってくる.
+                    headers["If-Range"] = info["etag"]
+
+        request = urllib.request.Request(url, headers=headers)
+        startTime = time.perf_counter()
+        try:
+            response = urllib.request.urlopen(request)
+            self._latency = time.perf_counter() - startTime
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset > 0:
+                # Range が不正. 最初からやり直す.
+                self._builder.log("Range not satisfiable. Restart downloading.")
+                self._removePart(partPath)
+                return self._download(url, partPath)
+            if e.code in _MISSING_STATUS:
+                raise _MirrorMiss(f"Failed to download source. {e}")
+            raise BuildError(f"Failed to download source. {e}")
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, FileNotFoundError):
+                # file:// のミラーに無い.
+                raise _MirrorMiss(f"Failed to download source. {e}")
+            raise BuildError(f"Failed to download source. {e}")
+
+        with response:
+            hasher = hashlib.sha256()
+            if offset > 0 and response.status == 206:
+                self._builder.log(f"Resume downloading from {offset} bytes.")
+                mode = "ab"
+                # 再開する場合は既にある部分だけ読んで hash に積む.
+                self._hashFile(partPath, hasher)
+            else:
+                offset = 0
+                mode = "wb"
+
+            length = response.headers.get("Content-Length")
+            length = int(length) + offset if length is not None else None
+            _writeJson(f"{partPath}.json", dict(url=url, length=length, etag=response.headers.get("ETag")))
+
+            try:
+                with open(partPath, mode=mode) as fp:
+                    while True:
+                        chunk = response.read(_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        fp.write(chunk)
+                        hasher.update(chunk)
+            except (OSError, http.client.HTTPException) as e:
+                # .part は残しておき, 次回 Range で再開する.
+                raise BuildError(f"Download interrupted. {e}")
+
+        size = os.path.getsize(partPath)
+        if length is not None and size != length:
+            raise BuildError(f"Download interrupted. ({size} / {length} bytes)")
+        return hasher.hexdigest()
+
+    def _fetchFromMirrors(self, url: str, signature: str, filepath: str, partPath: str):
+        """ ミラーを速い順に試し, signature の一致したものを filepath に置く. """
+        stats = MirrorStats()
+        candidates = stats.rank(candidateUrls(url, signature))
+        errors = list()
+        for candidate in candidates:
+            # download してくる
+            self._builder.log("Downloading...")
+            self._builder.log(f"-- URL: {candidate}")
+            self._builder.log(f"-- Destination: {filepath}")
+            startTime = time.perf_counter()
+            try:
+                calculated = self._download(candidate, partPath)
+                elapsed = time.perf_counter() - startTime
+                size = os.path.getsize(partPath)
+                self._builder.log(f"Downloaded {_formatSize(size)} in {elapsed:.2f} sec. "
+                                  f"({_formatSize(size / max(elapsed, 1e-6))}/s)")
+
+                # signature チェック
+                # ダウンロードしたものは計算済みの hash と比較する. 不一致なら blob store には置かない.
+                try:
+                    self._builder.checkSignature(partPath, signature,
+                                                 signatureAlgorithm="sha-256", calculated=calculated)
+                except BuildError as e:
+                    # signature 不一致, ファイルを消しておく
+                    self._removePart(partPath)
+                    raise _MirrorMiss(str(e))
+            except BuildError as e:
+                # 404 や signature 不一致はその url だけの問題なので, 取得元の失敗としては数えない.
+                if not isinstance(e, _MirrorMiss):
+                    stats.recordFailure(candidate)
+                errors.append(f"{candidate}: {e}")
+                if len(candidates) > 1:
+                    self._builder.log(f"Failed to fetch from {candidate}. {e}")
+                continue
+
+            stats.recordSuccess(candidate, self._latency, size, elapsed)
+            # 検証が済んでから所定の位置に置く.
+            os.replace(partPath, filepath)
+            self._removePart(partPath)
+            return
+
+        if len(errors) == 1:
+            raise BuildError(errors[0].split(": ", 1)[1])
+        raise BuildError("Failed to fetch from all mirrors.\n" + "\n".join(f"-- {e}" for e in errors))
+
+    def _blobPath(self, url: str, signature: str, ext: Optional[str]) -> str:
         dirpath = self._createDirectory(signature)
         if ext is None:
-            ext = os.path.splitext(url)[1]
-        filepath = os.path.join(dirpath, f"{signature}{ext}")
+            ext = archiveExt(url)
+        return os.path.join(dirpath, f"{signature}{ext}")
+
+    def _lock(self, filepath: str) -> _FileLock:
+        # 同じ blob を扱う他のプロセス (別の build root からの実行を含む) と排他する.
+        # 他のプロセスがダウンロード中であれば, 完了を待ってそれを使う.
+        lock = _FileLock(f"{filepath}.lock")
+        if not lock.acquire(blocking=False):
+            self._builder.log("Another process is fetching the same file. Waiting...")
+            lock.acquire()
+        return lock
+
+    def fetch(self, url: str, signature: str, *, ext: str = None, lease: bool = False) -> str:
+        """ blob store のパスを返す. 無ければダウンロードする.
+
+        lease が True の場合, 展開が終わるまで gc に消されないよう lease を持ったまま返す.
+        展開したら releaseLease(path) を呼ぶこと.
+        """
+        signature = signature.lower()
+        filepath = self._blobPath(url, signature, ext)
+        lock = self._lock(filepath)
+        try:
+            path = self._fetch(url, signature, filepath)
+            if lease:
+                _acquireLease(filepath)
+            return path
+        finally:
+            lock.release()
+
+    def fetchAndExtract(self, url: str, signature: str, destination: str, *,
+                        memberFilter: Optional[MemberFilter] = None) -> Optional[ExtractResult]:
+        """ tar アーカイブをダウンロードしながら destination に展開する.
+
+        ダウンロードしたアーカイブは blob store にも置かれる. signature が一致しなければ展開結果も破棄する.
+        tar でない場合や blob が既にある場合は何もせずに None を返すので, fetch してから展開すること.
+        """
+        compression = tarCompression(url)
+        if compression is None:
+            return None
+        signature = signature.lower()
+        filepath = self._blobPath(url, signature, None)
+        lock = self._lock(filepath)
+        try:
+            self._forceRemove(filepath)
+            if os.path.exists(filepath):
+                return None
+            return self._streamFromMirrors(url, signature, filepath, destination, compression, memberFilter)
+        finally:
+            lock.release()
+
+    def _forceRemove(self, filepath: str):
         if self._builder.globalOptions.forceDownload:
             if os.path.exists(filepath):
                 self._builder.log("FORCE (re)downloading. Erasing cached file...")
                 self._builder.log(f"-- Path: {filepath}")
                 os.remove(filepath)
+            self._removeVerified(filepath)
+            self._removePart(f"{filepath}.part")
 
-        if not os.path.exists(filepath):
-            # download してくる
-            import urllib.error
-            import urllib.request
-            self._builder.log("Downloading...")
-            self._builder.log(f"-- URL: {url}")
+    def _streamExtract(self, url: str, partPath: str, destination: str, compression: str,
+                       memberFilter: Optional[MemberFilter]):
+        """ url の tar を partPath に保存しつつ, hash を計算しながら destination に展開する. """
+        import urllib.error
+        import urllib.request
+
+        self._removePart(partPath)
+        startTime = time.perf_counter()
+        try:
+            response = urllib.request.urlopen(url)
+            self._latency = time.perf_counter() - startTime
+        except urllib.error.HTTPError as e:
+            if e.code in _MISSING_STATUS:
+                raise _MirrorMiss(f"Failed to download source. {e}")
+            raise BuildError(f"Failed to download source. {e}")
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, FileNotFoundError):
+                raise _MirrorMiss(f"Failed to download source. {e}")
+            raise BuildError(f"Failed to download source. {e}")
+
+        hasher = hashlib.sha256()
+        with response, open(partPath, mode="wb") as part:
+            reader = _TeeReader(response, part, hasher)
+            try:
+                result = extractTar(reader, destination, compression=compression, memberFilter=memberFilter)
+                # tar の終端以降 (padding) も hash に含める.
+                reader.drain()
+            except BuildError:
+                raise
+            except Exception as e:
+                # 通信の切断や壊れたアーカイブ (zstandard の例外を含む) は全て失敗として扱う.
+                raise BuildError(f"Failed to extract while downloading. {e}")
+        return hasher.hexdigest(), result
+
+    def _streamFromMirrors(self, url: str, signature: str, filepath: str, destination: str, compression: str,
+                           memberFilter: Optional[MemberFilter]) -> ExtractResult:
+        import shutil
+        partPath = f"{filepath}.part"
+        tmpPath = f"{destination}.{os.getpid()}.tmp"
+        stats = MirrorStats()
+        candidates = stats.rank(candidateUrls(url, signature))
+        errors = list()
+        for candidate in candidates:
+            self._builder.log("Downloading and extracting...")
+            self._builder.log(f"-- URL: {candidate}")
             self._builder.log(f"-- Destination: {filepath}")
+            self._builder.log(f"-- Extract to: {destination}")
+            if os.path.exists(tmpPath):
+                shutil.rmtree(tmpPath)
+            startTime = time.perf_counter()
             try:
-                urllib.request.urlretrieve(url, filepath)
-            except urllib.error.HTTPError as e:
-                raise BuildError(f"Failed to download source. {e}")
-        else:
-            self._builder.log("Cached file is available. Skip downloading.")
+                calculated, result = self._streamExtract(candidate, partPath, tmpPath, compression, memberFilter)
+                elapsed = time.perf_counter() - startTime
+                size = os.path.getsize(partPath)
+                self._builder.log(f"Downloaded {_formatSize(size)} in {elapsed:.2f} sec. "
+                                  f"({_formatSize(size / max(elapsed, 1e-6))}/s)")
+                try:
+                    self._builder.checkSignature(partPath, signature,
+                                                 signatureAlgorithm="sha-256", calculated=calculated)
+                except BuildError as e:
+                    raise _MirrorMiss(str(e))
+            except BuildError as e:
+                # 展開したものも信用できないので捨てる.
+                self._removePart(partPath)
+                if os.path.exists(tmpPath):
+                    shutil.rmtree(tmpPath)
+                if not isinstance(e, _MirrorMiss):
+                    stats.recordFailure(candidate)
+                errors.append(f"{candidate}: {e}")
+                if len(candidates) > 1:
+                    self._builder.log(f"Failed to fetch from {candidate}. {e}")
+                continue
 
-        # signature チェック
-        try:
-            self._builder.checkSignature(filepath, signature,
-                                         signatureAlgorithm="sha-256")
-        except BuildError as e:
-            # signature 不一致, ファイルを消しておく
-            os.remove(filepath)
-            raise e
+            stats.recordSuccess(candidate, self._latency, size, elapsed)
+            os.replace(partPath, filepath)
+            self._removePart(partPath)
+            self._writeVerified(filepath, signature)
+            self._updateIndex(filepath, url)
+            os.rename(tmpPath, destination)
+            return result
+
+        if len(errors) == 1:
+            raise BuildError(errors[0].split(": ", 1)[1])
+        raise BuildError("Failed to fetch from all mirrors.\n" + "\n".join(f"-- {e}" for e in errors))
+
+    def _fetch(self, url: str, signature: str, filepath: str) -> str:
+        partPath = f"{filepath}.part"
+        self._forceRemove(filepath)
+
+        if os.path.exists(filepath):
+            self._builder.log("Cached file is available. Skip downloading.")
+            if not self._builder.globalOptions.paranoid and self._isVerified(filepath, signature):
+                # 前回検証した時から変更されていないので hash し直さない.
+                self._builder.log("Cached file is already verified. Skip signature check. (use --paranoid to force)")
+                self._updateIndex(filepath, url)
+                return filepath
+            # signature チェック
+            try:
+                self._builder.checkSignature(filepath, signature, signatureAlgorithm="sha-256")
+            except BuildError as e:
+                # signature 不一致, ファイルを消しておく
+                os.remove(filepath)
+                self._removeVerified(filepath)
+                raise e
+        else:
+            self._fetchFromMirrors(url, signature, filepath, partPath)
+        self._writeVerified(filepath, signature)
+        self._updateIndex(filepath, url)
 
         return filepath
+
+
+def _loadJson(path: str) -> Optional[dict]:
+    try:
+        with open(path, mode="r", encoding="utf-8") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _formatSize(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def parseSize(value) -> int:
+    """ 1234, "500MB", "20GB" のようなサイズ指定を byte 数に変換する. """
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().upper()
+    for unit, scale in (("TB", 1024 ** 4), ("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024), ("B", 1)):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * scale)
+    return int(value)
+
+
+def collectGarbage(maxSize: int, pinnedSignatures: Iterable[str] = (), *, gracePeriod: float = 0.0,
+                   dryRun: bool = False) -> int:
+    """ blob store の合計サイズが maxSize 以下になるまで, 最終アクセスが古いものから削除する.
+
+    blob store は他の build root と共有されることがあるので, gracePeriod 秒以内にアクセスされたものと,
+    他のプロセスが取得中または lease を持っている (展開中の) ものは削除しない.
+
+    Args:
+        maxSize (int): blob store の上限サイズ (byte).
+        pinnedSignatures (Iterable[str]): 削除しない blob の signature.
+        gracePeriod (float): 最終アクセスからこの秒数が経っていない blob は削除しない.
+        dryRun (bool): 削除せずに表示だけする.
+
+    Returns:
+        int: 削除した (dryRun の場合は削除対象の) byte 数.
+    """
+    blobRoot = Preference.get().blobRootDirectory
+    pinned = {s.lower() for s in pinnedSignatures}
+
+    blobs = list()
+    total = 0
+    for dirpath, _, filenames in os.walk(blobRoot):
+        if dirpath == blobRoot:
+            # blob は <root>/xx/yy/ 以下にある. 直下は mirrors.json など.
+            continue
+        for filename in filenames:
+            if filename.endswith(_SIDECAR_EXTS) or filename.endswith(".tmp") or _LEASE_INFIX in filename:
+                continue
+            filepath = os.path.join(dirpath, filename)
+            size = os.path.getsize(filepath)
+            record = _loadJson(f"{filepath}.index.json") or dict()
+            # index が無い (古い) blob はファイルの mtime を最終アクセスとみなす.
+            lastAccess = record.get("lastAccess", os.path.getmtime(filepath))
+            blobs.append((lastAccess, filepath, size, filename.split(".", 1)[0].lower(), record.get("url")))
+            total += size
+
+    print(f"[distbuilder] Blob store: {len(blobs)} files, {_formatSize(total)} (max {_formatSize(maxSize)})")
+    removed = 0
+    recent = 0
+    now = time.time()
+    for lastAccess, filepath, size, signature, url in sorted(blobs):
+        if total - removed <= maxSize:
+            break
+        if signature in pinned:
+            continue
+        if now - lastAccess < gracePeriod:
+            recent += 1
+            continue
+        accessed = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(lastAccess))
+        print(f"[distbuilder] -- {'(dry run) ' if dryRun else ''}Evict {filepath} "
+              f"({_formatSize(size)}, last access {accessed}, {url})")
+        if not dryRun:
+            lock = _FileLock(f"{filepath}.lock")
+            if not lock.acquire(blocking=False):
+                print("[distbuilder] -- In use by another process. Skip.")
+                continue
+            try:
+                if _isLeased(filepath):
+                    print("[distbuilder] -- Being extracted by another process. Skip.")
+                    continue
+                for path in [filepath] + [filepath + ext for ext in _SIDECAR_EXTS if ext != ".lock"]:
+                    if os.path.exists(path):
+                        os.remove(path)
+            finally:
+                lock.release()
+        removed += size
+
+    if recent > 0:
+        print(f"[distbuilder] -- Kept {recent} files accessed within the last {gracePeriod / 3600:g} hours.")
+    if total - removed > maxSize:
+        print("[distbuilder] -- Pinned or recently used blobs exceed the size cap.")
+    print(f"[distbuilder] Evicted {_formatSize(removed)}.")
+    return removed
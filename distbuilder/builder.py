@@ -4,9 +4,9 @@ import shutil
 import re
 import subprocess
 import hashlib
-import json
-from typing import List, Union, Optional, Set
-from collections import OrderedDict
+import threading
+import zipfile
+from typing import Dict, List, Union, Optional, Set, Tuple
 from .errors import BuildError
 from .preference import Preference
 from .toolchain import Toolchain
@@ -14,6 +14,10 @@ from .version import Version
 from .option import Option
 from .dependency import Dependency
 from .global_options import GlobalOptions
+from .jobserver import JobServer
+from .hashcache import HashInputs, builderHash, builderHashData, scriptSignature
+from .archive import MemberFilter, SourceCache, breakLink, extractArchive, syncZip
+from .patcher import BatchPatcher, PatchSnapshotCache, PatchState, hashTargets, patchSetDigest, resolveTarget
 
 
 _replaceRule = re.compile("[a-z0-9]([A-Z])")
@@ -27,6 +31,21 @@ def _toLabel(name: str):
     return name
 
 
+# builder class -> (option_ のメンバー名, dep_ のメンバー名)
+_declaredMembersCache: Dict[type, Tuple[List[str], List[str]]] = dict()
+
+
+def _declaredMembers(cls: type) -> Tuple[List[str], List[str]]:
+    # builder は deps.json の読み込みのたびに全ライブラリ分作られるので, dir() はクラスごとに一度だけにする.
+    members = _declaredMembersCache.get(cls)
+    if members is None:
+        names = dir(cls)
+        members = ([m for m in names if m.startswith("option_") and isinstance(getattr(cls, m), Option)],
+                   [m for m in names if m.startswith("dep_") and isinstance(getattr(cls, m), Dependency)])
+        _declaredMembersCache[cls] = members
+    return members
+
+
 def _logTask(func):
     def wrapper(self, *args, **kwargs):
         self.log(f"{_toLabel(func.__name__)}")
@@ -82,10 +101,19 @@ class _IOLogBuffer:
 
 
 class BuilderBase:
+    # ソースアーカイブの URL.
+    # {variant}, {major}, {minor}, {patch} は version の値で置換される.
+    sourceUrl: Optional[str] = None
+
     def __init__(self, depsConfValue: dict, globalOptions: GlobalOptions):
         self._libraryName = self.__class__.__module__.__name__
         self._builderScriptPath = self.__class__.__module__.__file__
-        self._logIndent = 0
+        # config 並列ビルドではスレッドごとにインデントを持つ.
+        self._logState = threading.local()
+        # 展開先ディレクトリとアーカイブの signature. パッチのスナップショットに使う.
+        self._extractedArchives: Dict[str, str] = dict()
+        # download で lease を取った blob. 展開が終わるまで gc に消されないようにする.
+        self._blobLeases: List[str] = list()
 
         # version
         # -- 指定されないこともある. その場合はビルド実行できない.
@@ -102,7 +130,8 @@ class BuilderBase:
         self._globalOptions: GlobalOptions = globalOptions
 
         # deps config value
-        self._depsConfValue: dict = depsConfValue.copy()
+        # 全ライブラリ分の dict なので, builder ごとには複製しない.
+        self._depsConfValue: dict = depsConfValue
 
         # この builder に対する option values
         optionValues = dict()
@@ -112,25 +141,23 @@ class BuilderBase:
         # option, dependency をピックアップする.
         self._options = list()
         self._dependencies = list()
-        for member in dir(self.__class__):
-            if member.startswith("option_"):
-                m = getattr(self.__class__, member)
-                if isinstance(m, Option):
-                    m._key = member[7:]
-                    opt = m._instantiate(self, optionValues.get(m._key))
-                    setattr(self, member, opt)
-                    self._options.append(opt)
-            if member.startswith("dep_"):
-                m = getattr(self.__class__, member)
-                if isinstance(m, Dependency):
-                    dep = m.copy()
-                    setattr(self, member, dep)
-                    self._dependencies.append(dep)
+        optionMembers, dependencyMembers = _declaredMembers(self.__class__)
+        for member in optionMembers:
+            m = getattr(self.__class__, member)
+            m._key = member[7:]
+            opt = m._instantiate(self, optionValues.get(m._key))
+            setattr(self, member, opt)
+            self._options.append(opt)
+        for member in dependencyMembers:
+            dep = getattr(self.__class__, member).copy()
+            setattr(self, member, dep)
+            self._dependencies.append(dep)
         self._options.sort(key=lambda v: v.key)
         self._dependencies.sort(key=lambda v: v.libraryName)
 
         # Hash
-        self._hashData: Optional[dict] = None
+        self._hashInputs: Optional[HashInputs] = None
+        self._hashData: Optional[str] = None
         self._hash: Option[str] = None
 
         # CMake toolchain
@@ -139,8 +166,20 @@ class BuilderBase:
         # File Handle
         self._fp = None
 
+        # install 先の共有ファイル (cmake config export 等) を複数 config で同時に書かないようにする.
+        self._installLock = threading.Lock()
+
+    @property
+    def _logIndent(self) -> int:
+        return getattr(self._logState, "indent", 0)
+
+    @_logIndent.setter
+    def _logIndent(self, value: int):
+        self._logState.indent = value
+
     def _setDirty(self):
         self._hash = None
+        self._hashInputs = None
         self._hashData = None
 
     def updateHash(self, *, force: bool = False):
@@ -151,41 +190,25 @@ class BuilderBase:
             raise BuildError(f"Cannot calc hash. library ({self._libraryName}) unresolved.")
 
         # -- calc build.py signature
-        # 空行, コメント行は全てカットする.
+        # 空行, コメント行を除いた内容. (path, mtime_ns, size) が変わらなければファイルは読まない.
         script = ""
         if not self._globalOptions.ignoreScriptVersion:
-            with open(self._builderScriptPath, mode="r", encoding="utf-8") as fp:
-                scriptLines = fp.readlines()
-
-            for ln in scriptLines:
-                lnn = ln.strip()
-                if lnn == "" or lnn.startswith("#"):
-                    continue
-                script += ln.rstrip() + "\n"
-            script = hashlib.sha256(script.encode()).hexdigest()
+            script = scriptSignature(self._builderScriptPath)
         else:
             self.log("!!!! Script version is IGNORED !!!!")
 
-        # -- build json object
-        jobj = OrderedDict(
-            libraryName=self._libraryName,
-            scriptSignature=script,
-            version=str(self._version),
-            options=list(),
-            deps=list(),
-        )
-
-        for option in self._options:
-            jobj["options"].append(OrderedDict(key=option.key, value=str(option)))
+        options = tuple((option.key, str(option)) for option in self._options)
+        deps = list()
         for dep in self._dependencies:
             if dep.isRequired(self):
                 dep.updateHash()
-                jobj["deps"].append(OrderedDict(libraryName=dep.libraryName, hash=dep.hash))
+                deps.append((dep.libraryName, dep.hash))
             # else: 使用しない dependency は記述しない.
-        self._hashData = json.dumps(jobj, indent=2, ensure_ascii=False)
 
         # -- calc hash
-        self._hash = hashlib.md5(self._hashData.encode()).hexdigest()
+        self._hashInputs = (self._libraryName, script, str(self._version), options, tuple(deps))
+        self._hashData = None
+        self._hash = builderHash(self._hashInputs)
 
     def setVersion(self, version: Version):
         self._version = version
@@ -219,9 +242,9 @@ class BuilderBase:
 
             # hash str を json で保存する
             with open(os.path.join(self.buildDir, "info.json"), mode="w", encoding="utf-8") as fp:
-                fp.write(self._hashData)
+                fp.write(self.hashData)
             with open(os.path.join(self.installDir, "info.json"), mode="w", encoding="utf-8") as fp:
-                fp.write(self._hashData)
+                fp.write(self.hashData)
 
             # deps に対して cmake toolchain を作る.
             self._toolchain = Toolchain(self.globalOptions.config)
@@ -286,6 +309,9 @@ class BuilderBase:
     @property
     def hashData(self) -> Optional[str]:
         """ ハッシュ元文字列データを取得. """
+        # hash はキャッシュから得られるので, 文字列は必要になったときに作る.
+        if self._hashData is None and self._hashInputs is not None:
+            self._hashData = builderHashData(self._hashInputs)
         return self._hashData
 
     @property
@@ -298,6 +324,23 @@ class BuilderBase:
         self.updateHash()
         return os.path.join(Preference.get().installRootDirectory, self.libraryName, self._hash).replace("\\", "/")
 
+    @classmethod
+    def getSourceUrl(cls, version: Version) -> Optional[str]:
+        """ version のソースアーカイブの URL を取得. 宣言されていなければ None. """
+        if cls.sourceUrl is None:
+            return None
+        return cls.sourceUrl.format(variant=version.variant, major=version.major,
+                                    minor=version.minor, patch=version.patch)
+
+    @classmethod
+    def getSource(cls, version: Version) -> Optional[Tuple[str, str]]:
+        """ version のソースアーカイブの (url, signature) を取得. build() を実行せずに取得できる. """
+        url = cls.getSourceUrl(version)
+        signature = getattr(cls, "signatures", dict()).get(version)
+        if url is None or signature is None:
+            return None
+        return (url, signature)
+
     @classmethod
     def generateVersion(cls, versionString: str) -> Version:
         # general version string: "." delemeter
@@ -316,8 +359,10 @@ class BuilderBase:
         else:
             return Version(*vers)
 
-    def log(self, msg):
-        prefix = " --" * self._logIndent
+    def log(self, msg, *, indent: Optional[int] = None):
+        if indent is None:
+            indent = self._logIndent
+        prefix = " --" * indent
 
         print(f"[{self.libraryName}]{prefix}", msg)
 
@@ -340,11 +385,14 @@ class BuilderBase:
                 if self._builder._fp is not None:
                     self._builder._fp = None
 
-        with BuildScope(self):
-            self.prepare()
-            with open(os.path.join(self.buildDir, "build.log"), mode="w", encoding="utf-8") as fp:
-                self._fp = fp
-                self.build()
+        try:
+            with BuildScope(self):
+                self.prepare()
+                with open(os.path.join(self.buildDir, "build.log"), mode="w", encoding="utf-8") as fp:
+                    self._fp = fp
+                    self.build()
+        finally:
+            self._releaseBlobLeases()
 
     def build(self):
         raise RuntimeError("build() must be implemented and do not call super class build().")
@@ -359,20 +407,24 @@ class BuilderBase:
             return os.path.join(self.buildDir, path)
 
     @_logTask
-    def checkSignature(self, path: str, signature: str, *, signatureAlgorithm: str = "sha256"):
-        import hashlib
+    def checkSignature(self, path: str, signature: str, *, signatureAlgorithm: str = "sha256",
+                       calculated: Optional[str] = None):
+        """ path の signature を検証する. calculated が与えられた場合はファイルを読まずにそれと比較する. """
         path = self._makeAbspath(path)
-        with open(path, mode="rb") as fp:
-            sig = hashlib.file_digest(fp, signatureAlgorithm).hexdigest().lower()
-            signature = signature.lower()
-            self.log(f"  Filepath = {path}")
-            self.log(f"  Expected = {signature}")
-            self.log(f"Calculated = {sig}")
-            if sig == signature:
-                self.log("Signature check OK.")
-            else:
-                self.log("Signature check failed.")
-                raise BuildError("Signature check failed.")
+        if calculated is None:
+            with open(path, mode="rb") as fp:
+                sig = hashlib.file_digest(fp, signatureAlgorithm).hexdigest().lower()
+        else:
+            sig = calculated.lower()
+        signature = signature.lower()
+        self.log(f"  Filepath = {path}")
+        self.log(f"  Expected = {signature}")
+        self.log(f"Calculated = {sig}")
+        if sig == signature:
+            self.log("Signature check OK.")
+        else:
+            self.log("Signature check failed.")
+            raise BuildError("Signature check failed.")
 
     @_logTask
     def createDirectory(self, path: str, *, recreate: bool = True):
@@ -407,43 +459,126 @@ class BuilderBase:
     def download(self, url: str, signature: str, *, ext: str = None) -> str:
         from .blob import Blob
         blob = Blob(self)
-        return blob.fetch(url, signature, ext=ext)
+        path = blob.fetch(url, signature, ext=ext, lease=True)
+        self._blobLeases.append(path)
+        return path
+
+    def _releaseBlobLeases(self, path: Optional[str] = None):
+        """ download で取った lease を返す. path を省略すると全て返す. """
+        from .blob import releaseLease
+        for leased in [p for p in self._blobLeases if path is None or p == path]:
+            self._blobLeases.remove(leased)
+            releaseLease(leased)
+
+    def downloadSource(self) -> str:
+        source = self.getSource(self.version)
+        if source is None:
+            raise BuildError("Source archive is not declared. (sourceUrl, signatures)")
+        return self.download(*source)
+
+    def _archiveSignature(self, path: str) -> Optional[str]:
+        """ blob store のアーカイブであれば, ファイル名の sha256 を返す. """
+        blobRoot = Preference.get().blobRootDirectory
+        if os.path.commonpath([os.path.abspath(path), blobRoot]) != blobRoot:
+            return None
+        signature = os.path.basename(path).split(".", 1)[0].lower()
+        if re.fullmatch("[0-9a-f]{64}", signature) is None:
+            return None
+        return signature
 
     @_logTask
-    def unzip(self, zipPath: str, destination: str):
+    def unzip(self, zipPath: str, destination: str, *,
+              include: Optional[List[str]] = None, exclude: Optional[List[str]] = None):
+        """ アーカイブを展開する.
+
+        include, exclude はアーカイブ内のパス (トップのディレクトリを含む) に対する glob.
+        * は / を跨がず, ** は任意の階層にマッチする. 例: include=["*/lib/**"], exclude=["**/tests/**"]
+        """
         zipPath = self._makeAbspath(zipPath)
         destination = self._makeAbspath(destination)
         self.log(f"zip file = {zipPath}")
         self.log(f"Destination = {destination}")
-        exists = os.path.exists(destination)
-        if exists and self._globalOptions.unzipAndOverwrite:
-            self.remove(destination)
-            exists = False
-        if exists is False:
-            shutil.unpack_archive(zipPath, destination)
-            self.log("Unzipped.")
-        else:
-            self.log("!!! Destination path is already exist, Skip unzip. (no_unzipOverwrite) !!!")
+        try:
+            memberFilter = None
+            if include is not None or exclude is not None:
+                memberFilter = MemberFilter(include, exclude)
+                self.log(f"Include = {include}, Exclude = {exclude}")
+            signature = self._archiveSignature(zipPath)
+            if signature is not None:
+                self._extractedArchives[destination] = signature
+            exists = os.path.exists(destination)
+            if exists and self._globalOptions.unzipAndOverwrite:
+                if self._globalOptions.incrementalUnzip and zipfile.is_zipfile(zipPath):
+                    # 変更のあったファイルだけ書き直す. 変わっていないファイルの mtime は保たれる.
+                    syncZip(zipPath, destination, jobs=Preference.get().extractJobs, memberFilter=memberFilter,
+                            log=self.log).logSkipped(self.log)
+                    self.log("Unzipped.")
+                    return
+                self.remove(destination)
+                exists = False
+            if exists is False:
+                pref = Preference.get()
+                if signature is not None and pref.sourceCacheMode != "off":
+                    # 同じアーカイブは 1 度だけ展開し, そこから reflink / hardlink で作る.
+                    SourceCache(pref.sourceCacheDirectory, pref.sourceCacheMode).materialize(
+                        zipPath, signature, destination, jobs=pref.extractJobs, memberFilter=memberFilter, log=self.log)
+                else:
+                    extractArchive(zipPath, destination, jobs=pref.extractJobs, memberFilter=memberFilter,
+                                   log=self.log).logSkipped(self.log)
+                self.log("Unzipped.")
+            else:
+                self.log("!!! Destination path is already exist, Skip unzip. (no_unzipOverwrite) !!!")
+        finally:
+            # 展開したアーカイブは gc で消されてもよい.
+            self._releaseBlobLeases(zipPath)
+
+    @_logTask
+    def extractSource(self, destination: str = "src", *,
+                      include: Optional[List[str]] = None, exclude: Optional[List[str]] = None):
+        """ ソースアーカイブを取得して destination に展開する.
+
+        tar (gz, xz, bz2, zst) で blob store に無ければ, ダウンロードしながら展開する.
+        それ以外は downloadSource して unzip するのと同じ.
+        """
+        source = self.getSource(self.version)
+        if source is None:
+            raise BuildError("Source archive is not declared. (sourceUrl, signatures)")
+        url, signature = source
+        dest = self._makeAbspath(destination)
+        exists = os.path.exists(dest)
+        if exists is False or (self._globalOptions.unzipAndOverwrite and not self._globalOptions.incrementalUnzip):
+            from .blob import Blob
+            memberFilter = MemberFilter(include, exclude) if include is not None or exclude is not None else None
+            if exists:
+                self.remove(dest)
+            result = Blob(self).fetchAndExtract(url, signature, dest, memberFilter=memberFilter)
+            if result is not None:
+                self._extractedArchives[dest] = signature.lower()
+                self.log(f"Extracted {result} (streaming)")
+                result.logSkipped(self.log)
+                return
+        self.unzip(self.download(url, signature), destination, include=include, exclude=exclude)
 
     def _executeCommand(self, args: list, *,
                         stdin=None,
                         stdoutBin: bool = False, stderrBin: Optional[str] = False,
                         cwd: Optional[str] = None,
                         env: Optional[dict] = None,
+                        passFds: tuple = (),
                         label: str = ""):
 
         self.log("Commandline: {}".format(" ".join([(c if " " not in c else f'"{c}"') for c in args])))
         self.log("Executing...")
         ret = subprocess.Popen(args,
                                stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                               cwd=cwd, env=env, bufsize=0)
+                               cwd=cwd, env=env, pass_fds=passFds, bufsize=0)
 
         if label != "":
             label = f":{label}"
-        stdout = _IOLogBuffer(ret.stdout, not stdoutBin, lambda t: self.log(f"stdout{label}>{t}"))
-        stderr = _IOLogBuffer(ret.stderr, not stderrBin, lambda t: self.log(f"stderr{label}>{t}"))
+        indent = self._logIndent
+        stdout = _IOLogBuffer(ret.stdout, not stdoutBin, lambda t: self.log(f"stdout{label}>{t}", indent=indent))
+        stderr = _IOLogBuffer(ret.stderr, not stderrBin, lambda t: self.log(f"stderr{label}>{t}", indent=indent))
 
-        import threading
         stdoutTh = threading.Thread(target=lambda: stdout.read())
         stderrTh = threading.Thread(target=lambda: stderr.read())
         stdoutTh.start()
@@ -463,15 +598,25 @@ class BuilderBase:
                                     stdoutEncoding=stdoutEncoding, stderrEncoding=stderrEncoding,
                                     cwd=cwd, env=env, label=label)
 
-    def _cmake(self, args: list, *, label: str = ""):
+    def _cmake(self, args: list, *, label: str = "", env: Optional[dict] = None, passFds: tuple = ()):
         if label != "":
             label = f"cmake:{label}"
         args = [Preference.get().cmakePath] + args
         self.log("Execute cmake command.")
-        if self._executeCommand(args, label=label)[0] != 0:
+        if self._executeCommand(args, label=label, env=env, passFds=passFds)[0] != 0:
             raise BuildError("Failed to cmake.")
         self.log("cmake OK.")
 
+    def _cmakeGenerator(self, buildDir: str) -> Optional[str]:
+        # configure 済みの build directory から実際に使われた generator を取得する.
+        cachePath = os.path.join(buildDir, "CMakeCache.txt")
+        if os.path.exists(cachePath):
+            with open(cachePath, mode="r", encoding="utf-8", errors="replace") as fp:
+                for ln in fp:
+                    if ln.startswith("CMAKE_GENERATOR:"):
+                        return ln.split("=", 1)[1].strip()
+        return Preference.get().generator
+
     @_logTask
     def cmake(self, args: list, *, label: str = ""):
         self._cmake(args, label=label)
@@ -509,7 +654,30 @@ class BuilderBase:
             buildDir = self._makeAbspath(buildDir)
             self.log(f"Build directory = {buildDir}")
             self.log(f"Config = {config}")
-            self._cmake(["--build", buildDir, "--config", config], label=f"build[{config}]")
+            args = ["--build", buildDir, "--config", config]
+            jobServer = JobServer.current()
+            if jobServer is None:
+                self._cmake(args, label=f"build[{config}]")
+                return
+
+            # make は jobserver から直接トークンを取るので, 暗黙の 1 トークンだけ確保する.
+            # それ以外の generator は share 個まで確保し, 確保できた分だけ --parallel で渡す.
+            makeArgs = None
+            generator = self._cmakeGenerator(buildDir)
+            if generator is not None and generator.endswith("Makefiles"):
+                makeArgs = jobServer.makeJobserverArgs()
+            tokens = jobServer.acquire(1 if makeArgs is not None else jobServer.share)
+            try:
+                if makeArgs is not None:
+                    makeEnv, passFds = makeArgs
+                    self.log(f"Jobserver = {makeEnv['MAKEFLAGS']}")
+                    self._cmake(args, label=f"build[{config}]",
+                                env=dict(os.environ, **makeEnv), passFds=passFds)
+                else:
+                    self.log(f"Parallel = {tokens}")
+                    self._cmake(args + ["--parallel", str(tokens)], label=f"build[{config}]")
+            finally:
+                jobServer.release(tokens)
 
     @_logTask
     def cmakeInstall(self, buildDir: str, config: str, prefix: str = ""):
@@ -521,18 +689,62 @@ class BuilderBase:
             self.log(f"Build directory = {buildDir}")
             self.log(f"Install directory = {installDir}")
             self.log(f"Config = {config}")
-            self._cmake(["--install", buildDir, "--config", config, "--prefix", installDir],
-                        label=f"install[{config}]")
+            with self._installLock:
+                self._cmake(["--install", buildDir, "--config", config, "--prefix", installDir],
+                            label=f"install[{config}]")
 
     def cmakeBuildAndInstall(self, buildDir: str, config: str, installPrefix: str = ""):
         self.cmakeBuild(buildDir, config)
         self.cmakeInstall(buildDir, config, installPrefix)
 
+    @_logTask
     def executeBuildAndInstall(self, srcDir: str, configArgs, *,
-                               buildDir: str = "build"):
-        self.cmakeConfigure(srcDir, buildDir, configArgs)
-        for config in ["Debug", "Release"]:
-            self.cmakeBuildAndInstall(buildDir, config)
+                               buildDir: str = "build", installPrefix: str = ""):
+        """ GlobalOptions.configs の全ての config を configure, build, install する.
+
+        multi-config generator では configure を 1 回だけ行い, build directory を共有する.
+        single-config generator では config ごとに <buildDir>/<config> を configure する.
+        GlobalOptions.parallelConfigs が有効な場合は各 config を並列にビルドする.
+        multi-config generator でも build directory を共有すると再生成 (ZERO_CHECK) や config に依らない
+        custom command が同じファイルを書くので, その場合は config ごとに <buildDir>/<config> を
+        CMAKE_CONFIGURATION_TYPES=<config> で configure する.
+        """
+        configs = [c for c in ["Debug", "Release"] if c in self._globalOptions.configs]
+        multiConfig = Preference.get().isMultiConfigGenerator
+        parallel = self._globalOptions.parallelConfigs and len(configs) >= 2
+        self.log(f"Configs = {', '.join(configs)} ({'multi' if multiConfig else 'single'}-config generator)")
+        sharedBuildDir = multiConfig and not parallel
+        if sharedBuildDir:
+            self.cmakeConfigure(srcDir, buildDir, configArgs)
+
+        def _buildConfig(config: str):
+            if sharedBuildDir:
+                self.cmakeBuildAndInstall(buildDir, config, installPrefix)
+                return
+            configBuildDir = f"{buildDir}/{config}"
+            if multiConfig:
+                configTypes = f"-DCMAKE_CONFIGURATION_TYPES={config}"
+                self.cmakeConfigure(srcDir, configBuildDir, list(configArgs) + [configTypes])
+            else:
+                self.cmakeConfigure(srcDir, configBuildDir, configArgs, config=config)
+            self.cmakeBuildAndInstall(configBuildDir, config, installPrefix)
+
+        if parallel:
+            self.log("Build configs in parallel.")
+            indent = self._logIndent
+
+            def _task(config: str):
+                self._logIndent = indent
+                _buildConfig(config)
+
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=len(configs)) as executor:
+                futures = [executor.submit(_task, config) for config in configs]
+            for future in futures:
+                future.result()
+        else:
+            for config in configs:
+                _buildConfig(config)
 
     @_logTask
     def copyFile(self, srcFile: str, destFile: str, *, allowOverwrite=False):
@@ -559,18 +771,69 @@ class BuilderBase:
         self.log(f"-- root dir: {root}")
 
         patchset = patch_ng.fromfile(patchFile)
+        if patchset is False:
+            raise BuildError("Failed to parse patch.")
+        # ソースキャッシュと hardlink で共有しているファイルは, 書き換える前に切り離す.
+        # (patch_ng は元のファイルを chmod してから消すので, 共有したままだとキャッシュ側が変わる)
+        for item in patchset.items:
+            name = resolveTarget(root, item.source, item.target)
+            if name is not None:
+                breakLink(os.path.join(root, name))
         ret = patchset.apply(root=root)
         if ret is False:
             raise BuildError("Failed to apply patch.")
         self.log("Patch applied.")
 
+    def _extractedArchiveOf(self, path: str) -> Optional[Tuple[str, str]]:
+        """ path を含むディレクトリに展開したアーカイブの signature と, そこからの相対パスを返す. """
+        for destination, signature in self._extractedArchives.items():
+            if os.path.commonpath([path, destination]) == destination:
+                return signature, os.path.relpath(path, destination)
+        return None
+
     @_logTask
     def applyPatches(self, patchRoot: str, targetRoot: str):
+        """ patchRoot 以下の全ての *.patch を targetRoot に当てる.
+
+        パッチは全て当たるか, 1 つも当たらないかのどちらかになる.
+        既に同じパッチの組を当てた状態であれば何もしない. 展開したアーカイブに当てる場合は,
+        (アーカイブの hash, パッチの組の hash) ごとに当てた結果を保存しておき, 次からはそれを書き戻す.
+        """
         patchRoot = os.path.abspath(patchRoot)
-        patchFiles = glob.glob(f"{patchRoot}/**/*.patch", recursive=True)
+        targetRoot = self._makeAbspath(targetRoot)
+        patchFiles = sorted(glob.glob(f"{patchRoot}/**/*.patch", recursive=True))
         self.log(f"{len(patchFiles)} files to patch.")
-        for patchFile in patchFiles:
-            self.applyPatch(patchFile, targetRoot)
+        if not patchFiles:
+            return
+
+        patchSet = patchSetDigest(patchRoot, patchFiles)
+        state = PatchState(self.buildDir)
+        if state.isPatched(targetRoot, patchSet):
+            self.log("Already patched. Skip.")
+            return
+
+        pref = Preference.get()
+        snapshots = PatchSnapshotCache(pref.sourceCacheDirectory)
+        archive = self._extractedArchiveOf(targetRoot)
+        if archive is not None:
+            patched = snapshots.restore(archive[0], patchSet, archive[1], targetRoot)
+            if patched is not None:
+                self.log("Restored patched files from the snapshot.")
+                state.save(targetRoot, patchSet, patched)
+                return
+
+        # 全てのパッチを先に解析し, 書き換えるファイルごとに当てる.
+        # 当たらないパッチがあれば何も書き換えずに失敗する.
+        patcher = BatchPatcher(targetRoot, patchFiles)
+        targets = patcher.targets
+        original = hashTargets(targetRoot, targets)
+        self.log(f"Patch applying... ({len(targets)} target files)")
+        count = patcher.apply()
+        self.log(f"Patch applied. {count} files changed.")
+        patched = hashTargets(targetRoot, targets)
+        state.save(targetRoot, patchSet, patched)
+        if archive is not None:
+            snapshots.store(archive[0], patchSet, archive[1], targetRoot, original, patched)
 
 
 class _Dummy:
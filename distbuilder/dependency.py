@@ -1,6 +1,6 @@
 from typing import Callable, Union, Optional
 from .functions import searchBuilderAndPath
-from .version import Version
+from .version import Version, VersionSpec
 from .errors import BuildError
 from .global_options import GlobalOptions
 
@@ -21,6 +21,8 @@ class Dependency:
         self._versionMinor: str = versionMinor
         self._versionPatch: str = versionPatch
         self._overrideOptions: dict = overrideOptions if overrideOptions else dict()
+        # 範囲の文字列は一度だけ読む. copy() でも共有する.
+        self._versionSpec: VersionSpec = VersionSpec.parse(versionVariant, versionMajor, versionMinor, versionPatch)
         self._builder: Optional[BuilderBase] = None
 
     @property
@@ -31,6 +33,15 @@ class Dependency:
     def overrideOptions(self) -> dict:
         return self._overrideOptions.copy()
 
+    @property
+    def versionRange(self) -> str:
+        """ variant.major.minor.patch の制約. 例: "*.*.2-7.*" """
+        return f"{self._versionVariant}.{self._versionMajor}.{self._versionMinor}.{self._versionPatch}"
+
+    @property
+    def versionSpec(self) -> VersionSpec:
+        return self._versionSpec
+
     @property
     def hash(self) -> Optional[str]:
         if self._builder is not None:
@@ -46,14 +57,10 @@ class Dependency:
         self._builder.updateHash()
 
     def copy(self):
-        dep = Dependency(self._libraryName,
-                         condition=self._condition,
-                         versionVariant=self._versionVariant,
-                         versionMajor=self._versionMajor,
-                         versionMinor=self._versionMinor,
-                         versionPatch=self._versionPatch,
-                         overrideOptions=self._overrideOptions.copy())
-        dep._builder = self._builder
+        # builder ごとに全ての dependency を複製するので, 範囲の文字列は読み直さない.
+        dep = Dependency.__new__(Dependency)
+        dep.__dict__.update(self.__dict__)
+        dep._overrideOptions = self._overrideOptions.copy()
         return dep
 
     def searchBuilderClass(self):
@@ -73,7 +80,7 @@ class Dependency:
         return condition
 
     def isSuitableVersion(self, version: Version) -> bool:
-        return version.match(self._versionVariant, self._versionMajor, self._versionMinor, self._versionPatch)
+        return self._versionSpec.contains(version)
 
     # def resolve(self, builder):
     #     # 条件に合致するライブラリを見つける
@@ -8,14 +8,34 @@ class GlobalOptions:
                  createDirectory: bool = False,
                  unzipAndOverwrite: bool = True,
                  ignoreScriptVersion: bool = False,
+                 parallelConfigs: bool = False,
+                 paranoid: bool = False,
+                 incrementalUnzip: bool = False,
                  configs: Iterable[str] = ("Debug", "Release")):
         self._cleanBuild = cleanBuild
         self._forceDownload = forceDownload
         self._createDirectory = createDirectory
         self._unzipAndOverwrite = unzipAndOverwrite
         self._ignoreScriptVersion = ignoreScriptVersion
+        self._parallelConfigs = parallelConfigs
+        self._paranoid = paranoid
+        self._incrementalUnzip = incrementalUnzip
         self._configs: Set[str] = set(configs)
 
+    def replace(self, **kwargs) -> "GlobalOptions":
+        """ 一部の値を置き換えた GlobalOptions を作る. """
+        values = dict(cleanBuild=self._cleanBuild,
+                      forceDownload=self._forceDownload,
+                      createDirectory=self._createDirectory,
+                      unzipAndOverwrite=self._unzipAndOverwrite,
+                      ignoreScriptVersion=self._ignoreScriptVersion,
+                      parallelConfigs=self._parallelConfigs,
+                      paranoid=self._paranoid,
+                      incrementalUnzip=self._incrementalUnzip,
+                      configs=self._configs)
+        values.update(kwargs)
+        return GlobalOptions(**values)
+
     @property
     def cleanBuild(self) -> bool:
         return self._cleanBuild
@@ -36,6 +56,18 @@ class GlobalOptions:
     def ignoreScriptVersion(self) -> bool:
         return self._ignoreScriptVersion
 
+    @property
+    def parallelConfigs(self) -> bool:
+        return self._parallelConfigs
+
+    @property
+    def paranoid(self) -> bool:
+        return self._paranoid
+
+    @property
+    def incrementalUnzip(self) -> bool:
+        return self._incrementalUnzip
+
     @property
     def config(self) -> str:
         # 廃止予定.
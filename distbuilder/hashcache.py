@@ -0,0 +1,137 @@
+import os
+import json
+import atexit
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from .preference import Preference
+
+
+# hashData の形式を変えたら上げる. 違う形式の記録は使わない.
+_FORMAT = 1
+# これより新しい build.py は, 同じ mtime のまま書き換えられる可能性があるので保存しない.
+_RACY_SECONDS = 2.0
+
+_lock = threading.Lock()
+# build root の hashcache.json の内容. {"format", "signatures": {path: [mtime_ns, size, signature]}}
+_cache: Optional[dict] = None
+# まだ hashcache.json に書いていない記録.
+_pendingSignatures: Dict[str, List] = dict()
+# (libraryName, scriptSignature, version, options, deps) -> hash. プロセス内だけで覚える.
+# (保存しても, 引くためのキーを作るのに hashData を作るのと同じくらいかかる)
+_builderHashes: Dict[tuple, str] = dict()
+
+HashInputs = Tuple[str, str, str, Tuple[Tuple[str, str], ...], Tuple[Tuple[str, str], ...]]
+
+
+def _cachePath() -> Optional[str]:
+    pref = getattr(Preference, "_instance", None)
+    if pref is None:
+        return None
+    return os.path.join(pref.buildRootDirectory, "hashcache.json")
+
+
+def _load(path: Optional[str]) -> dict:
+    cache = None
+    if path is not None:
+        try:
+            with open(path, mode="r", encoding="utf-8") as fp:
+                cache = json.load(fp)
+        except (OSError, ValueError):
+            pass
+    if not isinstance(cache, dict) or cache.get("format") != _FORMAT:
+        cache = dict(format=_FORMAT, signatures=dict())
+    return cache
+
+
+def _loaded() -> dict:
+    global _cache
+    if _cache is None:
+        _cache = _load(_cachePath())
+    return _cache
+
+
+def flush():
+    """ 計算した signature を hashcache.json に書く. 終了時にも呼ばれる. """
+    from .blob import _FileLock, _writeJson
+    with _lock:
+        path = _cachePath()
+        if path is None or not _pendingSignatures:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock = _FileLock(f"{path}.lock")
+        lock.acquire()
+        try:
+            # 他のプロセスが書いた分を消さないように, 読み直してから書く.
+            cache = _load(path)
+            cache["signatures"].update(_pendingSignatures)
+            # 以前は builder hash も保存していた.
+            cache.pop("hashes", None)
+            _writeJson(path, cache)
+            _pendingSignatures.clear()
+        finally:
+            lock.release()
+
+
+atexit.register(flush)
+
+
+def _computeScriptSignature(path: str) -> str:
+    # 空行, コメント行は全てカットする.
+    script = ""
+    with open(path, mode="r", encoding="utf-8") as fp:
+        scriptLines = fp.readlines()
+
+    for ln in scriptLines:
+        lnn = ln.strip()
+        if lnn == "" or lnn.startswith("#"):
+            continue
+        script += ln.rstrip() + "\n"
+    return hashlib.sha256(script.encode()).hexdigest()
+
+
+def scriptSignature(path: str) -> str:
+    """ build.py の signature (空行とコメント行を除いた内容の sha256).
+
+    (path, mtime_ns, size) が同じなら build root の hashcache.json に記録した値を使い, ファイルを読まない.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    with _lock:
+        signatures = _loaded()["signatures"]
+        record = signatures.get(path)
+        if record is not None and record[0] == stat.st_mtime_ns and record[1] == stat.st_size:
+            return record[2]
+
+        signature = _computeScriptSignature(path)
+        record = [stat.st_mtime_ns, stat.st_size, signature]
+        signatures[path] = record
+        if time.time() - stat.st_mtime_ns / 1e9 > _RACY_SECONDS:
+            _pendingSignatures[path] = record
+        return signature
+
+
+def builderHashData(inputs: HashInputs) -> str:
+    """ hash の元になる文字列. info.json にも書かれる. """
+    libraryName, scriptSignature, version, options, deps = inputs
+    jobj = OrderedDict(
+        libraryName=libraryName,
+        scriptSignature=scriptSignature,
+        version=version,
+        options=[OrderedDict(key=k, value=v) for k, v in options],
+        deps=[OrderedDict(libraryName=name, hash=h) for name, h in deps],
+    )
+    return json.dumps(jobj, indent=2, ensure_ascii=False)
+
+
+def builderHash(inputs: HashInputs) -> str:
+    """ builderHashData(inputs) の md5. 同じ inputs の hash はプロセス内で覚えておき, hashData を作り直さない. """
+    with _lock:
+        cached = _builderHashes.get(inputs)
+    if cached is None:
+        cached = hashlib.md5(builderHashData(inputs).encode()).hexdigest()
+        with _lock:
+            _builderHashes[inputs] = cached
+    return cached
@@ -0,0 +1,174 @@
+import os
+import math
+import tempfile
+from typing import Optional, Tuple
+
+
+def availableCpuCount() -> int:
+    """ 使用可能な CPU 数を取得. cgroup の CPU quota があればそれを優先する. """
+    count = os.cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):
+        count = len(os.sched_getaffinity(0))
+
+    quota = None
+    try:
+        # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max", mode="r", encoding="utf-8") as fp:
+            q, period = fp.read().split()
+            if q != "max":
+                quota = int(q) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", mode="r", encoding="utf-8") as fp:
+                q = int(fp.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", mode="r", encoding="utf-8") as fp:
+                period = int(fp.read())
+            if q > 0:
+                quota = q / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        count = min(count, max(1, math.ceil(quota)))
+    return max(1, count)
+
+
+class JobServer:
+    """ 全ての cmake --build で共有する CPU トークンプール.
+
+    POSIX では GNU make 互換の jobserver (fifo) として振る舞い, make は MAKEFLAGS 経由で
+    直接トークンを取り合う. それ以外 (MSBuild, Ninja, Windows) はトークンを python 側で確保し,
+    確保した数を --parallel に渡す. --parallel はビルド中に変えられないので, 同時に走っている
+    cmake --build がどれも止まらないように, 1 回に確保するのは share 個までにする.
+    """
+
+    _current: Optional["JobServer"] = None
+
+    def __init__(self, slots: int):
+        self._slots = max(1, slots)
+        # 今走っている cmake --build の数の見込み. start で作り, 全てのプロセスで共有する.
+        self._builders = None
+        self._fifoPath: Optional[str] = None
+        self._semaphore = None
+        self._readFd: Optional[int] = None
+        self._writeFd: Optional[int] = None
+        self._pollFd: Optional[int] = None
+        self._owner = False
+
+    def __getstate__(self):
+        # fd はプロセスを跨げないので, fifo のパスだけ渡して子プロセスで開き直す.
+        return dict(_slots=self._slots, _builders=self._builders, _fifoPath=self._fifoPath,
+                    _semaphore=self._semaphore)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._readFd = None
+        self._writeFd = None
+        self._pollFd = None
+        self._owner = False
+
+    @property
+    def slots(self) -> int:
+        return self._slots
+
+    @property
+    def share(self) -> int:
+        """ --parallel を使う cmake --build 1 回あたりに確保するトークンの上限. """
+        builders = self._builders.value if self._builders is not None else 1
+        return max(1, self._slots // max(1, builders))
+
+    def setBuilders(self, count: int):
+        """ 同時に走っている cmake --build の数を設定する. これから始まるビルドの share が変わる. """
+        if self._builders is not None:
+            self._builders.value = count
+
+    @classmethod
+    def current(cls) -> Optional["JobServer"]:
+        return cls._current
+
+    def attach(self):
+        """ このプロセスの cmake --build が使う JobServer として登録する. """
+        JobServer._current = self
+
+    def start(self):
+        import multiprocessing
+        # ワーカーは spawn で起動されるので, 同じ context で作る.
+        self._builders = multiprocessing.get_context("spawn").Value("i", 1)
+        if os.name == "posix":
+            dirpath = tempfile.mkdtemp(prefix="distbuilder-jobserver-")
+            self._fifoPath = os.path.join(dirpath, "fifo")
+            os.mkfifo(self._fifoPath, 0o600)
+            self._open()
+            os.write(self._writeFd, b"+" * self._slots)
+        else:
+            self._semaphore = multiprocessing.BoundedSemaphore(self._slots)
+        self._owner = True
+
+    def close(self):
+        if self._readFd is not None:
+            os.close(self._readFd)
+            os.close(self._writeFd)
+            os.close(self._pollFd)
+            self._readFd = None
+            self._writeFd = None
+            self._pollFd = None
+        if self._owner and self._fifoPath is not None:
+            os.remove(self._fifoPath)
+            os.rmdir(os.path.dirname(self._fifoPath))
+            self._fifoPath = None
+        if JobServer._current is self:
+            JobServer._current = None
+
+    def __enter__(self):
+        self.start()
+        self.attach()
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _open(self):
+        if self._readFd is None:
+            # O_RDWR で開くと書き手が居なくても block しない.
+            self._readFd = os.open(self._fifoPath, os.O_RDWR)
+            self._writeFd = os.open(self._fifoPath, os.O_WRONLY)
+            # 追加トークンの試し取り用. blocking の fd と共有すると他スレッドと競合する.
+            self._pollFd = os.open(self._fifoPath, os.O_RDWR | os.O_NONBLOCK)
+
+    def _take(self, block: bool) -> bool:
+        if self._semaphore is not None:
+            return self._semaphore.acquire(block=block)
+        self._open()
+        try:
+            return len(os.read(self._readFd if block else self._pollFd, 1)) == 1
+        except BlockingIOError:
+            return False
+
+    def acquire(self, maxTokens: int) -> int:
+        """ トークンを 1 つ以上, 最大 maxTokens まで確保する. 最初の 1 つは空くまで待つ. """
+        self._take(True)
+        count = 1
+        while count < maxTokens and self._take(False):
+            count += 1
+        return count
+
+    def release(self, count: int):
+        if self._semaphore is not None:
+            for _ in range(count):
+                self._semaphore.release()
+        else:
+            self._open()
+            os.write(self._writeFd, b"+" * count)
+
+    def makeJobserverArgs(self) -> Optional[Tuple[dict, Tuple[int, int]]]:
+        """ GNU make を jobserver client として起動するための MAKEFLAGS と引き継ぐ fd を返す.
+
+        make は自身で暗黙のトークンを 1 つ持つため, 呼び出し側で 1 つ acquire しておくこと.
+        """
+        if self._fifoPath is None:
+            return None
+        self._open()
+        auth = f"{self._readFd},{self._writeFd}"
+        makeflags = f"-j{self._slots} --jobserver-fds={auth} --jobserver-auth={auth}"
+        return (dict(MAKEFLAGS=makeflags), (self._readFd, self._writeFd))
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import threading
+import urllib.parse
+from typing import List
+from .preference import Preference
+
+
+# 推定時間の計算に使うアーカイブの大きさ.
+_ESTIMATE_SIZE = 16 * 1024 * 1024
+# 直近で失敗したミラーを後回しにする期間 (秒)
+_FAILURE_PENALTY = 60 * 60
+# 移動平均の重み
+_ALPHA = 0.3
+
+
+def candidateUrls(url: str, signature: str) -> List[str]:
+    """ url の取得元候補を preference の順に列挙する. 元の url は最後に置く.
+
+    [[mirror.rewrite]] の from で始まる url は, to (文字列もしくはリスト) に置き換えた url が候補になる.
+    [mirror] urls の各要素は {url}, {filename}, {signature} を置き換えた url が候補になる.
+    アーカイブは sha256 で検証されるので, 同じ内容を返すミラーならどれを使ってもよい.
+    """
+    cfg = Preference.get().mirror
+    filename = os.path.basename(urllib.parse.urlparse(url).path)
+
+    candidates = list()
+    for rule in cfg.get("rewrite", list()):
+        prefix = rule["from"]
+        if url.startswith(prefix):
+            targets = rule["to"] if isinstance(rule["to"], list) else [rule["to"]]
+            candidates.extend(target + url[len(prefix):] for target in targets)
+    for template in cfg.get("urls", list()):
+        candidates.append(template.format(url=url, filename=filename, signature=signature.lower()))
+    candidates.append(url)
+
+    # 重複は最初のものを残す.
+    return list(dict.fromkeys(candidates))
+
+
+def _origin(url: str) -> str:
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == "file":
+        return f"file://{os.path.dirname(parsed.path)}"
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+def _estimate(record: dict) -> float | None:
+    if "throughput" not in record:
+        return None
+    return record["latency"] + _ESTIMATE_SIZE / max(record["throughput"], 1.0)
+
+
+class MirrorStats:
+    """ ミラー (scheme://host 単位) ごとの latency, throughput, 失敗回数を記録し, 取得元の順位付けに使う.
+
+    blob root の mirrors.json に保存され, 実行を跨いで引き継がれる.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self._path = os.path.join(Preference.get().blobRootDirectory, "mirrors.json")
+
+    def _load(self) -> dict:
+        try:
+            with open(self._path, mode="r", encoding="utf-8") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return dict()
+
+    def _update(self, url: str, func):
+        from .blob import _FileLock, _writeJson
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with MirrorStats._lock:
+            lock = _FileLock(f"{self._path}.lock")
+            lock.acquire()
+            try:
+                stats = self._load()
+                record = stats.setdefault(_origin(url), dict())
+                func(record)
+                _writeJson(self._path, stats)
+            finally:
+                lock.release()
+
+    def estimate(self, url: str) -> float | None:
+        """ _ESTIMATE_SIZE の取得にかかる推定時間 (秒). 統計が無ければ None. """
+        return _estimate(self._load().get(_origin(url), dict()))
+
+    def rank(self, urls: List[str]) -> List[str]:
+        """ 直近で失敗していないもの, 推定時間の短いものの順に並べる.
+
+        統計の無いものは計測済みのものより先に置き, 一度は試して計測する. 同順位のものは preference の順を保つ.
+        """
+        stats = self._load()
+        now = time.time()
+
+        def _key(url: str):
+            record = stats.get(_origin(url), dict())
+            failing = record.get("failures", 0) > 0 and now - record.get("lastFailure", 0) < _FAILURE_PENALTY
+            estimate = _estimate(record)
+            return (failing, estimate is not None, estimate if estimate is not None else 0.0)
+
+        return sorted(urls, key=_key)
+
+    def recordSuccess(self, url: str, latency: float, size: int, elapsed: float):
+        throughput = size / max(elapsed - latency, 1e-6)
+
+        def _apply(record: dict):
+            if "throughput" in record:
+                record["latency"] = (1 - _ALPHA) * record["latency"] + _ALPHA * latency
+                record["throughput"] = (1 - _ALPHA) * record["throughput"] + _ALPHA * throughput
+            else:
+                record["latency"] = latency
+                record["throughput"] = throughput
+            record["failures"] = 0
+            record["lastSuccess"] = time.time()
+        self._update(url, _apply)
+
+    def recordFailure(self, url: str):
+        """ 接続できない, timeout, 途中で切断されたなど, 取得元自体の失敗を記録する.
+
+        404 のようにその url だけが無い場合は呼ばない. 一時的な欠落で他のファイルまで後回しにしないため.
+        """
+        def _apply(record: dict):
+            record["failures"] = record.get("failures", 0) + 1
+            record["lastFailure"] = time.time()
+        self._update(url, _apply)
@@ -0,0 +1,293 @@
+import os
+import json
+import shutil
+import hashlib
+from typing import Dict, List, Optional
+from .errors import BuildError
+
+
+def hashFile(path: str) -> Optional[str]:
+    """ ファイルの sha256. 存在しなければ None. """
+    if not os.path.isfile(path):
+        return None
+    with open(path, mode="rb") as fp:
+        return hashlib.file_digest(fp, "sha256").hexdigest()
+
+
+def patchSetDigest(patchRoot: str, patchFiles: List[str]) -> str:
+    """ パッチの組 (相対パスと内容) の sha256. """
+    hasher = hashlib.sha256()
+    for patchFile in sorted(patchFiles):
+        hasher.update(os.path.relpath(patchFile, patchRoot).replace(os.sep, "/").encode("utf-8") + b"\0")
+        with open(patchFile, mode="rb") as fp:
+            hasher.update(hashlib.sha256(fp.read()).digest())
+    return hasher.hexdigest()
+
+
+def resolveTarget(root: str, source: bytes, target: bytes) -> Optional[str]:
+    """ パッチの 1 ファイル分が実際に書き換えるファイル (root からの相対パス).
+
+    patch_ng.PatchSet.findfiles と同じ規則で a/, b/ の付いた名前を解決する.
+    """
+    def _exists(name: bytes) -> bool:
+        return os.path.exists(os.path.join(root, name.decode("utf-8")))
+
+    if source == b"/dev/null":
+        return target.decode("utf-8")
+    for name in (source, target):
+        if name != b"/dev/null" and _exists(name):
+            return name.decode("utf-8")
+    if source.startswith(b"a/") and target.startswith(b"b/"):
+        for name in (source[2:], target[2:]):
+            if _exists(name):
+                return name.decode("utf-8")
+    return None
+
+
+def hashTargets(root: str, targets: List[str]) -> Dict[str, Optional[str]]:
+    return {target: hashFile(os.path.join(root, target)) for target in targets}
+
+
+class PatchState:
+    """ buildDir/patches.json. パッチを当てたディレクトリごとに, パッチの組と当てた後のファイルの hash を記録する. """
+
+    def __init__(self, buildDir: str):
+        self._path = os.path.join(buildDir, "patches.json")
+
+    def _load(self) -> dict:
+        try:
+            with open(self._path, mode="r", encoding="utf-8") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return dict()
+
+    def isPatched(self, root: str, patchSet: str) -> bool:
+        """ root が patchSet を当てた状態のままかどうか, ファイルの hash で確かめる. """
+        state = self._load().get(root)
+        if state is None or state["patchSet"] != patchSet:
+            return False
+        return hashTargets(root, list(state["files"].keys())) == state["files"]
+
+    def save(self, root: str, patchSet: str, files: Dict[str, Optional[str]]):
+        from .blob import _writeJson
+        states = self._load()
+        states[root] = dict(patchSet=patchSet, files=files)
+        _writeJson(self._path, states)
+
+
+class PatchSnapshotCache:
+    """ (アーカイブの hash, パッチの組の hash) ごとに, パッチを当てた後のファイルを保持する.
+
+    パッチの当たるファイルだけを保存し, 元のファイルの hash が一致する場合に限って置き換える.
+    """
+
+    def __init__(self, root: str):
+        self._root = os.path.join(root, "_patched")
+
+    def _path(self, archiveSignature: str, patchSet: str, relRoot: str) -> str:
+        key = hashlib.sha256(json.dumps([patchSet, relRoot.replace(os.sep, "/")]).encode("utf-8")).hexdigest()
+        return os.path.join(self._root, archiveSignature[0:2], f"{archiveSignature}-{key[:16]}")
+
+    def restore(self, archiveSignature: str, patchSet: str, relRoot: str, root: str) -> Optional[dict]:
+        """ スナップショットがあれば root に書き戻し, パッチを当てた後のファイルの hash を返す. 無ければ None. """
+        from .blob import _FileLock
+        path = self._path(archiveSignature, patchSet, relRoot)
+        if not os.path.exists(f"{path}.json"):
+            return None
+        lock = _FileLock(f"{path}.lock")
+        lock.acquire()
+        try:
+            return self._restore(path, root)
+        finally:
+            lock.release()
+
+    def _restore(self, path: str, root: str) -> Optional[dict]:
+        try:
+            with open(f"{path}.json", mode="r", encoding="utf-8") as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if hashTargets(root, list(manifest["original"].keys())) != manifest["original"]:
+            # アーカイブから展開したままの状態ではない.
+            return None
+
+        for target, digest in manifest["patched"].items():
+            dst = os.path.join(root, target)
+            if digest is None:
+                if os.path.exists(dst):
+                    os.remove(dst)
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            # ソースキャッシュと hardlink で共有している場合があるので, 上書きせずに置き換える.
+            tmpPath = f"{dst}.{os.getpid()}.tmp"
+            shutil.copy(os.path.join(path, target), tmpPath)
+            os.replace(tmpPath, dst)
+        return manifest["patched"]
+
+    def store(self, archiveSignature: str, patchSet: str, relRoot: str, root: str,
+              original: Dict[str, Optional[str]], patched: Dict[str, Optional[str]]):
+        from .blob import _FileLock
+        path = self._path(archiveSignature, patchSet, relRoot)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock = _FileLock(f"{path}.lock")
+        lock.acquire()
+        try:
+            self._store(path, root, original, patched)
+        finally:
+            lock.release()
+
+    def _store(self, path: str, root: str, original: Dict[str, Optional[str]], patched: Dict[str, Optional[str]]):
+        from .blob import _writeJson
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+        if os.path.exists(tmpPath):
+            shutil.rmtree(tmpPath)
+        for target, digest in patched.items():
+            if digest is not None:
+                os.makedirs(os.path.dirname(os.path.join(tmpPath, target)), exist_ok=True)
+                shutil.copy(os.path.join(root, target), os.path.join(tmpPath, target))
+        os.makedirs(tmpPath, exist_ok=True)
+        if os.path.exists(f"{path}.json"):
+            os.remove(f"{path}.json")
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmpPath, path)
+        # manifest を最後に書くので, 途中で止まったものは使われない.
+        _writeJson(f"{path}.json", dict(original=original, patched=patched))
+
+
+class _FilePatch:
+    """ 1 つのファイルに当てるパッチ (patchFile, patch_ng の item) の列. パッチファイルの順に当てる. """
+
+    def __init__(self, target: str):
+        self.target = target
+        self.items = list()
+        self.content: Optional[bytes] = None
+        self.delete = False
+        self.errors: List[str] = list()
+
+
+def _hunkHeader(hunk) -> str:
+    return f"@@ -{hunk.startsrc},{hunk.linessrc} +{hunk.starttgt},{hunk.linestgt} @@"
+
+
+def _matchHunks(lines: List[bytes], hunks, prefixes: bytes, startOf) -> Optional[tuple]:
+    """ hunks の prefixes で始まる行が, 各 hunk の startOf(hunk) 行目から lines と一致するか.
+
+    一致しない最初の hunk について (index, hunk, 期待する行, 実際の行) を返す. 全て一致すれば None.
+    """
+    for index, hunk in enumerate(hunks):
+        find = [h[1:].rstrip(b"\r\n") for h in hunk.text if h[0:1] in prefixes]
+        start = max(startOf(hunk) - 1, 0)
+        actual = [line.rstrip(b"\r\n") for line in lines[start:start + len(find)]]
+        if actual != find:
+            return index, hunk, find, actual
+    return None
+
+
+class BatchPatcher:
+    """ 複数のパッチをまとめて当てる.
+
+    全てのパッチを先に解析して書き換えるファイルごとにまとめ, ファイル単位で当てる.
+    全てのファイルをメモリ上で当て終えて問題が無い場合に限って書き込むので,
+    どれかが当たらなければ (同じファイルを書き換える別のパッチと衝突した場合を含む) 何も変更せずに失敗する.
+    """
+
+    def __init__(self, root: str, patchFiles: List[str]):
+        import patch_ng
+        self._root = root
+        self._files: Dict[str, _FilePatch] = dict()
+        self._patchRoot = os.path.commonpath(patchFiles) if len(patchFiles) > 1 else os.path.dirname(patchFiles[0])
+        for patchFile in patchFiles:
+            patchset = patch_ng.fromfile(patchFile)
+            if patchset is False:
+                raise BuildError(f"Failed to parse patch. {patchFile}")
+            for item in patchset.items:
+                target = resolveTarget(root, item.source, item.target)
+                if target is None:
+                    raise BuildError(f"Patch target is not found. {item.target.decode('utf-8')} ({patchFile})")
+                self._files.setdefault(target, _FilePatch(target)).items.append((patchFile, item))
+
+    @property
+    def targets(self) -> List[str]:
+        return sorted(self._files.keys())
+
+    def _name(self, patchFile: str) -> str:
+        return os.path.relpath(patchFile, self._patchRoot)
+
+    def _patchFile(self, filePatch: _FilePatch):
+        import io
+        import patch_ng
+        path = os.path.join(self._root, filePatch.target)
+        content = b""
+        if os.path.exists(path):
+            with open(path, mode="rb") as fp:
+                content = fp.read()
+
+        applied = list()
+        for patchFile, item in filePatch.items:
+            lines = content.splitlines(keepends=True)
+            mismatch = _matchHunks(lines, item.hunks, b" -", lambda h: h.startsrc)
+            if mismatch is not None:
+                # 既に当たっている (当てた後の行が並んでいる) なら何もしない. patch_ng と同じ判定.
+                if os.path.exists(path) and not applied \
+                        and _matchHunks(lines, item.hunks, b" +", lambda h: h.starttgt) is None:
+                    continue
+                index, hunk, find, actual = mismatch
+                error = [f"{filePatch.target}: {self._name(patchFile)} hunk #{index + 1} {_hunkHeader(hunk)} "
+                         f"does not match at line {hunk.startsrc}."]
+                for e, a in zip(find, actual + [b"<EOF>"] * (len(find) - len(actual))):
+                    if e != a:
+                        error.append(f"   expected: {e.decode('utf-8', 'replace')}")
+                        error.append(f"   actual  : {a.decode('utf-8', 'replace')}")
+                        break
+                # 先に当てたパッチのうち, 書き換えた行がこの hunk の範囲に掛かるもの.
+                begin, end = hunk.startsrc, hunk.startsrc + max(hunk.linessrc, 1)
+                for other, otherItem in applied:
+                    overlaps = [h for h in otherItem.hunks
+                                if h.starttgt < end and begin < h.starttgt + max(h.linestgt, 1)]
+                    if overlaps:
+                        ranges = ", ".join(_hunkHeader(h) for h in overlaps)
+                        error.append(f"   conflicts with {self._name(other)} applied before: {ranges}")
+                filePatch.errors.append("\n".join(error))
+                return
+
+            stream = patch_ng.PatchSet().patch_stream(io.BytesIO(content), item.hunks)
+            content = b"".join(stream)
+            applied.append((patchFile, item))
+
+        if applied:
+            # 最後のパッチの target が /dev/null ならファイルを削除する.
+            filePatch.delete = applied[-1][1].target == b"/dev/null"
+            filePatch.content = None if filePatch.delete else content
+
+    def _write(self, filePatch: _FilePatch):
+        path = os.path.join(self._root, filePatch.target)
+        if filePatch.delete:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        if filePatch.content is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 上書きせずに置き換えるので, ソースキャッシュと hardlink で共有していても影響しない.
+        tmpPath = f"{path}.{os.getpid()}.patching"
+        with open(tmpPath, mode="wb") as fp:
+            fp.write(filePatch.content)
+        if os.path.exists(path):
+            shutil.copymode(path, tmpPath)
+        os.replace(tmpPath, path)
+
+    def apply(self) -> int:
+        """ 全てのパッチを当てて, 書き換えたファイル数を返す. 当たらないものがあれば何も書き込まずに BuildError. """
+        # 行の照合も patch_stream も pure python なので, スレッドに分けても速くならない.
+        filePatches = list(self._files.values())
+        for filePatch in filePatches:
+            self._patchFile(filePatch)
+
+        errors = [e for f in filePatches for e in f.errors]
+        if errors:
+            raise BuildError(f"Failed to apply {len(errors)} patches. Nothing was written.\n" + "\n".join(errors))
+
+        for filePatch in filePatches:
+            self._write(filePatch)
+        return sum(1 for f in filePatches if f.content is not None or f.delete)
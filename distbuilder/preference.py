@@ -3,12 +3,22 @@ from typing import List
 
 
 class Preference:
-    def __init__(self, cfg):
+    def __init__(self, cfg, path: str = None):
         self._cfg = cfg
+        self._path = os.path.abspath(path) if path is not None else None
 
         self._root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
         self._buildDirectory = os.path.abspath(self._cfg["directory"]["build"])
         self._installDirectory = os.path.abspath(self._cfg["directory"]["install"])
+        # ソースアーカイブの保存先. 複数の build root やプロセスで共有できる.
+        self._blobDirectory = os.path.abspath(self._cfg["directory"]["blob"]) \
+            if "blob" in self._cfg["directory"] else os.path.join(self._buildDirectory, "_blob")
+        # アーカイブごとに 1 つだけ展開しておくソースツリーの保存先. build の src と同じファイルシステムに置く.
+        self._sourceCacheDirectory = os.path.abspath(self._cfg["directory"]["sourceCache"]) \
+            if "sourceCache" in self._cfg["directory"] else os.path.join(self._buildDirectory, "_src")
+        # 他の install root などビルド済みの成果物の置き場所. 同じ hash があればビルドせずにコピーする.
+        self._artifactCacheDirectories = [os.path.abspath(p)
+                                          for p in self._cfg["directory"].get("artifactCaches", list())]
         self._sourceDirectories = [os.path.join(self._root, "libs")] \
             + [os.path.abspath(p) for p in self._cfg["directory"]["sources"]]
 
@@ -17,6 +27,10 @@ class Preference:
         os.makedirs(self._buildDirectory, exist_ok=True)
         os.makedirs(self._installDirectory, exist_ok=True)
 
+    @property
+    def path(self) -> str | None:
+        return self._path
+
     @property
     def buildRootDirectory(self) -> str:
         return self._buildDirectory
@@ -25,6 +39,18 @@ class Preference:
     def installRootDirectory(self) -> str:
         return self._installDirectory
 
+    @property
+    def blobRootDirectory(self) -> str:
+        return self._blobDirectory
+
+    @property
+    def sourceCacheDirectory(self) -> str:
+        return self._sourceCacheDirectory
+
+    @property
+    def artifactCacheDirectories(self) -> List[str]:
+        return self._artifactCacheDirectories.copy()
+
     @property
     def sourceDirectories(self) -> List[str]:
         return self._sourceDirectories.copy()
@@ -33,6 +59,15 @@ class Preference:
     def generator(self) -> str:
         return self._cfg["cmake"].get("generator")
 
+    @property
+    def isMultiConfigGenerator(self) -> bool:
+        generator = self.generator
+        if generator is None:
+            # 未指定の場合, Windows は Visual Studio, それ以外は Unix Makefiles が使われる.
+            import platform
+            return platform.system() == "Windows"
+        return generator.startswith("Visual Studio") or generator in ("Xcode", "Ninja Multi-Config")
+
     @property
     def architecture(self) -> str | None:
         return self._cfg["cmake"].get("arch", None)
@@ -41,11 +76,57 @@ class Preference:
     def cmakePath(self) -> str:
         return self._cfg["cmake"].get("path", "cmake")
 
+    @property
+    def parallel(self) -> int | None:
+        return self._cfg["cmake"].get("parallel", None)
+
+    @property
+    def blobMaxSize(self) -> int | None:
+        from .blob import parseSize
+        value = self._cfg.get("blob", dict()).get("maxSize", None)
+        return parseSize(value) if value is not None else None
+
+    @property
+    def blobAutoGc(self) -> bool:
+        return bool(self._cfg.get("blob", dict()).get("autoGc", False))
+
+    @property
+    def blobGcGraceHours(self) -> float:
+        return float(self._cfg.get("blob", dict()).get("gcGraceHours", 24))
+
+    @property
+    def downloadSegments(self) -> int:
+        return int(self._cfg.get("blob", dict()).get("downloadSegments", 4))
+
+    @property
+    def extractJobs(self) -> int:
+        jobs = self._cfg.get("archive", dict()).get("jobs", None)
+        if jobs is None:
+            from .jobserver import availableCpuCount
+            return availableCpuCount()
+        return max(1, int(jobs))
+
+    @property
+    def sourceCacheMode(self) -> str:
+        return self._cfg.get("archive", dict()).get("sourceCache", "auto")
+
+    @property
+    def resolvePolicy(self) -> str:
+        return self._cfg.get("resolve", dict()).get("policy", "newest")
+
+    @property
+    def defaultBuildTime(self) -> float:
+        return float(self._cfg.get("resolve", dict()).get("defaultBuildTime", 600))
+
+    @property
+    def mirror(self) -> dict:
+        return self._cfg.get("mirror", dict())
+
     @classmethod
     def load(cls, path: str):
         import toml
         with open(path, mode="r", encoding="utf-8") as fp:
-            cls._instance = Preference(toml.load(fp))
+            cls._instance = Preference(toml.load(fp), path)
 
     @classmethod
     def get(cls) -> "Preference":
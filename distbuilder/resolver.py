@@ -0,0 +1,76 @@
+from typing import Callable, Dict, List, Tuple
+from .builder import BuilderBase
+from .version import Version
+
+
+class DependencyNode:
+    def __init__(self, builder: BuilderBase):
+        self.builder = builder
+        self.libraryName = builder.libraryName
+        self.used = False  # 依存の依存で実際に使われているか
+        # 昇順.
+        self.availableVersions: List[Version] = sorted(builder.availableVersions)
+
+
+class DependencyResolver:
+    """ 依存グラフのノードを管理する. version と option の決め方は VersionSolver が実装する.
+
+    ノードを辿る処理は再帰しないので, 深いグラフでも recursion limit に掛からない.
+    """
+
+    def __init__(self, createBuilder: Callable[[str], BuilderBase]):
+        self._createBuilder = createBuilder
+        # libraryName (依存で指定された名前を含む) をキーにしたノード.
+        self.nodes: Dict[str, DependencyNode] = dict()
+        self.roots: List[DependencyNode] = list()
+
+    def _node(self, libraryName: str) -> Tuple[DependencyNode, bool]:
+        node = self.nodes.get(libraryName)
+        if node is not None:
+            return node, False
+        builder = self._createBuilder(libraryName)
+        # 短い名前 (zstd) と完全な名前 (facebook.zstd) のどちらで引いても同じノードになるようにする.
+        node = self.nodes.get(builder.libraryName)
+        created = node is None
+        if created:
+            node = DependencyNode(builder)
+            self.nodes[node.libraryName] = node
+        self.nodes[libraryName] = node
+        return node, created
+
+    def addRoot(self, libraryName: str) -> DependencyNode:
+        node, _ = self._node(libraryName)
+        self.roots.append(node)
+        return node
+
+    def bindBuilders(self, createEmptyBuilder: Callable[[], BuilderBase]):
+        """ Dependency に依存先の builder をセットする. 使っていない dependency には createEmptyBuilder() を入れる. """
+        for node in self.buildOrder():
+            for dep in node.builder.dependencies:
+                depNode = self.nodes.get(dep.libraryName)
+                if depNode is not None and depNode.used is True:
+                    dep._builder = depNode.builder
+                else:
+                    dep._builder = createEmptyBuilder()
+
+    def buildOrder(self) -> List[DependencyNode]:
+        """ used のノードを, 依存先が先に来る順 (roots の順の深さ優先) に並べる. """
+        order = list()
+        visited = set()
+        for root in self.roots:
+            stack = [(root, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    order.append(node)
+                    continue
+                if node.libraryName in visited:
+                    continue
+                visited.add(node.libraryName)
+                stack.append((node, True))
+                # 先に積んだものが後に処理されるので逆順に積む.
+                for dep in reversed(node.builder.dependencies):
+                    depNode = self.nodes.get(dep.libraryName)
+                    if depNode is not None and depNode.used and depNode.libraryName not in visited:
+                        stack.append((depNode, False))
+        return order
@@ -0,0 +1,265 @@
+import os
+import json
+import multiprocessing
+import sys
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional, Set
+from .artifacts import ArtifactIndex, BuildTimes, isInstalledDirectory, restoreArtifact
+from .blob import Blob
+from .builder import BuilderBase, EmptyBuilder
+from .errors import BuildError
+from .functions import searchBuilderAndPath
+from .global_options import GlobalOptions
+from . import hashcache
+from .jobserver import JobServer, availableCpuCount
+from .preference import Preference
+
+
+def _closure(jdict: dict, libraryName: str) -> Set[str]:
+    # deps.json の deps で, 使わない依存の hash は None になっている.
+    names = set()
+    stack = [libraryName]
+    while stack:
+        name = stack.pop()
+        if name in names:
+            continue
+        names.add(name)
+        stack.extend(dep for dep, hash in jdict[name]["deps"].items() if hash is not None)
+    return names
+
+
+def loadBuilders(buildDir: str, globalOpt: GlobalOptions, *,
+                 libraryName: Optional[str] = None) -> Dict[str, BuilderBase]:
+    """ deps.json から全ての builder を作り, hash を検証する.
+
+    Args:
+        buildDir (str): configure で deps.json を書き出したディレクトリ.
+        globalOpt (GlobalOptions): builder に渡す GlobalOptions.
+        libraryName (Optional[str]): 指定すると, そのライブラリと依存先の builder だけを作る.
+
+    Returns:
+        Dict[str, BuilderBase]: libraryName をキーにした builder. ビルド順に並ぶ.
+    """
+    depsFilepath = os.path.join(buildDir, "deps.json")
+    with open(depsFilepath, mode="r", encoding="utf-8") as fp:
+        jdeps = json.load(fp)
+
+    # jdeps は list なので, libraryName をキーにした dict に直す
+    jdict = {j["libraryName"]: j for j in jdeps}
+    if libraryName is not None:
+        names = _closure(jdict, libraryName)
+        jdeps = [lib for lib in jdeps if lib["libraryName"] in names]
+
+    deps: Dict[str, BuilderBase] = dict()
+    for lib in jdeps:
+        builderCls, _ = searchBuilderAndPath(lib["libraryName"])
+        builder: BuilderBase = builderCls(jdict, globalOpt)
+        deps[builder.libraryName] = builder
+
+        for dep in builder.dependencies:
+            if dep.isRequired(builder):
+                # かならず依存先のライブラリは deps に居るはず.
+                dep._builder = deps[dep.libraryName]
+            else:
+                dep._builder = EmptyBuilder(jdict, globalOpt)
+
+        assert builder.isResolved()
+        builder.updateHash()
+        if builder.hash != lib["hash"]:
+            print(builder.libraryName, builder.hash, lib["hash"])
+            print(builder.hashData)
+            raise BuildError("Invalid hash.")
+    # ワーカープロセスは atexit が呼ばれずに終わるので, ここで保存する.
+    hashcache.flush()
+    return deps
+
+
+def isInstalled(builder: BuilderBase) -> bool:
+    return isInstalledDirectory(builder.installDir)
+
+
+def _prefetch(builder: BuilderBase) -> str:
+    url, signature = builder.getSource(builder.version)
+    return Blob(builder).fetch(url, signature)
+
+
+def _initializeWorker(preferencePath: str, jobServer: JobServer):
+    # spawn で起動された場合は Preference が空なので読み直す.
+    Preference.load(preferencePath)
+    jobServer.attach()
+
+
+def _buildWorker(buildDir: str, globalOpt: GlobalOptions, libraryName: str):
+    try:
+        # 依存先だけを作る. 他のライブラリの build.py は読まない.
+        builders = loadBuilders(buildDir, globalOpt, libraryName=libraryName)
+        startTime = time.perf_counter()
+        builders[libraryName]._executeBuildSequence()
+        # cost を見積もる resolve policy で使う.
+        BuildTimes().record(libraryName, time.perf_counter() - startTime)
+    except Exception as e:
+        # 例外が pickle できるとは限らないので, ここで BuildError に詰め直す.
+        traceback.print_exc()
+        raise BuildError(f"Failed to build {libraryName}. {e}") from None
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+class BuildScheduler:
+    """ 依存関係が解決したライブラリから並列にビルドする.
+
+    各ライブラリのビルドはワーカープロセスで実行され, 同時実行数は jobs で制限される.
+    依存先が全てビルドされた時点で, 依存元のビルドを開始する.
+    全ての cmake --build は parallel 個のトークンを持つ JobServer を共有する.
+    ソースアーカイブは downloadJobs 個のスレッドで先に取得しておき, 取得できたものからビルドを開始する.
+    """
+
+    def __init__(self, buildDir: str, globalOpt: GlobalOptions, builders: Dict[str, BuilderBase], *,
+                 jobs: int = 1, keepGoing: bool = False, parallel: Optional[int] = None,
+                 downloadJobs: int = 4):
+        self._buildDir = buildDir
+        self._globalOpt = globalOpt
+        self._builders = builders
+        self._jobs = max(1, jobs)
+        self._keepGoing = keepGoing
+        self._downloadJobs = downloadJobs
+
+        # CPU トークン数. CLI > preference > cgroup quota / CPU 数 の順に決める.
+        if parallel is None:
+            parallel = Preference.get().parallel
+        if parallel is None:
+            parallel = availableCpuCount()
+        self._parallel = max(1, parallel)
+
+        # 依存グラフ. 使用しない dependency は含めない.
+        self._requires: Dict[str, Set[str]] = dict()
+        self._dependents: Dict[str, List[str]] = {name: list() for name in builders}
+        for name, builder in builders.items():
+            self._requires[name] = set()
+            for dep in builder.dependencies:
+                if dep.isRequired(builder):
+                    self._requires[name].add(dep.libraryName)
+                    self._dependents[dep.libraryName].append(name)
+
+    def _log(self, msg: str):
+        print(f"[distbuilder] {msg}", flush=True)
+
+    def _skipDependents(self, name: str, failed: Dict[str, str], pending: Set[str]):
+        stack = list(self._dependents[name])
+        while stack:
+            dependent = stack.pop()
+            if dependent in pending:
+                pending.discard(dependent)
+                failed[dependent] = f"Dependency ({name}) failed."
+                self._log(f"Skip {dependent}. dependency ({name}) failed.")
+                stack.extend(self._dependents[dependent])
+
+    def _startPrefetch(self, downloader: ThreadPoolExecutor, pending: Set[str]) -> Dict[str, Future]:
+        prefetches = dict()
+        for name, builder in self._builders.items():
+            if name in pending and builder.getSource(builder.version) is not None:
+                prefetches[name] = downloader.submit(_prefetch, builder)
+        if prefetches:
+            self._log(f"Prefetch {len(prefetches)} source archives. (downloadJobs = {self._downloadJobs})")
+        return prefetches
+
+    def _globalOptionsFor(self, name: str, prefetches: Dict[str, Future]) -> GlobalOptions:
+        prefetch = prefetches.get(name)
+        if prefetch is not None and prefetch.exception() is None and self._globalOpt.forceDownload:
+            # prefetch で再ダウンロード済み. ワーカーでもう一度ダウンロードしないようにする.
+            return self._globalOpt.replace(forceDownload=False)
+        return self._globalOpt
+
+    def run(self):
+        done: Set[str] = set()
+        failed: Dict[str, str] = dict()
+        pending: Set[str] = set()
+
+        artifacts = ArtifactIndex.fromPreference()
+        for name, builder in self._builders.items():
+            if isInstalled(builder):
+                builder.log("Build skip.")
+                done.add(name)
+                continue
+            artifact = artifacts.find(name, builder.hash) if artifacts.hasCache else None
+            if artifact is not None:
+                builder.log(f"Restore from artifact cache. {artifact.directory}")
+            if artifact is not None and restoreArtifact(artifact, builder.installDir):
+                done.add(name)
+            else:
+                pending.add(name)
+
+        if not pending:
+            return
+
+        self._log(f"Build {len(pending)} libraries. (jobs = {self._jobs}, parallel = {self._parallel})")
+        running = dict()
+        stopping = False
+        prefetches: Dict[str, Future] = dict()
+        # ライブラリ 1 つあたりに同時に走る cmake --build の数.
+        configs = 2 if self._globalOpt.parallelConfigs else 1
+        with JobServer(self._parallel) as jobServer, \
+                ThreadPoolExecutor(max_workers=max(1, self._downloadJobs)) as downloader, \
+                ProcessPoolExecutor(max_workers=self._jobs,
+                                    # ダウンロードスレッドが動いている状態で fork しないように spawn で起動する.
+                                    mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_initializeWorker,
+                                    initargs=(Preference.get().path, jobServer)) as executor:
+            if self._downloadJobs > 0:
+                prefetches = self._startPrefetch(downloader, pending)
+
+            def _isSourceReady(name: str) -> bool:
+                # prefetch に失敗していてもワーカー側で再度ダウンロードを試みる.
+                return name not in prefetches or prefetches[name].done()
+
+            while True:
+                if not stopping:
+                    # deps.json の順 (=トポロジカル順) に, 準備のできたものから投入する.
+                    for name in self._builders:
+                        if name in pending and self._requires[name] <= done and _isSourceReady(name) \
+                                and len(running) < self._jobs:
+                            pending.discard(name)
+                            self._log(f"Start {name}")
+                            future = executor.submit(_buildWorker, self._buildDir,
+                                                     self._globalOptionsFor(name, prefetches), name)
+                            running[future] = name
+                # --parallel を使う generator は, 今走っているビルドの数でトークンを分け合う.
+                # 最後に 1 つだけ残った長いビルドは全てのトークンを使える.
+                jobServer.setBuilders(len(running) * configs)
+
+                waiting = list(running.keys()) + [f for f in prefetches.values() if not f.done()]
+                if not waiting:
+                    break
+
+                finished, _ = wait(waiting, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future not in running:
+                        # prefetch の完了. 次のループで投入を試みる.
+                        continue
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        self._log(f"Finished {name}")
+                        done.add(name)
+                        continue
+
+                    failed[name] = str(error)
+                    self._log(f"Failed {name}. {error}")
+                    if self._keepGoing:
+                        self._skipDependents(name, failed, pending)
+                    elif not stopping:
+                        stopping = True
+                        self._log("Stop scheduling. Waiting for running builds...")
+                        downloader.shutdown(wait=False, cancel_futures=True)
+
+        if stopping:
+            for name in pending:
+                failed.setdefault(name, "Not built.")
+
+        if failed:
+            for name, reason in failed.items():
+                self._log(f"-- {name}: {reason}")
+            raise BuildError(f"Failed to build {len(failed)} libraries.")
@@ -0,0 +1,367 @@
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from .builder import BuilderBase
+from .dependency import Dependency
+from .artifacts import ArtifactIndex
+from .errors import BuildError
+from .resolver import DependencyNode, DependencyResolver
+from .version import Version
+
+
+class Incompatibility:
+    """ 同時には選べない (libraryName, version) の組.
+
+    terms の全てのライブラリが指定の version で使われている場合, 依存を満たせない.
+    cause は説明用. ("versions", libraryName, [(version, reason)]) か ("option", libraryName, key, [(parent, value)]).
+    reason は ("requires", parent, version, dependency), ("missing", libraryName), ("learned", Incompatibility) のいずれか.
+    """
+
+    def __init__(self, terms: Dict[str, Version], cause: tuple):
+        self.terms = terms
+        self.cause = cause
+
+    def __str__(self) -> str:
+        if not self.terms:
+            return "no solution"
+        return ", ".join(f"{name} {version}" for name, version in self.terms.items())
+
+
+class VersionSolver(DependencyResolver):
+    """ version を選び直しながら依存を解決する.
+
+    ライブラリを依存先が後になる順 (トポロジカル順) に並べ, 使われるものから新しい version を選んでいく.
+    version を選ぶと condition を評価して有効な依存を決め, 依存先の overrideOptions と version の制約が決まる.
+    (condition は self.version を参照してもよい)
+
+    依存先で選べる version が無くなったり option が衝突した場合は, その原因になった選択の組を
+    Incompatibility として覚え, 組の中で最後に選んだライブラリまで戻って別の version を選ぶ (backjump).
+    原因に関係しない選択は飛ばすので, 無関係なライブラリの組み合わせを全て試すことはない.
+    どう選んでも満たせない場合は, 原因になった制約だけを並べた説明を付けて BuildError にする.
+    """
+
+    def __init__(self, createBuilder: Callable[[str], BuilderBase], *, maxIterations: Optional[int] = None):
+        super().__init__(createBuilder)
+        # version を選ぶ回数の上限. None ならライブラリ数から決める.
+        self._maxIterations = maxIterations
+        self.iterations = 0
+        self.learned: List[Incompatibility] = list()
+        self._missing: Dict[str, str] = dict()
+        self._parents: Dict[str, List[Tuple[DependencyNode, Dependency]]] = dict()
+        self._order: List[DependencyNode] = list()
+        self._index: Dict[str, int] = dict()
+        self._initialOptions: Dict[str, dict] = dict()
+        self._decisions: Dict[str, Version] = dict()
+        self._required: Dict[str, Set[int]] = dict()
+        # id(dependency) -> 依存先の version のうち, dependency の範囲に含まれるもの.
+        self._allowed: Dict[int, Set[Version]] = dict()
+        self._learnedBy: Dict[str, List[Incompatibility]] = dict()
+        self._rootNames: Set[str] = set()
+
+    # --- グラフ ---
+
+    def _discover(self):
+        """ condition に関わらず, roots から辿れる全てのライブラリを作って順に並べる. """
+        self._rootNames = {node.libraryName for node in self.roots}
+        queue = deque(self.roots)
+        seen = set(self._rootNames)
+        nodes: List[DependencyNode] = list()
+        while queue:
+            node = queue.popleft()
+            nodes.append(node)
+            self._parents.setdefault(node.libraryName, list())
+            self._initialOptions[node.libraryName] = {o.key: o._value for o in node.builder.options}
+            for dep in node.builder.dependencies:
+                if dep.libraryName in self._missing:
+                    continue
+                try:
+                    depNode, _ = self._node(dep.libraryName)
+                except BuildError as e:
+                    # condition で使わない依存は, ライブラリが無くてもよい. 使う version は選ばない.
+                    self._missing[dep.libraryName] = str(e)
+                    continue
+                self._parents.setdefault(depNode.libraryName, list()).append((node, dep))
+                if depNode.libraryName not in seen:
+                    seen.add(depNode.libraryName)
+                    queue.append(depNode)
+
+        # 依存元が全て並んでから依存先を並べる.
+        children: Dict[str, List[str]] = {node.libraryName: list() for node in nodes}
+        indegree = {node.libraryName: 0 for node in nodes}
+        for node in nodes:
+            for parent, _ in self._parents[node.libraryName]:
+                children[parent.libraryName].append(node.libraryName)
+                indegree[node.libraryName] += 1
+        ready = deque(node for node in nodes if indegree[node.libraryName] == 0)
+        while ready:
+            node = ready.popleft()
+            self._index[node.libraryName] = len(self._order)
+            self._order.append(node)
+            for name in children[node.libraryName]:
+                indegree[name] -= 1
+                if indegree[name] == 0:
+                    ready.append(self.nodes[name])
+        if len(self._order) != len(nodes):
+            cycle = sorted(name for name, count in indegree.items() if count > 0)
+            raise BuildError(f"Dependency cycle. {', '.join(cycle)}")
+
+    def _ancestors(self, node: DependencyNode, terms: Dict[str, Version]):
+        """ node の状態 (使われるか, option, 依存の有効無効) を決める選択を terms に加える.
+
+        使われていない先祖も, 別の選択で使われるようになれば override で影響し得るので辿る.
+        """
+        stack = [node]
+        seen = {node.libraryName}
+        while stack:
+            current = stack.pop()
+            for parent, _ in self._parents[current.libraryName]:
+                if parent.libraryName in seen:
+                    continue
+                seen.add(parent.libraryName)
+                if parent.libraryName in self._decisions:
+                    terms[parent.libraryName] = self._decisions[parent.libraryName]
+                stack.append(parent)
+
+    def _because(self, parent: DependencyNode, terms: Dict[str, Version]):
+        """ parent が今の version で使われ, 今の依存を持つ理由. """
+        terms[parent.libraryName] = self._decisions[parent.libraryName]
+        self._ancestors(parent, terms)
+
+    # --- 選択 ---
+
+    def _incoming(self, node: DependencyNode) -> List[Tuple[DependencyNode, Dependency]]:
+        """ 使われている依存元からの, 有効な依存. """
+        return [(parent, dep) for parent, dep in self._parents[node.libraryName]
+                if parent.libraryName in self._decisions and id(dep) in self._required[parent.libraryName]]
+
+    def _decide(self, node: DependencyNode, version: Version):
+        node.builder.setVersion(version)
+        self._decisions[node.libraryName] = version
+        # condition はこの選択の間は変わらないので, ここで一度だけ評価する.
+        self._required[node.libraryName] = {id(dep) for dep in node.builder.dependencies
+                                            if dep.isRequired(node.builder)}
+
+    def _missingDependency(self, node: DependencyNode) -> Optional[str]:
+        for dep in node.builder.dependencies:
+            if id(dep) in self._required[node.libraryName] and dep.libraryName in self._missing:
+                return dep.libraryName
+        return None
+
+    def _undo(self, position: int):
+        for node in self._order[position:]:
+            self._decisions.pop(node.libraryName, None)
+            self._required.pop(node.libraryName, None)
+
+    def _applyOptions(self, node: DependencyNode,
+                      incoming: List[Tuple[DependencyNode, Dependency]]) -> Optional[Incompatibility]:
+        """ 依存元の overrideOptions を node に掛ける. 衝突したら Incompatibility を返す. """
+        initial = self._initialOptions[node.libraryName]
+        options = {option.key: option for option in node.builder.options}
+        for option in options.values():
+            option._value = initial[option.key]
+        node.builder._setDirty()
+
+        setBy: Dict[str, Tuple[DependencyNode, object]] = dict()
+        for parent, dep in incoming:
+            for key, value in dep.overrideOptions.items():
+                option = options.get(key)
+                if option is None:
+                    continue
+                terms: Dict[str, Version] = dict()
+                if key in setBy and setBy[key][1] != value:
+                    other, otherValue = setBy[key]
+                    self._because(other, terms)
+                    self._because(parent, terms)
+                    return Incompatibility(terms, ("option", node.libraryName, key,
+                                                   [(other.libraryName, otherValue), (parent.libraryName, value)]))
+                if key not in setBy and option.hasValue():
+                    if option.value != value:
+                        # deps.json で指定された値との衝突
+                        self._because(parent, terms)
+                        return Incompatibility(terms, ("option", node.libraryName, key,
+                                                       [("(configured)", option.value), (parent.libraryName, value)]))
+                else:
+                    option.setValue(value)
+                setBy[key] = (parent, value)
+        return None
+
+    def _forbiddenBy(self, node: DependencyNode, version: Version) -> Optional[Incompatibility]:
+        for incompatibility in self._learnedBy.get(node.libraryName, ()):
+            if incompatibility.terms[node.libraryName] != version:
+                continue
+            if all(self._decisions.get(name) == v for name, v in incompatibility.terms.items()
+                   if name != node.libraryName):
+                return incompatibility
+        return None
+
+    def _candidates(self, node: DependencyNode) -> List[Version]:
+        """ version を試す順. 新しいものから. """
+        return node.availableVersions[::-1]
+
+    def _allowedVersions(self, dep: Dependency, node: DependencyNode) -> Set[Version]:
+        # 選び直すたびに同じ依存を調べるので, 依存ごとに一度だけまとめて絞り込む.
+        allowed = self._allowed.get(id(dep))
+        if allowed is None:
+            allowed = set(dep.versionSpec.filter(node.availableVersions))
+            self._allowed[id(dep)] = allowed
+        return allowed
+
+    def _choose(self, node: DependencyNode,
+                incoming: List[Tuple[DependencyNode, Dependency]]) -> Optional[Incompatibility]:
+        """ _candidates の順に, 制約を満たす最初の version を選ぶ. 無ければ原因の Incompatibility を返す. """
+        rejected = list()
+        allowed = [self._allowedVersions(dep, node) for _, dep in incoming]
+        for version in self._candidates(node):
+            reason = None
+            for (parent, dep), versions in zip(incoming, allowed):
+                if version not in versions:
+                    reason = ("requires", parent.libraryName, self._decisions[parent.libraryName], dep)
+                    break
+            if reason is None:
+                forbidden = self._forbiddenBy(node, version)
+                if forbidden is not None:
+                    reason = ("learned", forbidden)
+            if reason is None:
+                self._decide(node, version)
+                missing = self._missingDependency(node)
+                if missing is None:
+                    return None
+                self._undo(self._index[node.libraryName])
+                reason = ("missing", missing)
+            rejected.append((version, reason))
+
+        # 除いた理由になった選択だけを集める.
+        terms: Dict[str, Version] = dict()
+        for _, reason in rejected:
+            if reason[0] == "requires":
+                self._because(self.nodes[reason[1]], terms)
+            elif reason[0] == "missing":
+                # どの依存が有効になるかは, node の option (= 先祖の選択) と version で決まる.
+                self._ancestors(node, terms)
+            else:
+                terms.update((name, v) for name, v in reason[1].terms.items() if name != node.libraryName)
+        if not any(reason[0] == "requires" for _, reason in rejected):
+            self._activation(node, incoming, terms)
+        return Incompatibility(terms, ("versions", node.libraryName, rejected))
+
+    def _activation(self, node: DependencyNode, incoming: List[Tuple[DependencyNode, Dependency]],
+                    terms: Dict[str, Version]):
+        # root でなければ, 使われる理由 (依存元のひとつ) も原因に含める.
+        if node.libraryName not in self._rootNames and incoming:
+            self._because(incoming[0][0], terms)
+
+    def _learn(self, incompatibility: Incompatibility) -> int:
+        """ incompatibility を覚え, やり直す位置を返す. """
+        if not incompatibility.terms:
+            raise BuildError("Failed to resolve dependencies.\n" + self.explain(incompatibility))
+        self.learned.append(incompatibility)
+        last = max(incompatibility.terms, key=lambda name: self._index[name])
+        self._learnedBy.setdefault(last, list()).append(incompatibility)
+        return self._index[last]
+
+    def solve(self):
+        """ 使うライブラリと version を決める. 使うものは used になり, version が設定される. """
+        self._discover()
+        position = 0
+        while position < len(self._order):
+            self.iterations += 1
+            maxIterations = self._maxIterations if self._maxIterations is not None else 10000 + 100 * len(self._order)
+            if self.iterations > maxIterations:
+                raise BuildError(f"Dependency resolution did not converge in {maxIterations} iterations.")
+
+            node = self._order[position]
+            incoming = self._incoming(node)
+            if node.libraryName not in self._rootNames and not incoming:
+                # 使われない.
+                position += 1
+                continue
+
+            incompatibility = self._applyOptions(node, incoming)
+            if incompatibility is None:
+                incompatibility = self._choose(node, incoming)
+                if incompatibility is None:
+                    position += 1
+                    continue
+
+            position = self._learn(incompatibility)
+            self._undo(position)
+
+        for node in self._order:
+            node.used = node.libraryName in self._decisions
+
+    # --- 説明 ---
+
+    def explain(self, incompatibility: Incompatibility) -> str:
+        """ incompatibility に至った制約を, 使われたものだけ依存の順に並べる. """
+        numbers: Dict[int, int] = dict()
+        lines: List[str] = list()
+
+        def _visit(target: Incompatibility) -> int:
+            if id(target) in numbers:
+                return numbers[id(target)]
+            body = list()
+            kind = target.cause[0]
+            if kind == "versions":
+                name, rejected = target.cause[1], target.cause[2]
+                # 同じ理由で除かれた version はまとめる.
+                groups: Dict[tuple, List[Version]] = dict()
+                for version, reason in rejected:
+                    if reason[0] == "requires":
+                        key = ("requires", reason[1], str(reason[2]), reason[3].versionRange)
+                    elif reason[0] == "missing":
+                        key = reason
+                    else:
+                        key = ("learned", _visit(reason[1]))
+                    groups.setdefault(key, list()).append(version)
+                body.append(f"{name} has no usable version:")
+                for key, versions in groups.items():
+                    versionsStr = ", ".join(str(v) for v in versions)
+                    if key[0] == "requires":
+                        body.append(f"    {versionsStr}: {key[1]} {key[2]} requires {name} {key[3]}")
+                    elif key[0] == "missing":
+                        body.append(f"    {versionsStr}: requires {key[1]}, which is not found")
+                    else:
+                        body.append(f"    {versionsStr}: excluded by [{key[1]}]")
+            else:
+                name, key, values = target.cause[1], target.cause[2], target.cause[3]
+                requested = ", ".join(f"{parent} requires {value}" for parent, value in values)
+                body.append(f"Option {name}.{key} is conflict. ({requested})")
+            number = len(lines) + 1
+            numbers[id(target)] = number
+            if not target.terms:
+                conclusion = "no solution."
+            elif len(target.terms) == 1:
+                conclusion = f"{target} cannot be used."
+            else:
+                conclusion = f"{target} cannot be used together."
+            lines.append(f"[{number}] " + "\n    ".join(body) + f"\n    => {conclusion}")
+            return number
+
+        _visit(incompatibility)
+        return "\n".join(lines)
+
+
+class CacheAwareSolver(VersionSolver):
+    """ ビルド済みの成果物がある version を先に試す VersionSolver.
+
+    version を選ぶ時点で option は決まっているので, 同じ version と option の成果物があるもの,
+    同じ version の成果物があるもの, その他の順に, それぞれ新しいものから試す.
+    依存先は後で選ぶので hash はまだ決まっておらず, ライブラリごとに貪欲に並べているだけで
+    ビルド時間を最小にするものではない. 実際に再ビルドが不要になるかは estimateBuildCost で確かめる.
+    """
+
+    def __init__(self, createBuilder: Callable[[str], BuilderBase], artifacts: ArtifactIndex, *,
+                 maxIterations: Optional[int] = None):
+        super().__init__(createBuilder, maxIterations=maxIterations)
+        self._artifacts = artifacts
+
+    def _candidates(self, node: DependencyNode) -> List[Version]:
+        options = {option.key: str(option) for option in node.builder.options}
+        built: Dict[str, bool] = dict()
+        for artifact in self._artifacts.artifacts(node.libraryName).values():
+            built[artifact.version] = built.get(artifact.version, False) or artifact.options == options
+
+        def _key(version: Version):
+            matched = built.get(str(version))
+            return (matched is True, matched is not None, version)
+
+        return sorted(node.availableVersions, key=_key, reverse=True)
@@ -1,55 +1,46 @@
-from typing import Union
+import functools
+from bisect import bisect_left
+from typing import Iterable, List, Sequence, Tuple, Union
+from .errors import BuildError
 
 
-class Version:
-    def __init__(self, variant: int, major: int, minor: int, patch: int):
-        self._variant = variant
-        self._major = major
-        self._minor = minor
-        self._patch = patch
+class Version(tuple):
+    """ (variant, major, minor, patch) の tuple. 比較と hash は tuple と同じ. """
+
+    __slots__ = ()
+
+    def __new__(cls, variant: int, major: int, minor: int, patch: int):
+        return tuple.__new__(cls, (variant, major, minor, patch))
+
+    def __getnewargs__(self):
+        return tuple(self)
 
     @property
     def variant(self) -> int:
-        return self._variant
+        return self[0]
 
     @property
     def major(self) -> int:
-        return self._major
+        return self[1]
 
     @property
     def minor(self) -> int:
-        return self._minor
+        return self[2]
 
     @property
     def patch(self) -> int:
-        return self._patch
+        return self[3]
 
     def __str__(self) -> str:
-        if self._variant > 0:
-            return f"{self._variant}.{self._major}.{self._minor}.{self._patch}"
-        if self._major > 0:
-            return f"{self._major}.{self._minor}.{self._patch}"
-        else:
-            return f"{self._minor}.{self._patch}"
-
-    def __lt__(self, other: "Version") -> bool:
-        if self._variant != other._variant:
-            return self._variant < other._variant
-        elif self._major != other._major:
-            return self._major < other._major
-        elif self._minor != other._minor:
-            return self._minor < other._minor
+        if self[0] > 0:
+            return f"{self[0]}.{self[1]}.{self[2]}.{self[3]}"
+        if self[1] > 0:
+            return f"{self[1]}.{self[2]}.{self[3]}"
         else:
-            return self._patch < other._patch
+            return f"{self[2]}.{self[3]}"
 
-    def __eq__(self, other: "Version") -> bool:
-        return (self._variant == other.variant
-                and self._major == other.major
-                and self._minor == other.minor
-                and self._patch == other.patch)
-
-    def __hash__(self):
-        return hash(str(self))
+    def __repr__(self) -> str:
+        return f"Version({self[0]}, {self[1]}, {self[2]}, {self[3]})"
 
     def match(self,
               variant: Union[int, str],
@@ -72,21 +63,217 @@ class Version:
             minor (str): minor version.
             patch (str): patch version.
         """
+        return _parseComponent(variant).contains(self[0]) \
+            and _parseComponent(major).contains(self[1]) \
+            and _parseComponent(minor).contains(self[2]) \
+            and _parseComponent(patch).contains(self[3])
+
+
+_INFINITY = float("inf")
+
+
+class IntervalSet:
+    """ 整数の閉区間 [low, high] の和集合. 区間は昇順で, 重ならず隣接もしない. "*" は (-inf, inf). """
+
+    __slots__ = ("intervals",)
+
+    def __init__(self, intervals: Iterable[Tuple[float, float]] = ()):
+        merged: List[Tuple[float, float]] = list()
+        for low, high in sorted(intervals):
+            if low > high:
+                continue
+            if merged and low <= merged[-1][1] + 1:
+                if high > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], high)
+            else:
+                merged.append((low, high))
+        self.intervals: Tuple[Tuple[float, float], ...] = tuple(merged)
+
+    @classmethod
+    def parse(cls, value: Union[int, str]) -> "IntervalSet":
+        """ 123, "*", "123", "123-125", "123, 130-132" を読む. """
+        if isinstance(value, int):
+            return cls([(value, value)])
+        if value.strip() == "*":
+            return ANY_COMPONENT
+        intervals = list()
+        try:
+            for item in value.split(","):
+                bounds = [int(v) for v in item.strip().split("-", 1)]
+                intervals.append((bounds[0], bounds[-1]))
+        except ValueError:
+            raise BuildError(f"Invalid version range. {value}") from None
+        return cls(intervals)
+
+    @property
+    def isAny(self) -> bool:
+        return self.intervals == ((-_INFINITY, _INFINITY),)
+
+    @property
+    def isEmpty(self) -> bool:
+        return not self.intervals
+
+    def contains(self, value: int) -> bool:
+        for low, high in self.intervals:
+            if value < low:
+                return False
+            if value <= high:
+                return True
+        return False
+
+    def intersect(self, other: "IntervalSet") -> "IntervalSet":
+        result = list()
+        i = j = 0
+        while i < len(self.intervals) and j < len(other.intervals):
+            low = max(self.intervals[i][0], other.intervals[j][0])
+            high = min(self.intervals[i][1], other.intervals[j][1])
+            if low <= high:
+                result.append((low, high))
+            if self.intervals[i][1] < other.intervals[j][1]:
+                i += 1
+            else:
+                j += 1
+        return IntervalSet(result)
+
+    def union(self, other: "IntervalSet") -> "IntervalSet":
+        return IntervalSet(self.intervals + other.intervals)
+
+    def issubset(self, other: "IntervalSet") -> bool:
+        return self.intersect(other) == self
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IntervalSet) and self.intervals == other.intervals
+
+    def __hash__(self):
+        return hash(self.intervals)
+
+    def __str__(self) -> str:
+        if self.isAny:
+            return "*"
+        return ", ".join(f"{low}" if low == high else f"{low}-{high}" for low, high in self.intervals)
+
 
-        def _check(ver, val):
-            if isinstance(val, int):
-                return ver == val
-            if val == "*":
+ANY_COMPONENT = IntervalSet([(-_INFINITY, _INFINITY)])
+
+# Dependency の数だけ同じ文字列が並ぶので, 読んだ結果を使い回す.
+_parseComponent = functools.lru_cache(maxsize=4096)(IntervalSet.parse)
+
+# (variant, major, minor, patch) それぞれの IntervalSet
+_Term = Tuple[IntervalSet, IntervalSet, IntervalSet, IntervalSet]
+
+
+class VersionSpec:
+    """ version の範囲. 成分ごとの IntervalSet の組 (term) の和集合.
+
+    Dependency の versionVariant, versionMajor, versionMinor, versionPatch は 1 つの term になる.
+    intersect は term ごとの成分の積, union は term を並べるだけなので, どちらも正確.
+    """
+
+    __slots__ = ("terms",)
+
+    def __init__(self, terms: Iterable[_Term] = ()):
+        result: List[_Term] = list()
+        for term in terms:
+            if any(component.isEmpty for component in term):
+                continue
+            result = _addTerm(result, tuple(term))
+        self.terms: Tuple[_Term, ...] = tuple(result)
+
+    @classmethod
+    def parse(cls,
+              variant: Union[int, str] = "*",
+              major: Union[int, str] = "*",
+              minor: Union[int, str] = "*",
+              patch: Union[int, str] = "*") -> "VersionSpec":
+        return cls([(_parseComponent(variant), _parseComponent(major),
+                     _parseComponent(minor), _parseComponent(patch))])
+
+    @property
+    def isEmpty(self) -> bool:
+        return not self.terms
+
+    def contains(self, version: Version) -> bool:
+        for term in self.terms:
+            if term[0].contains(version[0]) and term[1].contains(version[1]) \
+                    and term[2].contains(version[2]) and term[3].contains(version[3]):
                 return True
-            vals = [[int(vv) for vv in v.strip().split("-", 1)] for v in val.split(",")]
-            for v in vals:
-                if len(v) == 1 and v[0] == ver:
-                    return True
-                elif len(v) == 2 and v[0] <= ver and ver <= v[1]:
-                    return True
-            return False
-
-        return _check(self._variant, variant) \
-            and _check(self._major, major)\
-            and _check(self._minor, minor)\
-            and _check(self._patch, patch)
+        return False
+
+    def intersect(self, other: "VersionSpec") -> "VersionSpec":
+        return VersionSpec(tuple(a.intersect(b) for a, b in zip(term, otherTerm))
+                           for term in self.terms for otherTerm in other.terms)
+
+    def union(self, other: "VersionSpec") -> "VersionSpec":
+        return VersionSpec(self.terms + other.terms)
+
+    def filter(self, versions: Sequence[Version]) -> List[Version]:
+        """ 昇順に並んだ versions のうち, 範囲に含まれるものを順序を保って返す.
+
+        成分ごとに区間の端を二分探索するので, 含まれない version は 1 つずつ調べない.
+        """
+        if len(self.terms) == 1:
+            ranges = _filterRanges(versions, self.terms[0], 0, len(versions), 0, ())
+            return [v for low, high in ranges for v in versions[low:high]]
+        indices = set()
+        for term in self.terms:
+            for low, high in _filterRanges(versions, term, 0, len(versions), 0, ()):
+                indices.update(range(low, high))
+        return [versions[i] for i in sorted(indices)]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, VersionSpec) and set(self.terms) == set(other.terms)
+
+    def __hash__(self):
+        return hash(frozenset(self.terms))
+
+    def __str__(self) -> str:
+        if not self.terms:
+            return "(none)"
+        return " | ".join(".".join(str(component) for component in term) for term in self.terms)
+
+
+def _addTerm(terms: List[_Term], term: _Term) -> List[_Term]:
+    """ terms に term を加える. 含まれるものは捨て, 1 成分だけ異なるものはまとめる. """
+    for i, other in enumerate(terms):
+        if all(a.issubset(b) for a, b in zip(term, other)):
+            return terms
+        differs = [k for k in range(4) if term[k] != other[k]]
+        if len(differs) == 1:
+            k = differs[0]
+            merged = other[:k] + (other[k].union(term[k]),) + other[k + 1:]
+            return _addTerm(terms[:i] + terms[i + 1:], merged)
+    return [other for other in terms if not all(a.issubset(b) for a, b in zip(other, term))] + [term]
+
+
+def _filterRanges(versions: Sequence[Version], term: _Term, low: int, high: int, index: int,
+                  prefix: tuple) -> List[Tuple[int, int]]:
+    """ versions[low:high] (先頭 index 成分が prefix) のうち, term[index:] を満たす添字の範囲. """
+    if all(component.isAny for component in term[index:]):
+        return [(low, high)] if low < high else []
+    ranges = list()
+    component = term[index]
+    if component.isAny:
+        # 次の成分は prefix + (値,) ごとにしか並んでいないので, 値ごとに分ける.
+        start = low
+        while start < high:
+            value = versions[start][index]
+            end = bisect_left(versions, prefix + (value + 1,), start, high)
+            ranges.extend(_filterRanges(versions, term, start, end, index + 1, prefix + (value,)))
+            start = end
+        return ranges
+    for lowValue, highValue in component.intervals:
+        start = bisect_left(versions, prefix + (lowValue,), low, high)
+        end = bisect_left(versions, prefix + (highValue + 1,), start, high)
+        if index == 3 or all(c.isAny for c in term[index + 1:]):
+            if start < end:
+                ranges.append((start, end))
+            continue
+        while start < end:
+            value = versions[start][index]
+            valueEnd = bisect_left(versions, prefix + (value + 1,), start, end)
+            ranges.extend(_filterRanges(versions, term, start, valueEnd, index + 1, prefix + (value,)))
+            start = valueEnd
+    return ranges
+
+
+ANY_VERSION = VersionSpec([(ANY_COMPONENT, ANY_COMPONENT, ANY_COMPONENT, ANY_COMPONENT)])
@@ -9,15 +9,14 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/AcademySoftwareFoundation/Imath/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/AcademySoftwareFoundation/Imath/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/Imath-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -35,9 +34,7 @@ class Builder(BuilderBase):
             "-DIMATH_USE_NOEXCEPT=1",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("Imath")
@@ -9,6 +9,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/AcademySoftwareFoundation/MaterialX/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -18,10 +20,7 @@ class Builder(BuilderBase):
     # dep_zlib = Dependency("madler.zlib", condition=lambda self: True)
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/AcademySoftwareFoundation/MaterialX/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/MaterialX-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -41,9 +40,7 @@ class Builder(BuilderBase):
             "-DMATERIALX_BUILD_VIEWER=0",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("MaterialX")
@@ -9,6 +9,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/AcademySoftwareFoundation/OpenImageIO/archive/refs/tags/"
+                 "v{variant}.{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -24,10 +26,7 @@ class Builder(BuilderBase):
     dep_freetype = Dependency("freetype.freetype")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/AcademySoftwareFoundation/OpenImageIO/archive/refs/tags/"
-            f"v{self.version.variant}.{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = ("src/OpenImageIO-"
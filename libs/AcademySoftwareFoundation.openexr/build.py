@@ -9,6 +9,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/AcademySoftwareFoundation/openexr/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -20,10 +22,7 @@ class Builder(BuilderBase):
     dep_Imath = Dependency("AcademySoftwareFoundation.Imath")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/AcademySoftwareFoundation/openexr/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/openexr-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -48,9 +47,7 @@ class Builder(BuilderBase):
             "-DOPENEXR_TEST_TOOLS=0",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("OpenEXR")
@@ -9,6 +9,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/CLIUtils/CLI11/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Precompiled = Option(bool, True, "Precompiled")
@@ -16,10 +18,7 @@ class Builder(BuilderBase):
     option_SingleFile = Option(bool, False, "Single file")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/CLIUtils/CLI11/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/CLI11-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -35,9 +34,7 @@ class Builder(BuilderBase):
             f"-DCLI11_SINGLE_FILE={self.option_SingleFile}"
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("CLI11", "share/cmake/{packageName}")
@@ -13,6 +13,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/PixarAnimationStudios/OpenSubdiv/archive/refs/tags/"
+                 "v{major}_{minor}_{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -23,10 +25,7 @@ class Builder(BuilderBase):
     # dep_glfw = Dependency("glfw.glfw", condition=lambda self: self.option_WithGLFW.value)
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/PixarAnimationStudios/OpenSubdiv/archive/refs/tags/"
-            f"v{self.version.major}_{self.version.minor}_{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/OpenSubdiv-{self.version.major}_{self.version.minor}_{self.version.patch}"
@@ -54,9 +53,7 @@ class Builder(BuilderBase):
         if platform.system() == "Darwin":
             configArgs.append('-DNO_OPENGL=1')
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("OpenSubdiv")
@@ -10,6 +10,19 @@ class Builder(BuilderBase):
 
     versions = list(signatures.keys())
 
+    @classmethod
+    def getVersionName(cls, version):
+        versionStr = f"{version.major:02d}.{version.minor:02d}"
+        if version.patch > 0:
+            # "a" から順に
+            versionStr += bytes([96 + version.patch]).decode()
+        return versionStr
+
+    @classmethod
+    def getSourceUrl(cls, version):
+        return ("https://github.com/PixarAnimationStudios/OpenUSD/archive/refs/tags/"
+                f"v{cls.getVersionName(version)}.zip")
+
     # --- options ---
     option_Monolithic = Option(bool, False, "Build monolithic")
     option_BuildUsdTools = Option(bool, True, "Build USD Tools")
@@ -44,19 +57,16 @@ class Builder(BuilderBase):
                                versionMinor="38")
 
     def build(self):
-        versionStr = f"{self.version.major:02d}.{self.version.minor:02d}"
-        if self.version.patch > 0:
-            # "a" から順に
-            versionStr += bytes([96 + self.version.patch]).decode()
+        versionStr = self.getVersionName(self.version)
 
-        zipFile = self.download(
-            "https://github.com/PixarAnimationStudios/OpenUSD/archive/refs/tags/"
-            f"v{versionStr}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/OpenUSD-{versionStr}"
 
+        # Patch
+        self.applyPatches(f"v{versionStr}", srcPath)
+
         for cfg in ["Debug", "Release"]:
             configArgs = [
                 "-DCMAKE_DEBUG_POSTFIX=d",
@@ -104,9 +114,6 @@ class Builder(BuilderBase):
             # ほんとに. installPrefix を指定しとかないといけないらしい.
             configArgs.append(f"-DCMAKE_INSTALL_PREFIX={self.installDir}")
 
-            # Patch
-            self.applyPatches(f"v{versionStr}", srcPath)
-
             self.cmakeConfigure(srcPath, "build", configArgs)
             self.cmakeBuildAndInstall("build", cfg)
 
@@ -36,9 +36,7 @@ class Builder(BuilderBase):
         ]
 
         srcPath = "S:/works/programming/debug-vkimage-viewer"
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("roah_dbgv")
@@ -8,12 +8,11 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/ShiraoShotaro/roah-assert/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/ShiraoShotaro/roah-assert/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/roah-assert-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -22,9 +21,7 @@ class Builder(BuilderBase):
             "-DCMAKE_DEBUG_POSTFIX=d",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("roah-assert")
@@ -8,15 +8,14 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/ShiraoShotaro/roah-logger/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- deps ---
     dep_spdlog = Dependency("gabime.spdlog")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/ShiraoShotaro/roah-logger/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/roah-logger-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -25,9 +24,7 @@ class Builder(BuilderBase):
             "-DCMAKE_DEBUG_POSTFIX=d"
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("roah-logger")
@@ -33,9 +33,7 @@ class Builder(BuilderBase):
         ]
 
         srcPath = "S:/works/programming/vulkan_wrapper"
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("vkwp")
@@ -8,6 +8,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/ToruNiina/toml11/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     # option_Shared = Option(bool, False, "Build shared")
@@ -16,10 +18,7 @@ class Builder(BuilderBase):
     # dep_zlib = Dependency("madler.zlib", condition=lambda self: True)
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/ToruNiina/toml11/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/toml11-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -28,9 +27,7 @@ class Builder(BuilderBase):
             "-DCMAKE_DEBUG_POSTFIX=d",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("toml11")
@@ -29,6 +29,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/WhiteAtelier/roah-lib/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_BuildRoahAssert = Option(bool, True, "Build RoahAssert")
@@ -54,10 +56,7 @@ class Builder(BuilderBase):
         if (self.version.major == 0):
             srcPath = "W:/works/programming/roah-lib"
         else:
-            zipFile = self.download(
-                "https://github.com/WhiteAtelier/roah-lib/archive/refs/tags/"
-                f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-                Builder.signatures[self.version])
+            zipFile = self.downloadSource()
             self.unzip(zipFile, "src")
 
             srcPath = f"src/roah-lib-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -93,9 +92,7 @@ class Builder(BuilderBase):
             if self.version == Version(0, 1, 10, 0):
                 configArgs.append("-DLIBROAH_INSTALL=ON")
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("libroah")
@@ -8,6 +8,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/facebook/zstd/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     # option_Shared = Option(bool, False, "Build shared")
@@ -16,10 +18,7 @@ class Builder(BuilderBase):
     # dep_zlib = Dependency("madler.zlib", condition=lambda self: True)
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/facebook/zstd/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/zstd-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -42,9 +41,7 @@ class Builder(BuilderBase):
             f"-DZSTD_ZLIB_SUPPORT={self.option_ZlibSupport}"
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir(PACKAGE_NAME)
@@ -10,6 +10,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/abseil/abseil-cpp/archive/refs/tags/"
+                 "{minor}.{patch}.zip")
 
     # --- options ---
     option_BuildMonilithicShared = Option(bool, True, "Build shared")
@@ -19,10 +21,7 @@ class Builder(BuilderBase):
     # dep_zlib = Dependency("madler.zlib", condition=lambda self: True)
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/abseil/abseil-cpp/archive/refs/tags/"
-            f"{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/abseil-cpp-{self.version.minor}.{self.version.patch}"
@@ -40,9 +39,7 @@ class Builder(BuilderBase):
             "-DABSL_USE_SYSTEM_INCLUDES=0",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("absl")
@@ -9,16 +9,15 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/c-ares/c-ares/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared.")
     option_Static = Option(bool, True, "Build static.")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/c-ares/c-ares/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/c-ares-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -37,9 +36,7 @@ class Builder(BuilderBase):
             "-DCARES_MSVC_STATIC_RUNTIME=0",  # MD
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("c-ares")
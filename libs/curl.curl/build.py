@@ -8,6 +8,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/curl/curl/archive/refs/tags/"
+                 "curl-{major}_{minor}_{patch}.zip")
 
     # --- options ---
     option_BuildCurlExe = Option(bool, False, "Build curl executable")
@@ -31,10 +33,7 @@ class Builder(BuilderBase):
     dep_zstd = Dependency("facebook.zstd")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/curl/curl/archive/refs/tags/"
-            f"curl-{self.version.major}_{self.version.minor}_{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/curl-curl-{self.version.major}_{self.version.minor}_{self.version.patch}"
@@ -59,9 +58,7 @@ class Builder(BuilderBase):
             "-DENABLE_DEBUG=OFF",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("CURL")
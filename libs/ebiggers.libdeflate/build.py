@@ -10,6 +10,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/ebiggers/libdeflate/archive/refs/tags/"
+                 "v{major}.{minor}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -20,10 +22,7 @@ class Builder(BuilderBase):
     option_ZlibSupport = Option(bool, False, "Zlib support")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/ebiggers/libdeflate/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/libdeflate-{self.version.major}.{self.version.minor}"
@@ -42,9 +41,7 @@ class Builder(BuilderBase):
             "-DLIBDEFLATE_USE_SHARED_LIB=0",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("libdeflate")
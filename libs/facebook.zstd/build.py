@@ -9,6 +9,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/facebook/zstd/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     option_BuildCompression = Option(bool, True, "Build compression")
     option_BuildDecompression = Option(bool, True, "Build decompression")
@@ -27,11 +29,9 @@ class Builder(BuilderBase):
                           condition=lambda builder: builder.option_ZlibSupport.value)
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/facebook/zstd/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
-        self.unzip(zipFile, "src")
+        zipFile = self.downloadSource()
+        # build/cmake から lib (と programs) を参照するだけなので, tests, contrib, doc などは展開しない.
+        self.unzip(zipFile, "src", include=["*/*", "*/build/**", "*/lib/**", "*/programs/**"])
 
         srcPath = f"src/zstd-{self.version.major}.{self.version.minor}.{self.version.patch}"
 
@@ -57,9 +57,7 @@ class Builder(BuilderBase):
             # https://github.com/facebook/zstd/issues/3999
             configArgs.append(f"-DCMAKE_RC_FLAGS=-I{self.buildDir}/{srcPath}/lib")
 
-        self.cmakeConfigure(f"{srcPath}/build/cmake", "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(f"{srcPath}/build/cmake", configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("zstd")
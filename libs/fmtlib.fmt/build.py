@@ -8,12 +8,11 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/fmtlib/fmt/archive/refs/tags/"
+                 "{major}.{minor}.{patch}.zip")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/fmtlib/fmt/archive/refs/tags/"
-            f"{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/fmt-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -30,9 +29,7 @@ class Builder(BuilderBase):
             "-DFMT_WERROR=0",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("fmt")
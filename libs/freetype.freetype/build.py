@@ -8,6 +8,9 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://gitlab.freedesktop.org/freetype/freetype/-/archive/"
+                 "VER-{major}-{minor}-{patch}/"
+                 "freetype-VER-{major}-{minor}-{patch}.zip")
 
     # --- options ---
     # option_Shared = Option(bool, False, "Build shared")
@@ -24,11 +27,7 @@ class Builder(BuilderBase):
                           condition=lambda self: self.option_WithZlib.value)
 
     def build(self):
-        zipFile = self.download(
-            "https://gitlab.freedesktop.org/freetype/freetype/-/archive/"
-            f"VER-{self.version.major}-{self.version.minor}-{self.version.patch}/"
-            f"freetype-VER-{self.version.major}-{self.version.minor}-{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/freetype-VER-{self.version.major}-{self.version.minor}-{self.version.patch}"
@@ -45,9 +44,7 @@ class Builder(BuilderBase):
             f"v{self.version.major}.{self.version.minor}.{self.version.patch}/CMakeLists.txt.patch",
             srcPath)
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("Freetype", "lib/cmake/freetype")
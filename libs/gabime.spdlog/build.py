@@ -10,6 +10,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/gabime/spdlog/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -20,10 +22,7 @@ class Builder(BuilderBase):
     dep_fmt = Dependency("fmtlib.fmt", condition=lambda self: self.option_UseFmt.value)
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/gabime/spdlog/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/spdlog-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -11,18 +11,24 @@ class Builder(BuilderBase):
 
     versions = list(signatures.keys())
 
+    @classmethod
+    def getVersionName(cls, version):
+        if version.patch != 0:
+            return f"{version.major}.{version.minor}.{version.patch}"
+        else:
+            return f"{version.major}.{version.minor}"
+
+    @classmethod
+    def getSourceUrl(cls, version):
+        return f"https://github.com/glfw/glfw/archive/refs/tags/{cls.getVersionName(version)}.zip"
+
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
 
     def build(self):
-        if self.version.patch != 0:
-            versionName = f"{self.version.major}.{self.version.minor}.{self.version.patch}"
-        else:
-            versionName = f"{self.version.major}.{self.version.minor}"
+        versionName = self.getVersionName(self.version)
 
-        zipFile = self.download(
-            f"https://github.com/glfw/glfw/archive/refs/tags/{versionName}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/glfw-{versionName}"
@@ -38,9 +44,7 @@ class Builder(BuilderBase):
             f"-DGLFW_BUILD_WIN32={os.name == 'nt'}"
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("glfw3")
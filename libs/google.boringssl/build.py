@@ -10,12 +10,11 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/google/boringssl/archive/refs/tags/"
+                 "{major}.{minor}.{patch}.zip")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/google/boringssl/archive/refs/tags/"
-            f"{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/boringssl-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -24,9 +23,7 @@ class Builder(BuilderBase):
             "-DCMAKE_DEBUG_POSTFIX=d",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("OpenSSL")
@@ -9,6 +9,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/google/googletest/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -16,10 +18,7 @@ class Builder(BuilderBase):
     option_CXXStandard = Option(str, "17", "Use CXX Standard")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/google/googletest/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/googletest-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -33,9 +32,7 @@ class Builder(BuilderBase):
             f"-DBUILD_GMOCK={self.option_BuildGmock}"
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("GTest")
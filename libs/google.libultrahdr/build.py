@@ -8,6 +8,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/google/libultrahdr/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -16,10 +18,7 @@ class Builder(BuilderBase):
     dep_jpeg = Dependency("libjpeg-turbo.libjpeg-turbo")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/google/libultrahdr/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/libultrahdr-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -47,9 +46,7 @@ class Builder(BuilderBase):
             f"v{self.version.major}.{self.version.minor}.{self.version.patch}/CMakeLists.txt.patch",
             srcPath)
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDirpathVariable("libuhdr_ROOT", self.installDir, "libuhdr root")
@@ -9,6 +9,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/google/re2/archive/refs/tags/"
+                 "{major}-{minor:02d}-{patch:02d}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -19,10 +21,7 @@ class Builder(BuilderBase):
     dep_abseil = Dependency("abseil.abseil-cpp")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/google/re2/archive/refs/tags/"
-            f"{self.version.major}-{self.version.minor:02d}-{self.version.patch:02d}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/re2-{self.version.major}-{self.version.minor:02d}-{self.version.patch:02d}"
@@ -36,9 +35,7 @@ class Builder(BuilderBase):
             f"-DRE2_USE_ICU={self.option_UseICU}",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("re2")
@@ -10,6 +10,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/grpc/grpc/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_UseStaticZlib = Option(bool, True, "Use static zlib.")
@@ -26,10 +28,7 @@ class Builder(BuilderBase):
                         )
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/grpc/grpc/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/grpc-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -61,9 +60,7 @@ class Builder(BuilderBase):
             f"-DZLIB_USE_STATIC_LIBS={self.option_UseStaticZlib}",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("gRPC", "lib/cmake/grpc")
@@ -8,12 +8,11 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/harfbuzz/harfbuzz/archive/refs/tags/"
+                 "{major}.{minor}.{patch}.zip")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/harfbuzz/harfbuzz/archive/refs/tags/"
-            f"{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/harfbuzz-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -28,9 +27,7 @@ class Builder(BuilderBase):
             f"v{self.version.major}.{self.version.minor}.{self.version.patch}/CMakeLists.txt.patch",
             srcPath)
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("harfbuzz")
@@ -8,16 +8,15 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/libjpeg-turbo/libjpeg-turbo/archive/refs/tags/"
+                 "{major}.{minor}.{patch}.zip")
 
     # --- options ---
     # option_Static = Option(bool, True, "Build static")
     option_Shared = Option(bool, False, "Build shared")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/libjpeg-turbo/libjpeg-turbo/archive/refs/tags/"
-            f"{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/libjpeg-turbo-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -28,9 +27,7 @@ class Builder(BuilderBase):
             f"-DENABLE_STATIC={not self.option_Shared.value}",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("libjpeg-turbo")
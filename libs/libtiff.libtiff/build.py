@@ -8,6 +8,9 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://gitlab.com/libtiff/libtiff/-/archive/"
+                 "v{major}.{minor}.{patch}/"
+                 "libtiff-v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -23,11 +26,7 @@ class Builder(BuilderBase):
                                 overrideOptions={"ZlibSupport": True})
 
     def build(self):
-        zipFile = self.download(
-            "https://gitlab.com/libtiff/libtiff/-/archive/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}/"
-            f"libtiff-v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/libtiff-v{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -52,9 +51,7 @@ class Builder(BuilderBase):
             f"v{self.version.major}.{self.version.minor}.{self.version.patch}/ZSTDCodec.cmake.patch",
             srcPath)
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("Tiff", "lib/cmake/tiff")
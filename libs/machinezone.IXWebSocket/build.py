@@ -8,6 +8,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/machinezone/IXWebSocket/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -17,10 +19,7 @@ class Builder(BuilderBase):
     dep_zlib = Dependency("madler.zlib", condition=lambda self: self.option_UseZlib)
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/machinezone/IXWebSocket/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/IXWebSocket-{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -31,9 +30,7 @@ class Builder(BuilderBase):
             f"-DUSE_ZLIB={self.option_UseZlib}",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("ixwebsocket")
@@ -8,12 +8,11 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/madler/zlib/archive/refs/tags/"
+                 "v{major}.{minor}.{patch}.zip")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/madler/zlib/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/zlib-{self.version.major}.{self.version.minor}.{self.version.patch}"
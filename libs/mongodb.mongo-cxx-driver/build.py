@@ -9,6 +9,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/mongodb/mongo-cxx-driver/archive/refs/tags/"
+                 "r{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -22,10 +24,7 @@ class Builder(BuilderBase):
         if os.name == "nt":
             raise NotImplementedError("Windows build is not supported yet.")
 
-        zipFile = self.download(
-            "https://github.com/mongodb/mongo-cxx-driver/archive/refs/tags/"
-            f"r{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/mongo-cxx-driver-r{self.version.major}.{self.version.minor}.{self.version.patch}"
@@ -37,9 +36,7 @@ class Builder(BuilderBase):
             f"-DBUILD_VERSION={self.option_Version}",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("mongo-cxx-driver")
@@ -11,16 +11,15 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/nigels-com/glew/releases/download"
+                 "/glew-{major}.{minor}.{patch}"
+                 "/glew-{major}.{minor}.{patch}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/nigels-com/glew/releases/download"
-            f"/glew-{self.version.major}.{self.version.minor}.{self.version.patch}"
-            f"/glew-{self.version.major}.{self.version.minor}.{self.version.patch}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/glew-{self.version.major}.{self.version.minor}.{self.version.patch}"
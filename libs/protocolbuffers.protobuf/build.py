@@ -13,6 +13,8 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = ("https://github.com/protocolbuffers/protobuf/archive/refs/tags/"
+                 "v{major}.{minor}.zip")
 
     # --- options ---
     option_Shared = Option(bool, False, "Build shared")
@@ -26,10 +28,7 @@ class Builder(BuilderBase):
 
     def build(self):
         # TODO: patch, rc対応してない
-        zipFile = self.download(
-            "https://github.com/protocolbuffers/protobuf/archive/refs/tags/"
-            f"v{self.version.major}.{self.version.minor}.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = f"src/protobuf-{self.version.major}.{self.version.minor}"
@@ -61,9 +60,7 @@ class Builder(BuilderBase):
             "-Dprotobuf_LOCAL_DEPENDENCIES_ONLY=ON",
         ]
 
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("Protobuf", "lib/cmake/protobuf")
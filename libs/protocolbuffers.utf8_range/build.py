@@ -8,14 +8,13 @@ class Builder(BuilderBase):
     }
 
     versions = list(signatures.keys())
+    sourceUrl = "https://github.com/protocolbuffers/utf8_range/archive/1d1ea7e3fedf482d4a12b473c1ed25fe0f371a45.zip"
 
     # --- deps ---
     dep_abseil = Dependency("abseil.abseil-cpp")
 
     def build(self):
-        zipFile = self.download(
-            "https://github.com/protocolbuffers/utf8_range/archive/1d1ea7e3fedf482d4a12b473c1ed25fe0f371a45.zip",
-            Builder.signatures[self.version])
+        zipFile = self.downloadSource()
         self.unzip(zipFile, "src")
 
         srcPath = "src/utf8_range-1d1ea7e3fedf482d4a12b473c1ed25fe0f371a45"
@@ -25,9 +24,7 @@ class Builder(BuilderBase):
             "-Dutf8_range_ENABLE_INSTALL=1",
             "-Dutf8_range_ENABLE_TESTS=0",
         ]
-        self.cmakeConfigure(srcPath, "build", configArgs)
-        self.cmakeBuildAndInstall("build", "Debug")
-        self.cmakeBuildAndInstall("build", "Release")
+        self.executeBuildAndInstall(srcPath, configArgs)
 
     def export(self, toolchain):
         toolchain.setDir("utf8_range")
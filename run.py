@@ -1,7 +1,7 @@
 import os
 import json
 import distbuilder
-from typing import List, Dict
+from typing import List, Optional, Set
 
 
 def main(*libraryNames: str):
@@ -25,17 +25,56 @@ def main(*libraryNames: str):
             builder.build()
 
 
-class _DependencyNode:
-    def __init__(self, builder: distbuilder.BuilderBase):
-        self.builder = builder
-        self.libraryName = builder.libraryName
-        self.used = False  # 依存の依存で実際に使われているか
-        self.dirty = True  # ステートの更新が必要か
-        self.availableVersions = builder.availableVersions
-        self.flatten = False
+def _solve(solverCls, jdict: dict, globalOpt: distbuilder.GlobalOptions, *args) -> distbuilder.VersionSolver:
+    resolver = solverCls(lambda libraryName: distbuilder.searchBuilderAndPath(libraryName)[0](jdict, globalOpt), *args)
+    for lib in jdict.keys():
+        resolver.addRoot(lib)
+    resolver.solve()
+    if resolver.learned:
+        print(f"[distbuilder] Resolved with {len(resolver.learned)} backtracks.")
+
+    # 使用されていない物を削除しつつ, Dependency に builder をセットする
+    # 使っていない dependency には Empty を入れる.
+    from distbuilder.builder import EmptyBuilder
+    resolver.bindBuilders(lambda: EmptyBuilder(jdict, globalOpt))
+    return resolver
 
 
-def configure(depFilepath: str, buildDir: str, globalOpt: distbuilder.GlobalOptions):
+def _chooseCheapest(newest: distbuilder.VersionSolver, jdict: dict,
+                    globalOpt: distbuilder.GlobalOptions) -> distbuilder.VersionSolver:
+    """ 最新の version を選んだ解と, ビルド済みのものを優先した解のうち, ビルド時間の推定が短い方を返す.
+
+    2 つの解を比べるだけの heuristic で, ビルド時間が最小になる組み合わせを探すわけではない.
+    """
+    from distbuilder.artifacts import formatDuration
+    pref = distbuilder.Preference.get()
+    artifacts = distbuilder.ArtifactIndex.fromPreference()
+    times = distbuilder.BuildTimes()
+    cached = _solve(distbuilder.CacheAwareSolver, jdict, globalOpt, artifacts)
+
+    plans = list()
+    for name, resolver in (("newest", newest), ("cached", cached)):
+        costs = distbuilder.estimateBuildCost([node.builder for node in resolver.buildOrder()],
+                                              artifacts, times, pref.defaultBuildTime)
+        plans.append((sum(cost.seconds for cost in costs), name, resolver, costs))
+        builds = sum(1 for cost in costs if cost.state == "build")
+        print(f"[distbuilder] Policy {name}: {builds} builds, ~{formatDuration(plans[-1][0])}")
+    # 同じなら新しい version を使う.
+    total, name, resolver, costs = min(plans, key=lambda plan: plan[0])
+    newestVersions = {cost.libraryName: cost.version for cost in plans[0][3]}
+
+    print(f"[distbuilder] Use policy {name}. (~{formatDuration(total)})")
+    for cost in costs:
+        estimate = formatDuration(cost.seconds) + ("" if cost.recorded else " (default)")
+        newestVersion = newestVersions.get(cost.libraryName)
+        note = f" (newest: {newestVersion})" if newestVersion is not None and newestVersion != cost.version else ""
+        print(f"    {cost.libraryName:<40} {str(cost.version) + note:<28} {cost.hash[:8]}  "
+              f"{cost.state:<9} {estimate}")
+    return resolver
+
+
+def configure(depFilepath: str, buildDir: str, globalOpt: distbuilder.GlobalOptions, *,
+              policy: Optional[str] = None):
     with open(depFilepath, mode="r", encoding="utf-8") as fp:
         jdict = json.load(fp)
 
@@ -51,93 +90,21 @@ def configure(depFilepath: str, buildDir: str, globalOpt: distbuilder.GlobalOpti
     参照カウントか参照フラグも用意して, 最終的に使われたかどうかを調べるべきか.
     """
 
-    # flatten libs
-    roots: List[_DependencyNode] = list()
-    depNodes: Dict[str, _DependencyNode] = dict()
-
-    for lib, info in jdict.items():
-        builderCls, _ = distbuilder.searchBuilderAndPath(lib)
-        builder = builderCls(jdict, globalOpt)
-        node = _DependencyNode(builder)
-        roots.append(node)
-        depNodes[builder.libraryName] = node
-
-    def _traverse(node: _DependencyNode):
-        # 今の options で必要な dependencies を列挙する.
-        if node.dirty is True:
-            node.dirty = False
-            for dep in node.builder.dependencies:
-                if not dep.isRequired(node.builder):
-                    continue
-                depNode = None
-                if dep.libraryName not in depNodes:
-                    builderCls = dep.searchBuilderClass()
-                    builder = builderCls(jdict, globalOpt)
-                    depNode = _DependencyNode(builder)
-                    depNodes[dep.libraryName] = depNode
-                else:
-                    depNode = depNodes[dep.libraryName]
-
-                # この depNode に対して, オプションの強制はあるか？
-                overrideOptions = dep.overrideOptions
-                if overrideOptions:
-                    for option in depNode.builder.options:
-                        if option.key in overrideOptions:
-                            if option.hasValue() and option.value != overrideOptions[option.key]:
-                                raise distbuilder.BuildError("Option value is conflict!!")
-                            else:
-                                option.setValue(overrideOptions[option.key])
-                                depNode.dirty = True
-
-                # この depNode に対して version の制約はあるか？
-                newAvailableVersions = set()
-                for aver in depNode.availableVersions:
-                    if dep.isSuitableVersion(aver):
-                        newAvailableVersions.add(aver)
-                depNode.availableVersions = newAvailableVersions
-                if len(depNode.availableVersions) == 0:
-                    raise distbuilder.BuildError("No available version.")
-
-                # 再帰呼び出し
-                _traverse(depNode)
-
-    for node in roots:
-        _traverse(node)
-
-    # 使用されているかチェック
-    # 同時にバージョンも決定
-    def _markAsUsedAndDesideVersion(node: _DependencyNode):
-        node.used = True
-
-        version = sorted(node.availableVersions, reverse=True)[0]
-        node.builder.setVersion(version)
-
-        for dep in node.builder.dependencies:
-            if not dep.isRequired(node.builder):
-                continue
-            _markAsUsedAndDesideVersion(depNodes[dep.libraryName])
-
-    for node in roots:
-        _markAsUsedAndDesideVersion(node)
-
-    # 使用されていない物を削除しつつ, Dependency に builder をセットする
-    def _setBuilder(node: _DependencyNode):
-        for dep in node.builder.dependencies:
-            depNode = depNodes.get(dep.libraryName)
-            if depNode is not None and depNode.used is True:
-                dep._builder = depNode.builder
-                _setBuilder(depNode)
-            else:
-                # 使っていない dependency には Empty を入れる.
-                from distbuilder.builder import EmptyBuilder
-                dep._builder = EmptyBuilder(jdict, globalOpt)
-
-    for node in roots:
-        _setBuilder(node)
+    # 依存を解決し, 使用されているかと version を決める.
+    # 制約を満たせない選択をした場合は, 原因になった選択まで戻って選び直す.
+    if policy is None:
+        policy = distbuilder.Preference.get().resolvePolicy
+    if policy not in ("newest", "cached"):
+        raise distbuilder.BuildError(f"Unknown resolve policy. {policy}")
+    resolver = _solve(distbuilder.VersionSolver, jdict, globalOpt)
+    if policy == "cached":
+        resolver = _chooseCheapest(resolver, jdict, globalOpt)
+    roots = resolver.roots
+    depNodes = resolver.nodes
 
     # 全ての依存が決定したはず.
     # json に dump してみる
-    def _dump(j: dict, node: _DependencyNode):
+    def _dump(j: dict, node: distbuilder.DependencyNode):
         node.builder.updateHash()
         jj = dict(
             hash=node.builder.hash,
@@ -147,7 +114,7 @@ def configure(depFilepath: str, buildDir: str, globalOpt: distbuilder.GlobalOpti
         )
         for dep in node.builder.dependencies:
             depNode = depNodes.get(dep.libraryName)
-            if depNode is not None:
+            if depNode is not None and depNode.used is True:
                 _dump(jj["dependencies"], depNode)
             else:
                 jj["dependencies"][dep.libraryName] = "<Unused>"
@@ -166,13 +133,7 @@ def configure(depFilepath: str, buildDir: str, globalOpt: distbuilder.GlobalOpti
     jdeps = list()
     deps = list()
 
-    def _flatten(node: _DependencyNode):
-        if node.flatten is True:
-            return
-        for dep in node.builder.dependencies:
-            if dep.libraryName in depNodes:
-                _flatten(depNodes[dep.libraryName])
-
+    for node in resolver.buildOrder():
         node.builder.updateHash()
         conf = dict(
             libraryName=node.builder.libraryName,
@@ -183,10 +144,6 @@ def configure(depFilepath: str, buildDir: str, globalOpt: distbuilder.GlobalOpti
         )
         jdeps.append(conf)
         deps.append(node.builder)
-        node.flatten = True
-
-    for lib in roots:
-        _flatten(lib)
 
     # jdeps を json に書き出す.
     outDepsFilepath = os.path.join(buildDir, "deps.json")
@@ -216,42 +173,52 @@ def configure(depFilepath: str, buildDir: str, globalOpt: distbuilder.GlobalOpti
 
 
 # TODO: 依存ライブラリに要求するオプションの validation をしないといけない
-def build(buildDir: str, globalOpt: distbuilder.GlobalOptions):
-    depsFilepath = os.path.join(buildDir, "deps.json")
-    with open(depsFilepath, mode="r", encoding="utf-8") as fp:
-        jdeps = json.load(fp)
-
-    # jdeps は list なので, libraryName をキーにした dict に直す
-    jdict = {j["libraryName"]: j for j in jdeps}
-
+def build(buildDir: str, globalOpt: distbuilder.GlobalOptions, *,
+          jobs: int = 1, keepGoing: bool = False, parallel: Optional[int] = None, downloadJobs: int = 4):
     # 一旦先に全ての builder を作る.
-    deps = dict()
-    for lib in jdeps:
-        builderCls, path = distbuilder.searchBuilderAndPath(lib["libraryName"])
-        builder: distbuilder.BuilderBase = builderCls(jdict, globalOpt)
-        deps[builder.libraryName] = builder
-
-        for dep in builder.dependencies:
-            if dep.isRequired(builder):
-                # かならず依存先のライブラリは deps に居るはず.
-                depBuilder = deps[dep.libraryName]
-                dep._builder = depBuilder
-            else:
-                from distbuilder.builder import EmptyBuilder
-                dep._builder = EmptyBuilder(jdict, globalOpt)
-
-        assert builder.isResolved()
-        builder.updateHash()
-        if builder.hash != lib["hash"]:
-            print(builder.libraryName, builder.hash, lib["hash"])
-            print(builder.hashData)
-            raise distbuilder.BuildError("Invalid hash.")
-
-        # info.json, toolchain.cmake が作られてしまうので 2以下
-        if os.path.exists(builder.installDir) is False or len(os.listdir(builder.installDir)) <= 2:
-            builder._executeBuildSequence()
-        else:
-            builder.log("Build skip.")
+    deps = distbuilder.scheduler.loadBuilders(buildDir, globalOpt)
+
+    # 依存先がビルド済みのものから並列にビルドする.
+    scheduler = distbuilder.BuildScheduler(buildDir, globalOpt, deps,
+                                           jobs=jobs, keepGoing=keepGoing, parallel=parallel,
+                                           downloadJobs=downloadJobs)
+    scheduler.run()
+
+    pref = distbuilder.Preference.get()
+    if pref.blobAutoGc and pref.blobMaxSize is not None:
+        gc([buildDir])
+
+
+def _pinnedSignatures(buildDirs: List[str]) -> Set[str]:
+    # deps.json で使われているソースアーカイブは消さない.
+    signatures = set()
+    for buildDir in buildDirs:
+        depsFilepath = os.path.join(buildDir, "deps.json")
+        if not os.path.exists(depsFilepath):
+            print(f"[distbuilder] deps.json is not found. {depsFilepath}")
+            continue
+        with open(depsFilepath, mode="r", encoding="utf-8") as fp:
+            jdeps = json.load(fp)
+        for lib in jdeps:
+            builderCls, _ = distbuilder.searchBuilderAndPath(lib["libraryName"])
+            source = builderCls.getSource(builderCls.generateVersion(lib["version"]))
+            if source is not None:
+                signatures.add(source[1])
+    return signatures
+
+
+def gc(buildDirs: List[str], *, maxSize: Optional[int] = None, graceHours: Optional[float] = None,
+       dryRun: bool = False):
+    pref = distbuilder.Preference.get()
+    if maxSize is None:
+        maxSize = pref.blobMaxSize
+    if maxSize is None:
+        raise distbuilder.BuildError("Blob size cap is not specified. ([blob] maxSize in preference or --maxSize)")
+    if graceHours is None:
+        # blob store は他の build root と共有されるので, その deps.json は分からない. 最近使われたものは残す.
+        graceHours = pref.blobGcGraceHours
+    distbuilder.blob.collectGarbage(maxSize, _pinnedSignatures(buildDirs), gracePeriod=graceHours * 3600,
+                                    dryRun=dryRun)
 
 
 def testBuild(args):
@@ -263,6 +230,9 @@ def testBuild(args):
         forceDownload=args.forceDownload,
         unzipAndOverwrite=not args.no_unzipOverwrite,
         ignoreScriptVersion=args.ignoreScriptVersion,
+        parallelConfigs=args.parallelConfigs,
+        paranoid=args.paranoid,
+        incrementalUnzip=args.incrementalUnzip,
         configs=args.config)
 
     builderCls, path = distbuilder.searchBuilderAndPath(args.libraryName)
@@ -291,7 +261,8 @@ def testBuild(args):
             }, fp)
         # TODO:
         configure(filepath, rootdir, configureGlobalOpt)
-        build(rootdir, buildGlobalOpt)
+        build(rootdir, buildGlobalOpt, jobs=args.jobs, keepGoing=args.keepGoing,
+              parallel=args.parallel, downloadJobs=args.downloadJobs)
 
 
 if __name__ == "__main__":
@@ -301,7 +272,7 @@ if __name__ == "__main__":
     # ビルド要求の py ファイルかなにかを要求する
 
     def _configure(args):
-        configure(args.filepath, args.buildDir, distbuilder.GlobalOptions())
+        configure(args.filepath, args.buildDir, distbuilder.GlobalOptions(), policy=args.policy)
 
     def _build(args):
         globalOpt = distbuilder.GlobalOptions(
@@ -309,14 +280,27 @@ if __name__ == "__main__":
             forceDownload=args.forceDownload,
             createDirectory=True,
             unzipAndOverwrite=not args.no_unzipOverwrite,
+            parallelConfigs=args.parallelConfigs,
+            paranoid=args.paranoid,
+            incrementalUnzip=args.incrementalUnzip,
             configs=args.config)
-        build(args.buildDir, globalOpt)
+        build(args.buildDir, globalOpt, jobs=args.jobs, keepGoing=args.keepGoing,
+              parallel=args.parallel, downloadJobs=args.downloadJobs)
+
+    def _gc(args):
+        maxSize = distbuilder.blob.parseSize(args.maxSize) if args.maxSize is not None else None
+        gc(args.buildDir, maxSize=maxSize, graceHours=args.graceHours, dryRun=args.dryRun)
 
     parser.add_argument("--preference", type=str, help="Path to preference file.", default=None)
     subp = parser.add_subparsers()
     subp_configure = subp.add_parser("configure", help="Configure dependencies")
     subp_configure.add_argument("-B", "--buildDir", type=str, help="Path to build directory", required=True)
     subp_configure.add_argument("filepath", type=str, help="Path to deps json")
+    subp_configure.add_argument("--policy", type=str, choices=["newest", "cached"], default=None,
+                                help="Version selection. cached is a heuristic: it also solves preferring "
+                                     "versions that are already built (installed or in artifact caches) and "
+                                     "keeps whichever of the two plans has the shorter estimated build time. "
+                                     "Other combinations are not searched. (default: [resolve] policy)")
     subp_configure.set_defaults(handler=_configure)
     subp_build = subp.add_parser("build", help="Build dependencies")
     subp_build.add_argument("-B", "--buildDir", type=str, required=True, help="Path to build directory.")
@@ -324,7 +308,25 @@ if __name__ == "__main__":
     subp_build.add_argument("--forceDownload", action="store_true", help="Force (re)download.")
     subp_build.add_argument("--no-unzipOverwrite", action="store_true", default=False, help="NO unzip overwrite.")
     subp_build.add_argument("--config", nargs="+", type=str, choices=["Release", "Debug"], default=("Debug", "Release"))
+    subp_build.add_argument("--paranoid", action="store_true", help="Always rehash cached source archives.")
+    subp_build.add_argument("--parallelConfigs", action="store_true", help="Build Debug and Release in parallel.")
+    subp_build.add_argument("--incrementalUnzip", action="store_true",
+                            help="Rewrite only changed files on unzip and keep mtimes of the others.")
+    subp_build.add_argument("-j", "--jobs", type=int, default=1, help="Number of libraries to build concurrently.")
+    subp_build.add_argument("--keepGoing", action="store_true", help="Keep building independent libraries on failure.")
+    subp_build.add_argument("--downloadJobs", type=int, default=4,
+                            help="Number of source archives to prefetch concurrently. 0 disables prefetch.")
+    subp_build.add_argument("--parallel", type=int, default=None,
+                            help="Total number of compile jobs shared by all libraries.")
     subp_build.set_defaults(handler=_build)
+    subp_gc = subp.add_parser("gc", help="Evict least recently used source archives.")
+    subp_gc.add_argument("-B", "--buildDir", type=str, nargs="*", default=list(),
+                         help="Build directories whose deps.json archives are kept.")
+    subp_gc.add_argument("--maxSize", type=str, default=None, help="Size cap. (e.g. 20GB)")
+    subp_gc.add_argument("--graceHours", type=float, default=None,
+                         help="Keep archives accessed within this many hours. (default: [blob] gcGraceHours)")
+    subp_gc.add_argument("--dryRun", action="store_true", help="Only show archives to evict.")
+    subp_gc.set_defaults(handler=_gc)
     subp_test = subp.add_parser("test", help="Building test.")
     subp_test.add_argument("libraryName", type=str)
     subp_test.add_argument("--cleanAll", action="store_true", help="Clear build cache (including all dependencies).")
@@ -333,6 +335,16 @@ if __name__ == "__main__":
     subp_test.add_argument("--no-unzipOverwrite", action="store_true", default=False, help="NO unzip overwrite.")
     subp_test.add_argument("--ignoreScriptVersion", action="store_true", default=False, help="Ignore script version")
     subp_test.add_argument("--config", nargs="+", type=str, choices=["Release", "Debug"], default=("Debug", "Release"))
+    subp_test.add_argument("--paranoid", action="store_true", help="Always rehash cached source archives.")
+    subp_test.add_argument("--parallelConfigs", action="store_true", help="Build Debug and Release in parallel.")
+    subp_test.add_argument("--incrementalUnzip", action="store_true",
+                           help="Rewrite only changed files on unzip and keep mtimes of the others.")
+    subp_test.add_argument("-j", "--jobs", type=int, default=1, help="Number of libraries to build concurrently.")
+    subp_test.add_argument("--keepGoing", action="store_true", help="Keep building independent libraries on failure.")
+    subp_test.add_argument("--downloadJobs", type=int, default=4,
+                           help="Number of source archives to prefetch concurrently. 0 disables prefetch.")
+    subp_test.add_argument("--parallel", type=int, default=None,
+                           help="Total number of compile jobs shared by all libraries.")
     subp_test.set_defaults(handler=testBuild)
 
     args = parser.parse_args()